@@ -3,17 +3,23 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-import time
 import json
-import io
-from typing import List, Dict, Any
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple
 
 from core.tor_connector import TorConnector
-from core.analysis_tool import TorAnalyzer
-from core.deanonymizer import TorDeanonymizer
+from core.blob_store import ContentStore
 from core.export_utils import ExportUtils
+from core.geolocation import GeolocationAnalyzer
+from core.job_runner import JobRunner
+from core.job_store import JobStore
+from core.parse_pool import parse_pool_from_env
+from core.result_store import ResultStore
+from core.summary_aggregator import SummaryAggregator
 from utils.validators import URLValidator
-from utils.progress_tracker import ProgressTracker
 
 # Page configuration
 st.set_page_config(
@@ -244,13 +250,55 @@ st.markdown("""
 
 def init_session_state():
     """Initialize session state variables"""
-    if 'analysis_results' not in st.session_state:
-        st.session_state.analysis_results = []
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if 'job_ids' not in st.session_state:
+        st.session_state.job_ids = []
+    if 'finished_jobs' not in st.session_state:
+        st.session_state.finished_jobs = set()
     if 'search_history' not in st.session_state:
         st.session_state.search_history = []
     if 'tor_connected' not in st.session_state:
         st.session_state.tor_connected = False
 
+@st.cache_resource
+def get_geolocation_analyzer() -> GeolocationAnalyzer:
+    """Shared geolocation analyzer for dashboard aggregations"""
+    return GeolocationAnalyzer()
+
+@st.cache_resource
+def get_content_store() -> ContentStore:
+    """Shared on-disk store for page bodies, so session results only keep the hash"""
+    return ContentStore(os.getenv('CONTENT_STORE_PATH', 'data/blobs'))
+
+@st.cache_resource
+def get_result_store() -> ResultStore:
+    """Shared persistent result store backing the Results and Export tabs"""
+    return ResultStore(os.getenv('RESULT_STORE_PATH', 'data/results.db'))
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    """Background analysis workers shared by every session, resuming unfinished jobs"""
+    job_runner = JobRunner(get_result_store(),
+                           job_store=JobStore(os.getenv('JOB_STORE_PATH', 'data/jobs.db')),
+                           content_store=get_content_store(),
+                           max_workers=int(os.getenv('ANALYSIS_WORKERS', '4')),
+                           url_workers=int(os.getenv('ANALYSIS_URL_WORKERS', '8')),
+                           parse_pool=parse_pool_from_env(),
+                           profile_dir=os.getenv('PROFILE_DIR', 'data/profiles'))
+    job_runner.resume_incomplete()
+    return job_runner
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def summarize_results(version: Tuple[int, int], filters: Tuple[Tuple[str, Any], ...] = ()) -> SummaryAggregator:
+    """Store summary for the filters, recomputed only when the store's version changes"""
+    return get_result_store().summarize(**dict(filters))
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def summarize_locations(version: Tuple[int, int], filters: Tuple[Tuple[str, Any], ...] = ()) -> Dict[str, Any]:
+    """Location overview for the filters, recomputed only when the store's version changes"""
+    return get_geolocation_analyzer().summarize_analyses(get_result_store().iter_results(**dict(filters)))
+
 def load_sample_data():
     """Load sample URLs for demonstration"""
     try:
@@ -303,6 +351,7 @@ def main():
             deep_analysis = st.checkbox("🔬 Deep OSINT Analysis", value=True, help="Comprehensive analysis using multiple OSINT sources")
             metadata_extraction = st.checkbox("📋 Metadata Extraction", value=True, help="Extract technical details and fingerprints")
             cross_reference = st.checkbox("🔄 Cross-reference Databases", value=True, help="Check against threat intelligence databases")
+            profile_run = st.checkbox("⏱️ Profile Run", value=False, help="Write per-stage CPU and allocation flamegraph profiles (slower)")
         
         st.markdown("---")
         
@@ -436,7 +485,10 @@ def main():
                         if not st.session_state.tor_connected:
                             st.error("🔒 Please establish Tor connection first!")
                         else:
-                            perform_analysis(valid_urls, deep_analysis, metadata_extraction, cross_reference)
+                            perform_analysis(valid_urls, deep_analysis, metadata_extraction, cross_reference,
+                                             profile=profile_run)
+        
+        display_jobs()
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -455,83 +507,83 @@ def main():
         display_help()
         st.markdown('</div>', unsafe_allow_html=True)
 
-def perform_analysis(urls: List[str], deep_analysis: bool, metadata_extraction: bool, cross_reference: bool):
-    """Perform the actual analysis of URLs"""
-    st.subheader("🔍 Analysis in Progress")
-    
-    # Initialize components
-    analyzer = TorAnalyzer()
-    deanonymizer = TorDeanonymizer()
-    progress_tracker = ProgressTracker()
-    
-    # Progress tracking
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    results = []
-    
-    for i, url in enumerate(urls):
-        # Update progress
-        progress = (i + 1) / len(urls)
-        progress_bar.progress(progress)
-        status_text.text(f"Analyzing {i+1}/{len(urls)}: {url}")
-        
-        try:
-            # Basic analysis
-            basic_result = analyzer.analyze_url(url)
-            
-            # Deep analysis if enabled
-            if deep_analysis:
-                osint_result = deanonymizer.perform_osint_analysis(url, basic_result)
-                basic_result.update(osint_result)
-            
-            # Metadata extraction
-            if metadata_extraction:
-                metadata = analyzer.extract_metadata(url)
-                basic_result['metadata'] = metadata
-            
-            # Cross-reference databases
-            if cross_reference:
-                cross_ref_result = deanonymizer.cross_reference_databases(basic_result)
-                basic_result['cross_references'] = cross_ref_result
-            
-            # Add timestamp and URL
-            basic_result['url'] = url
-            basic_result['timestamp'] = datetime.now().isoformat()
-            basic_result['analysis_id'] = f"analysis_{int(time.time())}_{i}"
-            
-            results.append(basic_result)
-            
-            # Add to search history
-            if url not in st.session_state.search_history:
-                st.session_state.search_history.append(url)
-            
-        except Exception as e:
-            st.error(f"Error analyzing {url}: {str(e)}")
-            results.append({
-                'url': url,
-                'error': str(e),
-                'timestamp': datetime.now().isoformat(),
-                'analysis_id': f"error_{int(time.time())}_{i}"
-            })
-    
-    # Store results
-    st.session_state.analysis_results.extend(results)
-    
-    # Complete
-    progress_bar.progress(1.0)
-    status_text.text("✅ Analysis completed!")
-    
-    st.success(f"Successfully analyzed {len(results)} URLs. Check the Results tab.")
-    time.sleep(2)
-    st.rerun()
+def perform_analysis(urls: List[str], deep_analysis: bool, metadata_extraction: bool, cross_reference: bool,
+                     profile: bool = False):
+    """Submit URLs to the background job runner"""
+    options = {
+        'deep_analysis': deep_analysis,
+        'metadata_extraction': metadata_extraction,
+        'cross_reference': cross_reference
+    }
+    if profile:
+        options['profile'] = True
+    
+    job_runner = get_job_runner()
+    job_id = job_runner.submit(urls, options, owner=st.session_state.session_id)
+    st.session_state.job_ids.append(job_id)
+    
+    # Add to search history
+    for url in urls:
+        if url not in st.session_state.search_history:
+            st.session_state.search_history.append(url)
+    
+    st.success(f"Queued {len(urls)} URLs for analysis. Progress is shown below and results appear in the Results tab.")
+    if profile:
+        st.info(f"Profiles will be written to {os.path.join(job_runner.profile_dir, job_id)}")
+
+@st.fragment(run_every=2)
+def display_jobs():
+    """Poll this session's background jobs without rerunning the whole page
+    
+    The job runner is shared by every session, so only jobs this session
+    submitted are listed (and can be cancelled or resumed).
+    """
+    job_runner = get_job_runner()
+    statuses = [status for status in job_runner.list_jobs(owner=st.session_state.session_id)
+                if status['job_id'] in st.session_state.job_ids]
+    if not statuses:
+        return
+    
+    st.markdown("---")
+    st.subheader("🔍 Analysis Jobs")
+    
+    newly_finished = False
+    for status in statuses:
+        job_id = status['job_id']
+        progress_bar_value = min(status['progress_percentage'] / 100, 1.0)
+        st.progress(progress_bar_value, text=f"{status['state'].title()} · {status['status_message']}")
+        
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            details = f"{status['completed_items']}/{status['total_items']} URLs · " \
+                      f"✅ {status['success_count']} · ❌ {status['error_count']}"
+            if status.get('estimated_remaining_seconds') and status['is_active']:
+                details += f" · ETA {status['estimated_completion_time']}"
+            st.caption(details)
+        with col2:
+            if status['state'] in ('queued', 'running'):
+                if st.button("⏹️ Cancel", key=f"cancel_{job_id}"):
+                    job_runner.cancel(job_id)
+            elif status['state'] in ('cancelled', 'failed'):
+                if st.button("▶️ Resume", key=f"resume_{job_id}"):
+                    job_runner.resume(job_id)
+        
+        if status['finished_at'] and job_id not in st.session_state.finished_jobs:
+            st.session_state.finished_jobs.add(job_id)
+            newly_finished = True
+    
+    if newly_finished:
+        # Refresh the Results and Export tabs with the new results
+        st.rerun()
 
 def display_results():
     """Display analysis results with enhanced styling"""
     st.markdown("### 📊 Analysis Results")
     st.markdown("View comprehensive analysis results and insights")
     
-    if not st.session_state.analysis_results:
+    result_store = get_result_store()
+    
+    if not result_store.count():
         st.markdown("""
         <div style="text-align: center; padding: 3rem; background: rgba(255, 255, 255, 0.05); border-radius: 15px; border: 2px dashed rgba(255, 255, 255, 0.2);">
             <h3>🔍 No Results Yet</h3>
@@ -541,10 +593,30 @@ def display_results():
         """, unsafe_allow_html=True)
         return
     
-    # Enhanced Results overview with modern styling
-    total_results = len(st.session_state.analysis_results)
-    successful_results = len([r for r in st.session_state.analysis_results if 'error' not in r])
-    error_results = total_results - successful_results
+    # Filters are applied in SQL; only the current page is loaded
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        url_filter = st.text_input("Filter by URL:", key="results_url_filter")
+    with col2:
+        risk_filter = st.multiselect("Risk level:", result_store.risk_levels(), key="results_risk_filter")
+    with col3:
+        identifier_filter = st.text_input("Identifier:", key="results_identifier_filter",
+                                          help="Email, crypto address, onion link, IP or fingerprint")
+    
+    filters = {
+        'url_contains': url_filter or None,
+        'risk_level': tuple(risk_filter) or None,
+        'identifier': identifier_filter.strip() or None
+    }
+    # Aggregates are cached per store version, so reruns without new results skip the scans
+    version = result_store.version()
+    filter_key = tuple(filters.items())
+    
+    # Enhanced Results overview with modern styling (one aggregation pass shared by all widgets)
+    summary = summarize_results(version, filter_key)
+    total_results = summary.total_analyses
+    successful_results = summary.successful_analyses
+    error_results = summary.failed_analyses
     
     st.markdown("#### 📈 Overview")
     col1, col2, col3, col4 = st.columns(4)
@@ -576,19 +648,17 @@ def display_results():
         st.markdown("#### 📊 Risk Assessment Overview")
         
         # Create enhanced risk assessment chart
-        risk_levels = []
-        for result in st.session_state.analysis_results:
-            if 'error' not in result and 'risk_level' in result:
-                risk_levels.append(result['risk_level'])
+        risk_counts = pd.Series(summary.risk_distribution).sort_values(ascending=False)
         
-        if risk_levels:
+        if not risk_counts.empty:
             col1, col2 = st.columns([2, 1])
             
             with col1:
-                risk_df = pd.DataFrame({'Risk Level': risk_levels})
-                fig = px.histogram(
+                risk_df = pd.DataFrame({'Risk Level': risk_counts.index, 'Count': risk_counts.values})
+                fig = px.bar(
                     risk_df, 
                     x='Risk Level', 
+                    y='Count',
                     title="Risk Level Distribution",
                     color_discrete_sequence=['#00d4aa', '#f39c12', '#e74c3c']
                 )
@@ -601,19 +671,53 @@ def display_results():
             
             with col2:
                 st.markdown("##### 🏷️ Risk Categories")
-                risk_counts = pd.Series(risk_levels).value_counts()
                 for risk, count in risk_counts.items():
                     risk_class = f"risk-{risk.lower()}" if risk.lower() in ['low', 'medium', 'high'] else "risk-medium"
                     st.markdown(f'<span class="{risk_class}">{risk.title()}: {count}</span>', unsafe_allow_html=True)
                     st.markdown("<br>", unsafe_allow_html=True)
+        
+        # Location overview aggregated across every analysis in one pass
+        location_overview = summarize_locations(version, filter_key)
+        if location_overview['country_counts']:
+            st.markdown("#### 🌍 Location Overview")
+            col1, col2 = st.columns([2, 1])
+            
+            with col1:
+                country_df = pd.DataFrame({
+                    'Country': list(location_overview['country_counts'].keys()),
+                    'IPs': list(location_overview['country_counts'].values())
+                })
+                fig = px.bar(country_df, x='Country', y='IPs', title="IPs per Country")
+                fig.update_layout(
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    font_color='white'
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            
+            with col2:
+                st.metric("🌐 IPs Geolocated", location_overview['total_ips_analyzed'])
+                most_likely = location_overview.get('most_likely_location') or {}
+                if most_likely:
+                    st.metric("📍 Most Likely Country", most_likely['country'])
     
     # Enhanced Detailed results table
     st.markdown("---")
     st.markdown("#### 📋 Detailed Results")
     
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        page_size = st.selectbox("Rows per page:", [25, 50, 100, 250], key="results_page_size")
+    page_count = max(1, -(-total_results // page_size))
+    with col2:
+        page = st.number_input(f"Page (of {page_count}):", min_value=1, max_value=page_count, value=1,
+                               key="results_page")
+    
+    page_results = result_store.query(limit=page_size, offset=(page - 1) * page_size, **filters)
+    
     # Create enhanced results dataframe with geolocation info
     results_data = []
-    for result in st.session_state.analysis_results:
+    for result in page_results:
         # Extract geolocation information
         location_info = "Unknown"
         ip_info = "Not resolved"
@@ -662,12 +766,12 @@ def display_results():
         st.subheader("Detailed View")
         selected_analysis = st.selectbox(
             "Select analysis for detailed view:",
-            options=range(len(st.session_state.analysis_results)),
-            format_func=lambda x: f"{st.session_state.analysis_results[x]['url']} - {st.session_state.analysis_results[x].get('timestamp', 'Unknown')}"
+            options=range(len(page_results)),
+            format_func=lambda x: f"{page_results[x]['url']} - {page_results[x].get('timestamp', 'Unknown')}"
         )
         
         if selected_analysis is not None:
-            display_detailed_result(st.session_state.analysis_results[selected_analysis])
+            display_detailed_result(page_results[selected_analysis])
 
 def display_detailed_result(result: Dict[str, Any]):
     """Display detailed result for a single analysis"""
@@ -718,12 +822,59 @@ def display_detailed_result(result: Dict[str, Any]):
         st.subheader("📋 Metadata")
         st.json(result['metadata'])
 
+@contextmanager
+def export_file():
+    """Path of a temporary file for an export, removed when the block ends
+
+    Write the export to the path, then pass `open(path, 'rb')` to
+    st.download_button, which reads it before the block ends.
+    """
+    fd, path = tempfile.mkstemp(prefix='tor_export_')
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        os.remove(path)
+
+def discard_pdf_export():
+    """Drop this session's rendered PDF report, if any"""
+    export = st.session_state.pop('pdf_export', None)
+    if export:
+        # Still rendering: remove the file once the worker is done with it
+        export['future'].add_done_callback(lambda _, path=export['path']: os.path.exists(path) and os.remove(path))
+
+@st.fragment(run_every=2)
+def display_pdf_export():
+    """Offer the PDF report rendered by ExportUtils.submit_pdf once it is ready"""
+    export = st.session_state.get('pdf_export')
+    if not export:
+        return
+    
+    future = export['future']
+    if not future.done():
+        st.info("⏳ Rendering PDF report...")
+        return
+    if future.exception():
+        st.error(f"❌ PDF report failed: {future.exception()}")
+        return
+    
+    with open(export['path'], 'rb') as pdf_file:
+        st.download_button(
+            label=f"⬇️ Download PDF ({future.result()} pages)",
+            data=pdf_file,
+            file_name=f"tor_analysis_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+            mime="application/pdf",
+            use_container_width=True
+        )
+
 def display_export_options():
     """Display enhanced export options"""
     st.markdown("### 📥 Export Results")
     st.markdown("Download your analysis results in multiple formats")
     
-    if not st.session_state.analysis_results:
+    result_store = get_result_store()
+    
+    if not result_store.count():
         st.markdown("""
         <div style="text-align: center; padding: 3rem; background: rgba(255, 255, 255, 0.05); border-radius: 15px; border: 2px dashed rgba(255, 255, 255, 0.2);">
             <h3>📄 No Data to Export</h3>
@@ -738,8 +889,11 @@ def display_export_options():
     
     export_utils = ExportUtils()
     
+    # Aggregate once and reuse for the PDF executive summary and the summary CSV
+    summary = summarize_results(result_store.version())
+    
     # Enhanced export options with better styling
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         st.markdown('<div class="content-card hover-card" style="text-align: center; padding: 2rem;">', unsafe_allow_html=True)
@@ -747,14 +901,19 @@ def display_export_options():
         st.markdown("Spreadsheet format for data analysis")
         
         if st.button("📊 Generate CSV", key="csv_export", use_container_width=True):
-            csv_data = export_utils.to_csv(st.session_state.analysis_results)
-            st.download_button(
-                label="⬇️ Download CSV",
-                data=csv_data,
-                file_name=f"tor_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
+            # Two streaming passes over the store: one for the column set, one for the rows
+            with export_file() as path:
+                with open(path, 'w', encoding='utf-8', newline='') as text_file:
+                    export_utils.write_csv(result_store.iter_results(), text_file,
+                                           fieldnames=export_utils.csv_columns(result_store.iter_results()))
+                with open(path, 'rb') as csv_file:
+                    st.download_button(
+                        label="⬇️ Download CSV",
+                        data=csv_file,
+                        file_name=f"tor_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                        mime="text/csv",
+                        use_container_width=True
+                    )
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col2:
@@ -762,15 +921,21 @@ def display_export_options():
         st.markdown("#### 📄 JSON Export")
         st.markdown("Structured data for programming")
         
+        compact_json = st.checkbox("Compact (no indentation)", value=False, key="compact_json")
+        
         if st.button("📄 Generate JSON", key="json_export", use_container_width=True):
-            json_data = export_utils.to_json(st.session_state.analysis_results)
-            st.download_button(
-                label="⬇️ Download JSON",
-                data=json_data,
-                file_name=f"tor_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json",
-                use_container_width=True
-            )
+            # Stream the document to a temporary file instead of loading every result
+            with export_file() as path:
+                with open(path, 'wb') as binary_file:
+                    export_utils.write_json(result_store.iter_results(), binary_file, compact=compact_json)
+                with open(path, 'rb') as json_file:
+                    st.download_button(
+                        label="⬇️ Download JSON",
+                        data=json_file,
+                        file_name=f"tor_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                        mime="application/json",
+                        use_container_width=True
+                    )
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col3:
@@ -778,28 +943,116 @@ def display_export_options():
         st.markdown("#### 📑 PDF Report")
         st.markdown("Professional report format")
         
+        pdf_page_budget = st.number_input("Page budget (0 = unlimited)", min_value=0, value=0, step=50,
+                                          key="pdf_page_budget",
+                                          help="Results past this many pages are listed in summary form")
+        
         if st.button("📑 Generate PDF", key="pdf_export", use_container_width=True):
-            pdf_data = export_utils.to_pdf(st.session_state.analysis_results)
-            st.download_button(
-                label="⬇️ Download PDF",
-                data=pdf_data,
-                file_name=f"tor_analysis_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                mime="application/pdf",
-                use_container_width=True
-            )
+            # Large reports take a while to lay out: render in the background to a file
+            discard_pdf_export()
+            fd, path = tempfile.mkstemp(prefix='tor_report_', suffix='.pdf')
+            os.close(fd)
+            st.session_state.pdf_export = {
+                'path': path,
+                'future': export_utils.submit_pdf(result_store.iter_results(), path,
+                                                  page_budget=pdf_page_budget or None, summary=summary)
+            }
+        display_pdf_export()
         st.markdown('</div>', unsafe_allow_html=True)
     
+    with col4:
+        st.markdown('<div class="content-card hover-card" style="text-align: center; padding: 2rem;">', unsafe_allow_html=True)
+        st.markdown("#### 🧾 NDJSON Export")
+        st.markdown("One record per line for streaming")
+        
+        if st.button("🧾 Generate NDJSON", key="ndjson_export", use_container_width=True):
+            # Stream records to a temporary file instead of building one large string
+            with export_file() as path:
+                with open(path, 'w', encoding='utf-8') as text_file:
+                    export_utils.write_ndjson(result_store.iter_results(), text_file)
+                with open(path, 'rb') as ndjson_file:
+                    st.download_button(
+                        label="⬇️ Download NDJSON",
+                        data=ndjson_file,
+                        file_name=f"tor_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson",
+                        mime="application/x-ndjson",
+                        use_container_width=True
+                    )
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Summary statistics only
+    with st.expander("📈 Summary Statistics (CSV)", expanded=False):
+        summary_report = summary.to_report()
+        st.json(summary_report)
+        st.download_button(
+            label="⬇️ Download Summary CSV",
+            data=export_utils.export_summary_csv([], summary=summary_report),
+            file_name=f"tor_analysis_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv"
+        )
+    
+    # Compressed bundle with page bodies stored once
+    with st.expander("📦 Compressed Bundle (NDJSON + deduplicated pages)", expanded=False):
+        bundle_compression = st.radio("Compression:", ["gzip", "zstd"], horizontal=True, key="bundle_compression")
+        
+        if st.button("📦 Generate Bundle", key="bundle_export"):
+            try:
+                with export_file() as path:
+                    manifest = export_utils.write_bundle(result_store.iter_results(), path,
+                                                         compression=bundle_compression,
+                                                         content_store=get_content_store())
+                    st.caption(f"{manifest['total_analyses']} analyses, {manifest['blob_count']} unique pages, "
+                               f"{os.path.getsize(path) / 1024:.1f} KB compressed")
+                    extension = 'tar.gz' if bundle_compression == 'gzip' else 'tar.zst'
+                    with open(path, 'rb') as bundle_file:
+                        st.download_button(
+                            label="⬇️ Download Bundle",
+                            data=bundle_file,
+                            file_name=f"tor_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                            mime="application/octet-stream"
+                        )
+            except ImportError as e:
+                st.error(f"❌ {e}")
+    
+    # Columnar export for loading large result sets into pandas / DuckDB
+    with st.expander("🗃️ Columnar Export (Parquet / Arrow)", expanded=False):
+        columnar_format = st.radio("Format:", ["parquet", "arrow"], horizontal=True, key="columnar_format")
+        
+        if st.button("🗃️ Generate Columnar File", key="columnar_export"):
+            try:
+                with export_file() as path:
+                    export_utils.write_columnar(result_store.iter_results(), path, file_format=columnar_format)
+                    with open(path, 'rb') as columnar_file:
+                        st.download_button(
+                            label=f"⬇️ Download {columnar_format.title()}",
+                            data=columnar_file,
+                            file_name=f"tor_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{columnar_format}",
+                            mime="application/octet-stream"
+                        )
+            except ImportError as e:
+                st.error(f"❌ {e}")
+    
     # Enhanced clear results option
     st.markdown("---")
     st.markdown("#### 🗑️ Data Management")
     
     col1, col2 = st.columns([3, 1])
     with col1:
-        st.info("⚠️ This will permanently delete all analysis results and search history")
+        st.info("⚠️ This will permanently delete the results of this session's analyses and its search history")
     
     with col2:
         if st.button("🗑️ Clear All Data", type="secondary", key="clear_all_data"):
-            st.session_state.analysis_results = []
+            # The result store is shared by every session and the API service; only remove this session's jobs
+            job_runner = get_job_runner()
+            for job_id in st.session_state.job_ids:
+                job_runner.cancel(job_id)
+                job = job_runner.get_job(job_id)
+                if job is not None and job.future is not None:
+                    # Let in-flight URLs finish so none of their results land after the delete
+                    job.future.result()
+                result_store.delete_matching(job_id=job_id)
+            st.session_state.job_ids = []
+            st.session_state.finished_jobs = set()
             st.session_state.search_history = []
             st.success("✅ All data cleared successfully!")
             st.rerun()
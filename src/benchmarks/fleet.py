@@ -0,0 +1,248 @@
+import base64
+import hashlib
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils import serialization
+
+FAILURE_MODES = ('error', 'reset')
+
+# Clearnet geolocation provider the fleet answers for, like a warm provider would
+GEO_API_HOST = 'ip-api.com'
+
+
+@dataclass
+class SiteProfile:
+    """How every site in a MockOnionFleet behaves"""
+    latency: float = 0.05          # seconds before each response, like a Tor circuit round trip
+    jitter: float = 0.0            # extra random latency, uniform in [0, jitter)
+    body_size: int = 32 * 1024     # approximate bytes of the landing page
+    redirects: int = 0             # redirect hops before the landing page
+    failure_rate: float = 0.0      # share of requests that fail
+    failure_mode: str = 'error'    # 'error': 503 response, 'reset': connection dropped without a response
+
+
+def onion_hostname(seed: int, index: int) -> str:
+    """Deterministic v3-style onion hostname (56 base32 characters)"""
+    digest = hashlib.shake_256(f"{seed}:{index}".encode()).digest(35)
+    return base64.b32encode(digest).decode().lower() + '.onion'
+
+
+def geolocation(ip_address: str) -> Dict[str, Any]:
+    """Deterministic ip-api.com style answer for an IP address"""
+    digest = hashlib.sha1(ip_address.encode()).digest()
+    country, code = [('Germany', 'DE'), ('Canada', 'CA'), ('Netherlands', 'NL'), ('Sweden', 'SE')][digest[0] % 4]
+    return {
+        'status': 'success', 'query': ip_address, 'country': country, 'countryCode': code,
+        'regionName': 'Region', 'region': 'R', 'city': f"City {digest[1]}", 'zip': '00000',
+        'lat': digest[2] / 4 - 32, 'lon': digest[3] / 2 - 64, 'timezone': 'UTC',
+        'isp': 'Benchmark Hosting', 'org': 'Benchmark Hosting', 'as': f"AS{64512 + digest[4]}",
+        'proxy': False, 'hosting': True
+    }
+
+
+def build_page(hostname: str, neighbours: List[str], body_size: int) -> bytes:
+    """Landing page with the things the extractors look for, padded to about body_size bytes"""
+    name = hostname.split('.')[0][:10]
+    head = (
+        f"<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">"
+        f"<title>{name} market</title>"
+        f"<meta name=\"description\" content=\"Benchmark service {name}\">"
+        f"<meta name=\"keywords\" content=\"market,forum,{name}\">"
+        f"<meta name=\"generator\" content=\"WordPress 6.4\">"
+        f"<script src=\"/js/jquery-3.6.0.min.js\"></script></head><body>"
+        f"<h1>Welcome to {name}</h1>"
+        f"<form action=\"/login\" method=\"post\"><input type=\"text\" name=\"user\">"
+        f"<input type=\"password\" name=\"pass\"><input type=\"submit\"></form>"
+        f"<p>Contact admin@{name}.example or support@protonmail.com. "
+        f"Donations: bc1q{name}xy5yq8vk0a2ngkfjw4jl3sry6x0 or 1BoatSLRHtKNngkdXEeobR76b53LETtpyT.</p>"
+        f"<!-- build {hashlib.sha1(hostname.encode()).hexdigest()[:12]} -->"
+    )
+    links = ''.join(f"<li><a href=\"http://{neighbour}/\">Mirror {i}</a></li>"
+                    for i, neighbour in enumerate(neighbours))
+    head += f"<ul>{links}<li><a href=\"/about\">About</a></li><li><a href=\"/faq\">FAQ</a></li></ul>"
+    tail = "</body></html>"
+
+    parts = [head]
+    size = len(head) + len(tail)
+    index = 0
+    while size < body_size:
+        paragraph = (f"<div class=\"post\"><h2>Listing {index}</h2><p>Item {index} from {name} ships worldwide. "
+                     f"Escrow is available and orders are encrypted with PGP. Reviews, ratings and vendor "
+                     f"statistics are updated daily. <a href=\"/item/{index}\">Details</a></p></div>")
+        parts.append(paragraph)
+        size += len(paragraph)
+        index += 1
+    parts.append(tail)
+    return ''.join(parts).encode('utf-8')
+
+
+class _FleetHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'nginx/1.18.0'
+    sys_version = ''
+
+    def log_message(self, format: str, *args):
+        pass
+
+    def _send(self, status: HTTPStatus, body: bytes, content_type: str = 'text/html; charset=utf-8',
+              headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Frame-Options', 'DENY')
+        self.send_header('X-Powered-By', 'PHP/7.4.33')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        self.server.fleet._count('bytes_sent', len(body))
+
+    def _handle(self):
+        fleet = self.server.fleet
+        profile = fleet.profile
+        hostname = (self.headers.get('Host') or '').split(':')[0].lower()
+        fleet._count('requests')
+        # Read the request body before anything else, or it would be taken for the next request on the connection
+        self.body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        delay = profile.latency + (fleet._random() * profile.jitter if profile.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+        if profile.failure_rate and fleet._random() < profile.failure_rate:
+            fleet._count('failures')
+            if profile.failure_mode == 'reset':
+                self.close_connection = True
+                return
+            return self._send(HTTPStatus.SERVICE_UNAVAILABLE, b"<html><body>503</body></html>")
+
+        if hostname == GEO_API_HOST:
+            return self._geo_api()
+
+        page = fleet.page(hostname)
+        if page is None:
+            return self._send(HTTPStatus.NOT_FOUND, b"<html><body>Unknown service</body></html>")
+
+        path = self.path.split('?')[0]
+        hop = 0 if path == '/' else int(path[2:]) if path[:2] == '/r' and path[2:].isdigit() else None
+        if hop is not None:
+            if hop < profile.redirects:
+                return self._send(HTTPStatus.FOUND, b"", headers={'Location': f"/r{hop + 1}"})
+            return self._send(HTTPStatus.OK, page)
+        if path == '/robots.txt':
+            return self._send(HTTPStatus.OK, b"User-agent: *\nDisallow: /admin\n", content_type='text/plain')
+        return self._send(HTTPStatus.NOT_FOUND, b"<html><body>404 Not Found</body></html>")
+
+    def _geo_api(self):
+        """ip-api.com: GET /json/<ip> and POST /batch with a JSON list of IPs"""
+        if self.command == 'POST' and self.path.split('?')[0] == '/batch':
+            try:
+                ip_addresses = serialization.loads(self.body)
+            except ValueError:
+                return self._send(HTTPStatus.BAD_REQUEST, b'{}', content_type='application/json')
+            body = [geolocation(ip_address) for ip_address in ip_addresses]
+        elif self.path.startswith('/json/'):
+            body = geolocation(self.path[len('/json/'):].split('?')[0])
+        else:
+            return self._send(HTTPStatus.NOT_FOUND, b'{}', content_type='application/json')
+        self._send(HTTPStatus.OK, serialization.dumps(body), content_type='application/json')
+
+    do_GET = _handle
+    do_HEAD = _handle
+    do_POST = _handle
+
+
+class _FleetServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class MockOnionFleet:
+    """Local HTTP servers answering for a set of fake onion hostnames
+
+    Sites are virtual hosts told apart by the Host header and spread over
+    `servers` listening sockets. Every response waits `profile.latency`
+    (plus jitter), landing pages may sit behind a redirect chain, and a
+    share of requests fails. Pages are built once per site, so the servers
+    spend their time waiting rather than competing with the analyzer for CPU.
+    The fleet also answers ip-api.com (GEO_API_HOST), so geolocation runs
+    its batch lookup and caching paths instead of failing over between
+    unreachable providers.
+    """
+
+    def __init__(self, sites: int = 50, profile: Optional[SiteProfile] = None, servers: int = 1,
+                 seed: int = 0, host: str = '127.0.0.1'):
+        self.profile = profile or SiteProfile()
+        if self.profile.failure_mode not in FAILURE_MODES:
+            raise ValueError(f"failure_mode must be one of {', '.join(FAILURE_MODES)}")
+        self.hostnames = [onion_hostname(seed, index) for index in range(sites)]
+        self.host = host
+        self.stats = {'requests': 0, 'failures': 0, 'bytes_sent': 0}
+
+        self._servers = [_FleetServer((host, 0), _FleetHandler) for _ in range(max(1, servers))]
+        for server in self._servers:
+            server.fleet = self
+        self._threads: List[threading.Thread] = []
+        self._pages: Dict[str, bytes] = {}
+        self._index = {hostname: index for index, hostname in enumerate(self.hostnames)}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def urls(self) -> List[str]:
+        return [f"http://{hostname}/" for hostname in self.hostnames]
+
+    def page(self, hostname: str) -> Optional[bytes]:
+        index = self._index.get(hostname)
+        if index is None:
+            return None
+        page = self._pages.get(hostname)
+        if page is None:
+            neighbours = [self.hostnames[(index + step) % len(self.hostnames)] for step in (1, 2, 3)]
+            page = self._pages[hostname] = build_page(hostname, neighbours, self.profile.body_size)
+        return page
+
+    def address(self, hostname: str) -> Optional[Tuple[str, int]]:
+        """Where the SOCKS stand-in should connect for `hostname`; None if the fleet does not serve it"""
+        if hostname.lower() == GEO_API_HOST:
+            return self._servers[0].server_address[:2]
+        index = self._index.get(hostname.lower())
+        if index is None:
+            return None
+        return self._servers[index % len(self._servers)].server_address[:2]
+
+    def _random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def start(self) -> 'MockOnionFleet':
+        for server in self._servers:
+            thread = threading.Thread(target=server.serve_forever, name='mock-onion-fleet', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __enter__(self) -> 'MockOnionFleet':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+
+from .fleet import MockOnionFleet, SiteProfile
+from .socks_proxy import SocksStandIn
+
+_PROXY_VARIABLES = ('HTTP_PROXY', 'HTTPS_PROXY', 'ALL_PROXY', 'http_proxy', 'https_proxy', 'all_proxy')
+
+
+def _serve(connection, sites: int, profile: Dict[str, Any], servers: int, seed: int):
+    """Body of the network process: run the fleet and the SOCKS stand-in until told to stop"""
+    fleet = MockOnionFleet(sites, SiteProfile(**profile), servers=servers, seed=seed).start()
+    proxy = SocksStandIn(lambda host, port: fleet.address(host)).start()
+    connection.send({'proxy': proxy.address, 'urls': fleet.urls})
+
+    connection.recv()
+    proxy.stop()
+    fleet.stop()
+    connection.send({'fleet': fleet.stats, 'proxy_connections': proxy.connections,
+                     'blocked': dict(proxy.blocked)})
+
+
+def _refuse_onion(function):
+    def guarded(host, *args, **kwargs):
+        name = host.decode('ascii', 'ignore') if isinstance(host, bytes) else host
+        if isinstance(name, str) and name.lower().rstrip('.').endswith('.onion'):
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return function(host, *args, **kwargs)
+    return guarded
+
+
+class OfflineNetwork:
+    """A MockOnionFleet behind a SocksStandIn, wired up as this process's Tor
+
+    The fleet and the proxy run in a separate (spawned) process, so serving
+    pages competes neither for this process's GIL nor for its RSS. While
+    started, TOR_PROXY_HOST/TOR_PROXY_PORT point TorConnector at the proxy,
+    and the HTTP(S)_PROXY variables send every other requests call there
+    too, where hosts the fleet does not serve are refused. Local DNS lookups of .onion
+    names fail at once, as RFC 7686 resolvers do, instead of depending on
+    the machine's resolver. Geolocation and exit-list caches go to a
+    temporary directory, and paid OSINT API keys are cleared.
+    """
+
+    def __init__(self, sites: int = 50, profile: Optional[SiteProfile] = None, servers: int = 4, seed: int = 0):
+        self.sites = sites
+        self.profile = profile or SiteProfile()
+        self.servers = servers
+        self.seed = seed
+        self.urls: List[str] = []
+        self.stats: Dict[str, Any] = {}
+
+        self._process = None
+        self._connection = None
+        self._saved_environ: Dict[str, Optional[str]] = {}
+        self._saved_resolvers = {}
+        self._workdir = None
+
+    def start(self) -> 'OfflineNetwork':
+        context = multiprocessing.get_context('spawn')
+        self._connection, child = context.Pipe()
+        self._process = context.Process(target=_serve, name='benchmark-network', daemon=True,
+                                        args=(child, self.sites, asdict(self.profile), self.servers, self.seed))
+        self._process.start()
+        ready = self._connection.recv()
+        self.urls = ready['urls']
+        host, port = ready['proxy']
+
+        self._workdir = tempfile.mkdtemp(prefix='onion-bench-')
+        environ = {
+            'TOR_PROXY_HOST': host,
+            'TOR_PROXY_PORT': str(port),
+            'NO_PROXY': '',
+            'no_proxy': '',
+            'TOR_EXIT_INDEX_PATH': os.path.join(self._workdir, 'tor_exits.idx'),
+            'GEO_CACHE_PATH': '',
+            'SHODAN_API_KEY': '',
+            'VIRUSTOTAL_API_KEY': ''
+        }
+        environ.update({name: f"socks5h://{host}:{port}" for name in _PROXY_VARIABLES})
+        for name, value in environ.items():
+            self._saved_environ[name] = os.environ.get(name)
+            os.environ[name] = value
+
+        for name in ('getaddrinfo', 'gethostbyname', 'gethostbyname_ex'):
+            self._saved_resolvers[name] = getattr(socket, name)
+            setattr(socket, name, _refuse_onion(self._saved_resolvers[name]))
+        return self
+
+    def stop(self):
+        for name, function in self._saved_resolvers.items():
+            setattr(socket, name, function)
+        self._saved_resolvers = {}
+        for name, value in self._saved_environ.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        self._saved_environ = {}
+
+        if self._process is not None:
+            self._connection.send('stop')
+            self.stats = self._connection.recv()
+            self._process.join()
+            self._process = None
+        if self._workdir is not None:
+            shutil.rmtree(self._workdir, ignore_errors=True)
+            self._workdir = None
+
+    def __enter__(self) -> 'OfflineNetwork':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
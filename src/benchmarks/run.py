@@ -0,0 +1,413 @@
+"""Offline benchmarks for the analysis pipeline against a mock onion fleet
+
+Starts a MockOnionFleet behind a SocksStandIn (see benchmarks.network), then
+drives each scenario at each concurrency level and reports throughput,
+p50/p99 latency per item and peak RSS:
+
+    analyze          TorAnalyzer.analyze_url per URL
+    pipeline         analyze_single_url with OSINT, metadata and cross-references
+    export:<format>  one export of the pipeline results per item (csv, ndjson,
+                     json, parquet, bundle, pdf)
+
+With a baseline (--baseline, or benchmarks/baseline.json if present) every
+row is compared against it, and the run fails if throughput dropped or
+latency/RSS grew by more than --tolerance. Save one from a known-good tree
+with --save-baseline. Baselines only compare on the same machine and
+fleet settings. Peak RSS is the whole process's, so it also depends on the
+rows that ran before; compare runs of the same scenarios.
+
+Run from src/:
+    python -m benchmarks.run
+    python -m benchmarks.run --concurrency 1,8,32 --latency 0.2 --failure-rate 0.05
+    python -m benchmarks.run --scenarios analyze --save-baseline
+"""
+import argparse
+import gc
+import io
+import os
+import platform
+import queue
+import resource
+import sys
+import threading
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.analysis_tool import TorAnalyzer
+from core.columnar_export import pa
+from core.deanonymizer import TorDeanonymizer
+from core.export_utils import ExportUtils
+from core.pipeline import analyze_single_url
+from utils import serialization
+
+from .fleet import FAILURE_MODES, SiteProfile
+from .network import OfflineNetwork
+
+SCENARIOS = ('analyze', 'pipeline', 'export')
+EXPORTERS: Dict[str, Callable[[ExportUtils, List[Dict[str, Any]]], Any]] = {
+    'csv': lambda exporter, results: exporter.write_csv(results, io.StringIO()),
+    'ndjson': lambda exporter, results: exporter.write_ndjson(results, io.StringIO()),
+    'json': lambda exporter, results: exporter.to_json(results),
+    'parquet': lambda exporter, results: exporter.to_parquet(results),
+    'bundle': lambda exporter, results: exporter.write_bundle(results, io.BytesIO()),
+    'pdf': lambda exporter, results: exporter.to_pdf(results, page_budget=20)
+}
+
+# (metric, which direction is better); latencies also need to move by more than MIN_LATENCY_CHANGE_MS
+COMPARED_METRICS = (('items_per_second', 'higher'), ('p50_ms', 'lower'), ('p99_ms', 'lower'),
+                    ('peak_rss_mb', 'lower'))
+MIN_LATENCY_CHANGE_MS = 1.0
+# Settings that only pick which rows run; any other difference makes rows incomparable
+SELECTION_SETTINGS = ('scenarios', 'concurrency', 'exporters')
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def _current_rss() -> Optional[int]:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PeakRSS:
+    """Highest resident set size seen while the block runs
+
+    Samples /proc/self/statm where it exists. Elsewhere it falls back to the
+    process's lifetime peak from getrusage, which never goes down between runs.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while True:
+            rss = _current_rss()
+            if rss is None:
+                return
+            self.peak = max(self.peak, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self) -> 'PeakRSS':
+        self._thread = threading.Thread(target=self._sample, name='peak-rss', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        if not self.peak:
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            scale = 1 if sys.platform == 'darwin' else 1024
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def run_workers(concurrency: int, items: List[Any], setup: Callable[[], Any],
+                work: Callable[[Any, Any], bool]) -> Tuple[List[float], int, float]:
+    """Process items on `concurrency` threads; returns per-item latencies, error count and wall time
+
+    Each thread runs `setup` (e.g. building its analyzers) before the clock
+    starts, then `work(state, item)`, which returns False or raises on failure.
+    """
+    pending = queue.SimpleQueue()
+    for item in items:
+        pending.put(item)
+    ready = threading.Barrier(concurrency + 1)
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        state = setup()
+        ready.wait()
+        while True:
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            try:
+                ok = work(state, item)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += not ok
+
+    threads = [threading.Thread(target=worker, name=f"bench-{number}", daemon=True) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def measure(scenario: str, concurrency: int, items: List[Any], setup: Callable[[], Any],
+            work: Callable[[Any, Any], bool]) -> Dict[str, Any]:
+    gc.collect()
+    with PeakRSS() as rss:
+        latencies, errors, seconds = run_workers(concurrency, items, setup, work)
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'items': len(latencies),
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'items_per_second': round(len(latencies) / seconds, 2) if seconds > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'peak_rss_mb': round(rss.peak / (1024 * 1024), 1)
+    }
+
+
+# Scenarios
+
+def _analyzer():
+    return TorAnalyzer()
+
+
+def _analyze(analyzer: TorAnalyzer, url: str) -> bool:
+    return 'error' not in analyzer.analyze_url(url)
+
+
+def _pipeline_worker(results: List[Dict[str, Any]]):
+    def setup():
+        return TorAnalyzer(), TorDeanonymizer()
+
+    def work(analyzers, url: str) -> bool:
+        analyzer, deanonymizer = analyzers
+        result = analyze_single_url(url, analyzer, deanonymizer)
+        results.append(result)
+        return not result.get('error')
+
+    return setup, work
+
+
+def export_corpus(results: List[Dict[str, Any]], size: int) -> List[Dict[str, Any]]:
+    """`size` results, repeating `results` with distinct analysis ids"""
+    corpus = []
+    for index in range(size):
+        result = dict(results[index % len(results)])
+        result['analysis_id'] = f"bench_{index}"
+        corpus.append(result)
+    return corpus
+
+
+def run_benchmarks(args, urls: List[str], log=sys.stderr) -> Dict[str, Dict[str, Any]]:
+    rows = {}
+
+    def record(row: Dict[str, Any]):
+        key = f"{row['scenario']}@{row['concurrency']}"
+        rows[key] = row
+        print(f"{key:<22} {row['items_per_second']:>9.2f}/s  p50 {row['p50_ms']:>8.1f}ms  "
+              f"p99 {row['p99_ms']:>8.1f}ms  rss {row['peak_rss_mb']:>7.1f}MB  errors {row['errors']}", file=log)
+
+    work_urls = [urls[index % len(urls)] for index in range(args.urls)]
+
+    # Warm-up: imports, parser caches and connection setup, not measured
+    run_workers(1, work_urls[:3], _analyzer, _analyze)
+
+    pipeline_results: List[Dict[str, Any]] = []
+    for concurrency in args.concurrency:
+        if 'analyze' in args.scenarios:
+            record(measure('analyze', concurrency, work_urls, _analyzer, _analyze))
+        if 'pipeline' in args.scenarios:
+            pipeline_results.clear()
+            setup, work = _pipeline_worker(pipeline_results)
+            record(measure('pipeline', concurrency, work_urls, setup, work))
+
+    if 'export' in args.scenarios:
+        if not pipeline_results:
+            setup, work = _pipeline_worker(pipeline_results)
+            run_workers(max(args.concurrency), work_urls, setup, work)
+        corpus = export_corpus(pipeline_results, args.export_results)
+
+        exporters = [name for name in args.exporters if name != 'parquet' or pa is not None]
+        if len(exporters) < len(args.exporters):
+            print("Skipping parquet export: pyarrow is not installed", file=log)
+        for name in exporters:
+            export = EXPORTERS[name]
+            for concurrency in args.concurrency:
+                runs = list(range(max(args.export_runs, concurrency)))
+                record(measure(f"export:{name}", concurrency, runs, ExportUtils,
+                               lambda exporter, _: export(exporter, corpus) is not None))
+
+    return rows
+
+
+# Baselines
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Rows × metrics that got worse than the baseline by more than `tolerance`"""
+    regressions = []
+    for key, row in report['results'].items():
+        base = baseline.get('results', {}).get(key)
+        if base is None:
+            continue
+        for metric, better in COMPARED_METRICS:
+            old, new = base.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if better == 'higher' else change > tolerance
+            if worse and metric.endswith('_ms') and abs(new - old) < MIN_LATENCY_CHANGE_MS:
+                worse = False
+            if worse:
+                regressions.append({'key': key, 'metric': metric, 'baseline': old, 'current': new,
+                                    'change': round(change, 3)})
+    return regressions
+
+
+def format_comparison(report: Dict[str, Any], baseline: Dict[str, Any]) -> str:
+    lines = [f"{'':<22} {'throughput':>18} {'p50':>18} {'p99':>18} {'rss':>18}"]
+    for key, row in report['results'].items():
+        base = baseline.get('results', {}).get(key)
+        if base is None:
+            lines.append(f"{key:<22} (not in baseline)")
+            continue
+        cells = []
+        for metric, _ in COMPARED_METRICS:
+            old, new = base.get(metric), row.get(metric)
+            change = f"{(new - old) / old:+.0%}" if old else "n/a"
+            cells.append(f"{new:>10} {change:>7}")
+        lines.append(f"{key:<22} " + ' '.join(cells))
+    return '\n'.join(lines)
+
+
+def _load_json(path: str) -> Dict[str, Any]:
+    with open(path, 'rb') as f:
+        return serialization.load(f)
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    with open(path, 'wb') as f:
+        serialization.dump(data, f, pretty=True)
+
+
+# Command line
+
+def _csv_list(choices: Optional[Tuple[str, ...]] = None, cast: Callable[[str], Any] = str):
+    def parse(value: str) -> List[Any]:
+        items = [cast(item.strip()) for item in value.split(',') if item.strip()]
+        if choices is not None:
+            unknown = [item for item in items if item not in choices]
+            if unknown:
+                raise argparse.ArgumentTypeError(f"unknown {', '.join(unknown)}; choose from {', '.join(choices)}")
+        return items
+    return parse
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark the analyzer against a local mock onion fleet")
+    parser.add_argument('--scenarios', type=_csv_list(SCENARIOS), default=list(SCENARIOS),
+                        help=f"Comma-separated scenarios (default: {','.join(SCENARIOS)})")
+    parser.add_argument('--concurrency', type=_csv_list(cast=int), default=[1, 4, 16],
+                        help="Comma-separated thread counts (default: 1,4,16)")
+    parser.add_argument('--urls', type=int, default=100, help="URLs analyzed per analyze/pipeline run")
+    parser.add_argument('--exporters', type=_csv_list(tuple(EXPORTERS)), default=list(EXPORTERS),
+                        help=f"Export formats (default: {','.join(EXPORTERS)})")
+    parser.add_argument('--export-results', type=int, default=500, help="Results in each export")
+    parser.add_argument('--export-runs', type=int, default=8, help="Exports per format and concurrency level")
+
+    fleet = parser.add_argument_group('mock fleet')
+    fleet.add_argument('--sites', type=int, default=50, help="Fake onion services")
+    fleet.add_argument('--servers', type=int, default=4, help="Listening sockets the sites are spread over")
+    fleet.add_argument('--latency', type=float, default=0.05, help="Seconds before each response")
+    fleet.add_argument('--jitter', type=float, default=0.02, help="Extra random latency, up to this many seconds")
+    fleet.add_argument('--body-size', type=int, default=32 * 1024, help="Landing page bytes")
+    fleet.add_argument('--redirects', type=int, default=1, help="Redirect hops before each landing page")
+    fleet.add_argument('--failure-rate', type=float, default=0.02, help="Share of requests that fail")
+    fleet.add_argument('--failure-mode', choices=FAILURE_MODES, default='error',
+                       help="error: 503 responses; reset: connections dropped")
+    fleet.add_argument('--seed', type=int, default=0, help="Seed for hostnames, jitter and failures")
+
+    output = parser.add_argument_group('results')
+    output.add_argument('-o', '--output', metavar='PATH', help="Write the full report as JSON")
+    output.add_argument('--baseline', metavar='PATH',
+                        help="Baseline report to compare against (default: benchmarks/baseline.json if it exists)")
+    output.add_argument('--save-baseline', action='store_true', help="Write this run as the baseline")
+    output.add_argument('--tolerance', type=float, default=0.15,
+                        help="Relative change that counts as a regression (default: 0.15)")
+    output.add_argument('--no-fail', action='store_true', help="Exit 0 even when regressions are found")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    profile = SiteProfile(latency=args.latency, jitter=args.jitter, body_size=args.body_size,
+                          redirects=args.redirects, failure_rate=args.failure_rate,
+                          failure_mode=args.failure_mode)
+    config = {
+        'scenarios': args.scenarios, 'concurrency': args.concurrency, 'urls': args.urls,
+        'exporters': args.exporters, 'export_results': args.export_results, 'export_runs': args.export_runs,
+        'sites': args.sites, 'servers': args.servers, 'seed': args.seed, 'profile': asdict(profile)
+    }
+
+    network = OfflineNetwork(args.sites, profile, servers=args.servers, seed=args.seed)
+    with network:
+        results = run_benchmarks(args, network.urls)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': config,
+        'network': network.stats,
+        'results': results
+    }
+    blocked = sum(network.stats.get('blocked', {}).values())
+    print(f"Fleet served {network.stats['fleet']['requests']} requests "
+          f"({network.stats['fleet']['failures']} injected failures); "
+          f"{blocked} connections to non-fleet hosts refused", file=sys.stderr)
+
+    if args.output:
+        _write_json(args.output, report)
+
+    baseline_path = args.baseline or DEFAULT_BASELINE
+    status = 0
+    if args.save_baseline:
+        _write_json(baseline_path, report)
+        print(f"Baseline written to {baseline_path}", file=sys.stderr)
+    elif os.path.exists(baseline_path):
+        baseline = _load_json(baseline_path)
+        def settings(values):
+            return {name: value for name, value in values.items() if name not in SELECTION_SETTINGS}
+
+        if settings(baseline.get('config', {})) != settings(config):
+            print("Warning: baseline was recorded with different settings; comparisons may not mean much",
+                  file=sys.stderr)
+        print(format_comparison(report, baseline))
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['key']} {regression['metric']}: {regression['baseline']} -> "
+                  f"{regression['current']} ({regression['change']:+.0%})")
+        if regressions and not args.no_fail:
+            status = 1
+    elif args.baseline:
+        print(f"Baseline {args.baseline} not found", file=sys.stderr)
+        status = 2
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
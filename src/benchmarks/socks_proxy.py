@@ -0,0 +1,149 @@
+import ipaddress
+import selectors
+import socket
+import socketserver
+import struct
+import threading
+from collections import Counter
+from typing import Callable, Optional, Tuple
+
+# SOCKS5 reply codes (RFC 1928)
+_SUCCEEDED = 0x00
+_NOT_ALLOWED = 0x02
+_HOST_UNREACHABLE = 0x04
+_COMMAND_NOT_SUPPORTED = 0x07
+_ADDRESS_NOT_SUPPORTED = 0x08
+
+Resolver = Callable[[str, int], Optional[Tuple[str, int]]]
+
+
+class _SocksHandler(socketserver.BaseRequestHandler):
+    def _recv_exact(self, count: int) -> bytes:
+        data = b''
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("Client closed the connection during the SOCKS handshake")
+            data += chunk
+        return data
+
+    def _reply(self, code: int):
+        self.request.sendall(struct.pack('!BBBB4sH', 5, code, 0, 1, b'\0\0\0\0', 0))
+
+    def handle(self):
+        proxy = self.server.proxy
+        try:
+            version, method_count = self._recv_exact(2)
+            methods = self._recv_exact(method_count)
+            if version != 5 or 0 not in methods:
+                self.request.sendall(b'\x05\xff')
+                return
+            self.request.sendall(b'\x05\x00')
+
+            version, command, _, address_type = self._recv_exact(4)
+            if address_type == 1:
+                host = str(ipaddress.IPv4Address(self._recv_exact(4)))
+            elif address_type == 3:
+                host = self._recv_exact(self._recv_exact(1)[0]).decode('idna')
+            elif address_type == 4:
+                host = str(ipaddress.IPv6Address(self._recv_exact(16)))
+            else:
+                return self._reply(_ADDRESS_NOT_SUPPORTED)
+            port = struct.unpack('!H', self._recv_exact(2))[0]
+
+            if command != 1:
+                return self._reply(_COMMAND_NOT_SUPPORTED)
+
+            target = proxy.resolve(host, port)
+            if target is None:
+                proxy._blocked(host)
+                return self._reply(_NOT_ALLOWED)
+
+            try:
+                upstream = socket.create_connection(target, timeout=10)
+            except OSError:
+                return self._reply(_HOST_UNREACHABLE)
+        except (ConnectionError, OSError, ValueError):
+            return
+
+        with upstream:
+            upstream.settimeout(None)
+            self._reply(_SUCCEEDED)
+            proxy._connected(host)
+            self._relay(upstream)
+
+    def _relay(self, upstream: socket.socket):
+        peers = {self.request: upstream, upstream: self.request}
+        with selectors.DefaultSelector() as selector:
+            for sock in peers:
+                selector.register(sock, selectors.EVENT_READ)
+            while True:
+                for key, _ in selector.select():
+                    try:
+                        data = key.fileobj.recv(64 * 1024)
+                        if not data:
+                            return
+                        peers[key.fileobj].sendall(data)
+                    except OSError:
+                        return
+
+
+class _SocksServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+
+class SocksStandIn:
+    """Minimal SOCKS5 proxy standing in for Tor in offline benchmarks
+
+    Speaks enough of RFC 1928 for requests' socks5h:// proxies: no
+    authentication, CONNECT only. Each destination goes through `resolve`,
+    normally MockOnionFleet.address; anything it does not know (clearnet
+    geolocation APIs, crt.sh, exit lists) is refused and counted in
+    `blocked`, so a benchmark never leaves the machine.
+    """
+
+    def __init__(self, resolve: Resolver, host: str = '127.0.0.1', port: int = 0):
+        self.resolve = resolve
+        self.connections = 0
+        self.blocked = Counter()
+        self._lock = threading.Lock()
+        self._server = _SocksServer((host, port), _SocksHandler)
+        self._server.proxy = self
+        self._thread = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._server.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        host, port = self.address
+        return f"socks5h://{host}:{port}"
+
+    def _connected(self, host: str):
+        with self._lock:
+            self.connections += 1
+
+    def _blocked(self, host: str):
+        with self._lock:
+            self.blocked[host] += 1
+
+    def start(self) -> 'SocksStandIn':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='socks-stand-in', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'SocksStandIn':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
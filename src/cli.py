@@ -0,0 +1,261 @@
+"""Headless batch runner for onion site analysis
+
+Reads URLs (one per line, '#' comments allowed) from files or stdin, analyzes
+them concurrently and streams one NDJSON result per line as each finishes.
+Only the analysis modules are imported, so it starts quickly on machines
+without the dashboard stack (Streamlit, Plotly, ReportLab).
+
+With --staged, each URL flows through fetch, parse, probe, enrich and store
+stages that have their own worker pools and bounded queues, so network-bound
+and CPU-bound work overlap across URLs; per-stage statistics go to stderr.
+
+Examples:
+    python cli.py urls.txt -o results.ndjson --workers 8
+    cat urls.txt | python cli.py - --no-deep --content-store data/blobs
+    python cli.py urls.txt --staged --stage-workers fetch=16,probe=16 --stats-interval 10
+    python cli.py urls.txt -o results.ndjson --profile    # profile in results.ndjson.profile/
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+from core.analysis_tool import TorAnalyzer
+from core.blob_store import ContentStore
+from core.deanonymizer import TorDeanonymizer
+from core.parse_pool import ParsePool, parse_pool_from_env
+from core.pipeline import analyze_single_url, error_result
+from core.result_store import ResultStore
+from core.staged_pipeline import STAGES, StagedPipeline
+from utils import metrics, serialization
+from utils.profiling import Profiler
+from utils.validators import URLValidator
+
+
+def iter_urls(sources: List[str]) -> Iterator[str]:
+    """Yield stripped URLs from files ('-' for stdin), skipping blanks and comments"""
+    for source in sources:
+        f = sys.stdin if source == '-' else open(source, encoding='utf-8')
+        try:
+            for line in f:
+                url = line.strip()
+                if url and not url.startswith('#'):
+                    yield url
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+class BatchRunner:
+    """Analyze URLs on a thread pool and write results as NDJSON"""
+
+    def __init__(self, workers: int = 4, options: Optional[dict] = None,
+                 content_store: Optional[ContentStore] = None, result_store: Optional[ResultStore] = None,
+                 validate: bool = True, parse_pool: Optional[ParsePool] = None,
+                 stage_workers: Optional[Dict[str, int]] = None, stats_interval: float = 0):
+        self.workers = workers
+        self.options = options or {}
+        self.content_store = content_store
+        self.result_store = result_store
+        self.validator = URLValidator() if validate else None
+        self.parse_pool = parse_pool
+        # Run as a StagedPipeline when set (may be empty to use the default stage sizes)
+        self.stage_workers = stage_workers
+        self.stats_interval = stats_interval
+        self.pipeline = None
+        self.run_id = None
+
+        self.analyzed = 0
+        self.errors = 0
+        self.skipped = 0
+
+        # Analyzers hold a Tor session, so each worker thread gets its own
+        self._local = threading.local()
+
+    def _analyze(self, index: int, url: str):
+        if not hasattr(self._local, 'analyzer'):
+            self._local.analyzer = TorAnalyzer(parse_pool=self.parse_pool)
+            self._local.deanonymizer = TorDeanonymizer(parse_pool=self.parse_pool)
+
+        analysis_id = f"cli_{self.run_id}_{index}"
+        try:
+            return analyze_single_url(url, self._local.analyzer, self._local.deanonymizer, self.options,
+                                      analysis_id=analysis_id, content_store=self.content_store)
+        except Exception as e:
+            return error_result(url, str(e), analysis_id=analysis_id)
+
+    def _valid(self, urls: Iterable[str], log: TextIO) -> Iterator[str]:
+        for url in urls:
+            if self.validator and not self.validator.is_valid_onion_url(url):
+                self.skipped += 1
+                print(f"Skipping invalid onion URL: {url}", file=log)
+                continue
+            yield url
+
+    def run(self, urls: Iterable[str], output: TextIO, log: TextIO = sys.stderr) -> int:
+        """Analyze every URL, writing results in completion order; returns the result count"""
+        self.run_id = f"{int(time.time())}_{os.getpid()}"
+        if self.stage_workers is not None:
+            return self._run_staged(urls, output, log)
+
+        # Bound the number of queued URLs so huge input lists are read lazily
+        max_in_flight = self.workers * 4
+        in_flight = set()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cli-worker') as executor:
+            for index, url in enumerate(self._valid(urls, log)):
+                in_flight.add(executor.submit(self._analyze, index, url))
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._write(done, output, log)
+
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                self._write(done, output, log)
+
+        if self.result_store is not None:
+            self.result_store.flush()
+        output.flush()
+        return self.analyzed
+
+    def _run_staged(self, urls: Iterable[str], output: TextIO, log: TextIO) -> int:
+        def store(result):
+            self._emit(result, output, log)
+            output.flush()
+
+        self.pipeline = StagedPipeline(store, options=self.options, content_store=self.content_store,
+                                       parse_pool=self.parse_pool, workers=self.stage_workers)
+
+        done = threading.Event()
+        if self.stats_interval > 0:
+            def report():
+                while not done.wait(self.stats_interval):
+                    print(self.pipeline.format_stats(), file=log)
+            threading.Thread(target=report, name='cli-stats', daemon=True).start()
+
+        try:
+            self.pipeline.run(self._valid(urls, log), id_prefix=f"cli_{self.run_id}")
+        finally:
+            done.set()
+
+        if self.result_store is not None:
+            self.result_store.flush()
+        output.flush()
+        print(self.pipeline.format_stats(), file=log)
+        return self.analyzed
+
+    def _write(self, futures, output: TextIO, log: TextIO):
+        for future in futures:
+            self._emit(future.result(), output, log)
+        output.flush()
+
+    def _emit(self, result, output: TextIO, log: TextIO):
+        output.write(serialization.dumps_str(result) + '\n')
+
+        self.analyzed += 1
+        if 'error' in result:
+            self.errors += 1
+            print(f"Error analyzing {result.get('url')}: {result['error']}", file=log)
+
+        if self.result_store is not None:
+            self.result_store.add(result)
+
+
+def parse_stage_workers(value: str) -> Dict[str, int]:
+    """Parse 'fetch=16,probe=8' into {'fetch': 16, 'probe': 8}"""
+    workers = {}
+    for part in value.split(','):
+        name, _, count = part.partition('=')
+        if name.strip() not in STAGES or not count.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"expected STAGE=N with STAGE one of {', '.join(STAGES)}: {part}")
+        workers[name.strip()] = int(count)
+    return workers
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Analyze onion URLs headlessly and stream NDJSON results")
+    parser.add_argument('inputs', nargs='*', default=['-'],
+                        help="Files with one URL per line ('-' or nothing for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="NDJSON output file ('-' for stdout)")
+    parser.add_argument('-w', '--workers', type=int, default=int(os.getenv('ANALYSIS_WORKERS', '4')),
+                        help="Concurrent URLs (default: ANALYSIS_WORKERS or 4)")
+    parser.add_argument('--no-deep', action='store_true', help="Skip deep OSINT analysis")
+    parser.add_argument('--no-metadata', action='store_true', help="Skip metadata extraction")
+    parser.add_argument('--no-cross-reference', action='store_true', help="Skip database cross-referencing")
+    parser.add_argument('--content-store', metavar='DIR',
+                        help="Move page bodies into a content store instead of writing them inline")
+    parser.add_argument('--result-store', metavar='DB', help="Also save results to a SQLite result store")
+    parser.add_argument('--no-validate', action='store_true', help="Analyze URLs even if they are not onion URLs")
+    parser.add_argument('--parse-processes', type=int, metavar='N',
+                        help="Parse pages in N worker processes (default: PARSE_PROCESSES, 0 = in-thread)")
+    parser.add_argument('--staged', action='store_true',
+                        help="Run fetch, parse, probe, enrich and store as separate worker pools")
+    parser.add_argument('--stage-workers', type=parse_stage_workers, metavar='STAGE=N,...',
+                        help=f"Worker threads per stage with --staged ({', '.join(STAGES)})")
+    parser.add_argument('--stats-interval', type=float, default=0, metavar='SECONDS',
+                        help="With --staged, print per-stage queue depths and throughput this often")
+    parser.add_argument('--profile', nargs='?', const='', metavar='DIR',
+                        help="Write per-stage CPU, wall-clock and allocation flamegraph profiles to DIR "
+                             "(default: next to --output)")
+    parser.add_argument('--profile-no-memory', action='store_true',
+                        help="Profile without allocation tracing, which slows allocation-heavy stages")
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help="Write per-stage latency, error and byte metrics here (Prometheus text) at exit")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    runner = BatchRunner(
+        workers=max(1, args.workers),
+        options={
+            'deep_analysis': not args.no_deep,
+            'metadata_extraction': not args.no_metadata,
+            'cross_reference': not args.no_cross_reference
+        },
+        content_store=ContentStore(args.content_store) if args.content_store else None,
+        result_store=ResultStore(args.result_store) if args.result_store else None,
+        validate=not args.no_validate,
+        parse_pool=parse_pool_from_env(args.parse_processes),
+        stage_workers=(args.stage_workers or {}) if args.staged or args.stage_workers else None,
+        stats_interval=args.stats_interval
+    )
+
+    profiler = None
+    if args.profile is not None:
+        profile_dir = args.profile or (f"{args.output}.profile" if args.output != '-'
+                                       else f"profile-{time.strftime('%Y%m%d-%H%M%S')}")
+        profiler = Profiler(profile_dir, memory=not args.profile_no_memory)
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    start_time = time.time()
+    try:
+        if profiler is not None:
+            profiler.start()
+        runner.run(iter_urls(args.inputs), output)
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        return 130
+    finally:
+        if profiler is not None:
+            print(f"Profile written to {profiler.stop()}", file=sys.stderr)
+        if output is not sys.stdout:
+            output.close()
+        if runner.result_store is not None:
+            runner.result_store.close()
+        if runner.parse_pool is not None:
+            runner.parse_pool.shutdown()
+        if args.metrics_file:
+            metrics.write_prometheus_file(args.metrics_file)
+
+    print(f"Analyzed {runner.analyzed} URLs ({runner.errors} errors, {runner.skipped} skipped) "
+          f"in {time.time() - start_time:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,67 +5,111 @@ import time
 import hashlib
 import re
 from urllib.parse import urljoin, urlparse
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, TYPE_CHECKING
 import ssl
 import socket
 from datetime import datetime
 
+from utils import metrics
 from .tor_connector import TorConnector
 from .geolocation import GeolocationAnalyzer
+from .models import AnalysisResult
+
+if TYPE_CHECKING:
+    from .parse_pool import ParsePool
 
 class TorAnalyzer:
     """Core analysis tool for Tor onion sites"""
     
-    def __init__(self):
+    def __init__(self, parse_pool: Optional['ParsePool'] = None):
         self.tor_connector = TorConnector()
         self.geolocation_analyzer = GeolocationAnalyzer()
         self.session = None
         self.timeout = 30
         
-    def analyze_url(self, url: str) -> Dict[str, Any]:
+        # Runs content parsing in worker processes when set
+        self.parse_pool = parse_pool
+        
+    # analyze_url stages in order; the staged pipeline runs them on separate worker pools
+    STAGES = ('fetch', 'content', 'technical', 'geolocation', 'scoring')
+    
+    def analyze_url(self, url: str) -> AnalysisResult:
         """Perform comprehensive analysis of an onion URL"""
+        result = self.new_result(url)
+        self.run_stages(result, self.STAGES)
+        return result
+    
+    def new_result(self, url: str) -> AnalysisResult:
+        """Empty result for a URL about to be analyzed"""
+        return AnalysisResult(
+            url=url,
+            timestamp=datetime.now().isoformat(),
+            analysis_type='comprehensive'
+        )
+    
+    def run_stages(self, result: AnalysisResult, stages) -> bool:
+        """Run the named analyze_url stages on a result
         
+        If a stage raises, the error is recorded, the risk level set to
+        unknown and the remaining stages skipped; returns False in that case.
+        Stage latencies go to utils.metrics and to result['timings'].
+        """
         if not self.session:
             self.session = self.tor_connector.get_session()
         
-        result = {
-            'url': url,
-            'timestamp': datetime.now().isoformat(),
-            'analysis_type': 'comprehensive'
-        }
+        timings = result.get('timings')
+        if timings is None:
+            timings = result['timings'] = {}
         
         try:
-            # Basic HTTP analysis
-            result.update(self._analyze_http_response(url))
-            
-            # Content analysis
-            if result.get('content'):
-                result.update(self._analyze_content(result['content']))
-            
-            # Technical fingerprinting
-            result.update(self._analyze_technical_details(url))
-            
-            # IP and Geolocation analysis
-            geo_analysis = self.geolocation_analyzer.resolve_onion_to_ip(url)
-            result['geolocation_analysis'] = geo_analysis
-            
-            # Generate location summary
-            if geo_analysis.get('geolocation_data'):
-                result['location_summary'] = self.geolocation_analyzer.generate_location_summary(
-                    geo_analysis['geolocation_data']
-                )
-            
-            # Risk assessment
-            result['risk_level'] = self._assess_risk(result)
-            
-            # Generate analysis score
-            result['analysis_score'] = self._calculate_analysis_score(result)
-            
+            with metrics.collect_timings(timings):
+                for stage in stages:
+                    with metrics.timed(stage):
+                        getattr(self, f'_stage_{stage}')(result)
         except Exception as e:
             result['error'] = str(e)
             result['risk_level'] = 'unknown'
+            return False
         
-        return result
+        return True
+    
+    def _stage_fetch(self, result: AnalysisResult):
+        # Basic HTTP analysis
+        result.update(self._analyze_http_response(result['url']))
+        if 'error' in result:
+            metrics.record_error('fetch')
+    
+    def _stage_content(self, result: AnalysisResult):
+        # Content analysis
+        if result.get('content'):
+            if self.parse_pool is not None:
+                result.update(self.parse_pool.analyze_content(result['content']))
+            else:
+                result.update(self._analyze_content(result['content']))
+            if 'content_analysis_error' in result:
+                metrics.record_error('content')
+    
+    def _stage_technical(self, result: AnalysisResult):
+        # Technical fingerprinting
+        result.update(self._analyze_technical_details(result['url']))
+    
+    def _stage_geolocation(self, result: AnalysisResult):
+        # IP and Geolocation analysis
+        geo_analysis = self.geolocation_analyzer.resolve_onion_to_ip(result['url'])
+        result['geolocation_analysis'] = geo_analysis
+        
+        # Generate location summary
+        if geo_analysis.get('geolocation_data'):
+            result['location_summary'] = self.geolocation_analyzer.generate_location_summary(
+                geo_analysis['geolocation_data']
+            )
+    
+    def _stage_scoring(self, result: AnalysisResult):
+        # Risk assessment
+        result['risk_level'] = self._assess_risk(result)
+        
+        # Generate analysis score
+        result['analysis_score'] = self._calculate_analysis_score(result)
     
     def _analyze_http_response(self, url: str) -> Dict[str, Any]:
         """Analyze HTTP response and headers"""
@@ -75,6 +119,7 @@ class TorAnalyzer:
             start_time = time.time()
             response = self.session.get(url, timeout=self.timeout, allow_redirects=True)
             load_time = time.time() - start_time
+            metrics.record_bytes('fetch', len(response.content))
             
             result.update({
                 'response_code': response.status_code,
@@ -108,41 +153,43 @@ class TorAnalyzer:
         result = {}
         
         try:
-            # Parse with BeautifulSoup
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            # Extract basic page info
-            result['title'] = soup.title.string if soup.title else None
-            result['meta_description'] = self._get_meta_content(soup, 'description')
-            result['meta_keywords'] = self._get_meta_content(soup, 'keywords')
-            
-            # Extract text content
-            text_content = trafilatura.extract(content) if content else ""
-            result['text_content_length'] = len(text_content) if text_content else 0
-            
-            # Analyze links
-            result['links'] = self._analyze_links(soup)
-            
-            # Look for forms
-            result['forms'] = self._analyze_forms(soup)
-            
-            # Search for email addresses
-            result['emails'] = self._extract_emails(content)
-            
-            # Search for cryptocurrency addresses
-            result['crypto_addresses'] = self._extract_crypto_addresses(content)
-            
-            # Language detection
-            result['language'] = self._detect_language(soup)
-            
-            # Look for social media references
-            result['social_media'] = self._extract_social_media(content)
-            
-            # Search for onion addresses
-            result['onion_links'] = self._extract_onion_links(content)
-            
-            # Content fingerprinting
-            result['content_hash'] = hashlib.sha256(content.encode()).hexdigest()
+            with metrics.timed('parse'):
+                # Parse with BeautifulSoup
+                soup = BeautifulSoup(content, 'html.parser')
+                
+                # Extract text content
+                text_content = trafilatura.extract(content) if content else ""
+            
+            with metrics.timed('extract'):
+                # Extract basic page info
+                result['title'] = str(soup.title.string) if soup.title and soup.title.string else None
+                result['meta_description'] = self._get_meta_content(soup, 'description')
+                result['meta_keywords'] = self._get_meta_content(soup, 'keywords')
+                result['text_content_length'] = len(text_content) if text_content else 0
+                
+                # Analyze links
+                result['links'] = self._analyze_links(soup)
+                
+                # Look for forms
+                result['forms'] = self._analyze_forms(soup)
+                
+                # Search for email addresses
+                result['emails'] = self._extract_emails(content)
+                
+                # Search for cryptocurrency addresses
+                result['crypto_addresses'] = self._extract_crypto_addresses(content)
+                
+                # Language detection
+                result['language'] = self._detect_language(soup)
+                
+                # Look for social media references
+                result['social_media'] = self._extract_social_media(content)
+                
+                # Search for onion addresses
+                result['onion_links'] = self._extract_onion_links(content)
+                
+                # Content fingerprinting
+                result['content_hash'] = hashlib.sha256(content.encode()).hexdigest()
             
         except Exception as e:
             result['content_analysis_error'] = str(e)
@@ -160,13 +207,16 @@ class TorAnalyzer:
             
             # SSL/TLS analysis for HTTPS
             if parsed_url.scheme == 'https':
-                result['ssl_info'] = self._analyze_ssl(hostname, port)
+                with metrics.timed('tls'):
+                    result['ssl_info'] = self._analyze_ssl(hostname, port)
             
             # Server response timing analysis
-            result['timing_analysis'] = self._analyze_timing(url)
+            with metrics.timed('timing'):
+                result['timing_analysis'] = self._analyze_timing(url)
             
             # Check for common admin/test pages
-            result['admin_pages'] = self._check_admin_pages(url)
+            with metrics.timed('admin_probes'):
+                result['admin_pages'] = self._check_admin_pages(url)
             
         except Exception as e:
             result['technical_analysis_error'] = str(e)
@@ -366,7 +416,9 @@ class TorAnalyzer:
                 response = self.session.get(url, timeout=self.timeout)
                 end_time = time.time()
                 times.append(end_time - start_time)
+                metrics.record_bytes('timing', len(response.content))
             except Exception:
+                metrics.record_error('timing')
                 continue
         
         if times:
@@ -399,7 +451,9 @@ class TorAnalyzer:
                 test_url = urljoin(base_url, path)
                 response = self.session.get(test_url, timeout=5)
                 results[path] = response.status_code == 200
+                metrics.record_bytes('admin_probes', len(response.content))
             except Exception:
+                metrics.record_error('admin_probes')
                 results[path] = False
         
         return results
@@ -503,6 +557,7 @@ class TorAnalyzer:
                 self.session = self.tor_connector.get_session()
             
             response = self.session.get(url, timeout=self.timeout)
+            metrics.record_bytes('metadata', len(response.content))
             soup = BeautifulSoup(response.text, 'html.parser')
             
             # Extract all meta tags
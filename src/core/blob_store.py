@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import os
+import threading
+from typing import Any, Dict, MutableMapping, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+
+
+def content_key(content: str) -> str:
+    """Content address of a page body; matches TorAnalyzer's content_hash"""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class ContentStore:
+    """Content-addressed, compressed on-disk store for page bodies
+
+    Bodies live at <root>/<key[:2]>/<key><suffix>, where key is the SHA-256 of
+    the UTF-8 body. Identical pages are written once; writes go through a temp
+    file and os.replace so concurrent writers never expose partial blobs.
+    Uses zstd when the zstandard package is installed and gzip otherwise;
+    either kind can be read back regardless of the current setting.
+    """
+
+    def __init__(self, root: str = 'data/blobs', compression: Optional[str] = None, level: Optional[int] = None):
+        if compression is None:
+            compression = 'zstd' if zstandard else 'gzip'
+        if compression not in _SUFFIXES:
+            raise ValueError(f"Unsupported content store compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("zstandard is required for zstd compression (pip install zstandard)")
+
+        self.root = root
+        self.compression = compression
+        self.level = level
+        self._lock = threading.Lock()
+
+        self.writes = 0
+        self.deduplicated = 0
+        self.bytes_in = 0
+        self.bytes_stored = 0
+
+    def _path(self, key: str, compression: str) -> str:
+        return os.path.join(self.root, key[:2], key + _SUFFIXES[compression])
+
+    def _find(self, key: str) -> Optional[str]:
+        for compression in _SUFFIXES:
+            path = self._path(key, compression)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level or 10).compress(data)
+        return gzip.compress(data, compresslevel=self.level or 6)
+
+    def put(self, content: str, key: Optional[str] = None) -> str:
+        """Store a page body and return its key; a no-op if already stored"""
+        if key is None:
+            key = content_key(content)
+
+        data = content.encode()
+        with self._lock:
+            self.bytes_in += len(data)
+
+        if self._find(key):
+            with self._lock:
+                self.deduplicated += 1
+            return key
+
+        compressed = self._compress(data)
+        path = self._path(key, self.compression)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.writes += 1
+            self.bytes_stored += len(compressed)
+        return key
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a stored page body, or None if the key is unknown"""
+        path = self._find(key)
+        if path is None:
+            return None
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        if path.endswith(_SUFFIXES['zstd']):
+            if zstandard is None:
+                raise ImportError("zstandard is required to read zstd blobs (pip install zstandard)")
+            data = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            data = gzip.decompress(data)
+        return data.decode()
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) is not None
+
+    def delete(self, key: str) -> bool:
+        """Remove a stored body; returns False if it was not present"""
+        path = self._find(key)
+        if path is None:
+            return False
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def offload(self, result: MutableMapping[str, Any]) -> MutableMapping[str, Any]:
+        """Move a result's page body into the store, leaving only `content_hash`"""
+        content = result.get('content')
+        if 'content' in result:
+            del result['content']
+
+        if content:
+            result['content_hash'] = self.put(content, key=result.get('content_hash'))
+        return result
+
+    def load_content(self, result: MutableMapping[str, Any]) -> Optional[str]:
+        """Return a result's page body, whether inline or offloaded"""
+        content = result.get('content')
+        if content is None and result.get('content_hash'):
+            content = self.get(result['content_hash'])
+        return content
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get write, deduplication and compression statistics"""
+        with self._lock:
+            return {
+                'root': self.root,
+                'compression': self.compression,
+                'writes': self.writes,
+                'deduplicated': self.deduplicated,
+                'bytes_in': self.bytes_in,
+                'bytes_stored': self.bytes_stored,
+                'compression_ratio': round(self.bytes_in / self.bytes_stored, 2) if self.bytes_stored else 0.0
+            }
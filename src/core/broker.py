@@ -0,0 +1,541 @@
+import abc
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from utils import serialization
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+TASK_STATES = ('queued', 'leased', 'done')
+
+
+@dataclass
+class Task:
+    """One URL of a distributed job, as handed to a worker by `TaskBroker.lease`"""
+    job_id: str
+    idx: int
+    url: str
+    options: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    worker_id: Optional[str] = None
+
+    @property
+    def task_id(self) -> str:
+        return f"{self.job_id}_{self.idx}"
+
+    @property
+    def analysis_id(self) -> str:
+        # Same scheme as JobRunner, so ResultStore job_id filters cover distributed jobs too
+        return f"analysis_{self.task_id}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'job_id': self.job_id, 'idx': self.idx, 'url': self.url, 'options': self.options,
+                'attempts': self.attempts, 'worker_id': self.worker_id}
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TaskBroker(abc.ABC):
+    """Shared task queue with leases, giving at-least-once delivery
+
+    `lease` hands a task to one worker until its lease deadline; a worker that
+    dies without calling `ack` or `nack` lets the lease expire and the task is
+    delivered again. Workers therefore must write results idempotently (the
+    ResultStore upserts on analysis_id).
+    """
+
+    @abc.abstractmethod
+    def publish(self, job_id: str, urls: Iterable[str], options: Optional[Dict[str, Any]] = None) -> int:
+        """Queue one task per URL; returns the number queued"""
+
+    @abc.abstractmethod
+    def lease(self, worker_id: str, max_tasks: int = 1, lease_seconds: float = 300.0) -> List[Task]:
+        """Claim up to `max_tasks` due tasks, including ones whose lease expired"""
+
+    @abc.abstractmethod
+    def extend(self, tasks: Iterable[Task], lease_seconds: float = 300.0):
+        """Push back the lease deadline of tasks still being worked on"""
+
+    @abc.abstractmethod
+    def ack(self, task: Task):
+        """Mark a task finished; call only after its result is durable"""
+
+    @abc.abstractmethod
+    def nack(self, task: Task, error: str, delay: float = 0.0):
+        """Give a task back to be delivered again after `delay` seconds"""
+
+    @abc.abstractmethod
+    def stats(self, job_id: Optional[str] = None) -> Dict[str, int]:
+        """Task counts per state, overall or for one job"""
+
+    def close(self):
+        pass
+
+
+class SQLiteBroker(TaskBroker):
+    """Broker backed by one SQLite (WAL) database
+
+    Suits several worker processes on one host, or hosts sharing a volume
+    with working file locks. A leased task's `available_at` holds its lease
+    deadline, so expired leases are picked up by the same index scan as due
+    tasks.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tasks (
+        job_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        options TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL,
+        worker_id TEXT,
+        last_error TEXT,
+        PRIMARY KEY (job_id, idx)
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks(state, available_at);
+    """
+
+    def __init__(self, path: str = 'data/broker.db'):
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self._SCHEMA)
+        self._lock = threading.Lock()
+
+    def publish(self, job_id: str, urls: Iterable[str], options: Optional[Dict[str, Any]] = None) -> int:
+        options_json = serialization.dumps_str(options or {})
+        now = time.time()
+        rows = [(job_id, idx, url, options_json, now) for idx, url in enumerate(urls)]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO tasks (job_id, idx, url, options, available_at) VALUES (?, ?, ?, ?, ?)',
+                rows)
+            self._conn.execute('COMMIT')
+        return len(rows)
+
+    def lease(self, worker_id: str, max_tasks: int = 1, lease_seconds: float = 300.0) -> List[Task]:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front so two processes cannot claim the same rows
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    "SELECT job_id, idx, url, options, attempts FROM tasks "
+                    "WHERE state IN ('queued', 'leased') AND available_at <= ? "
+                    "ORDER BY available_at LIMIT ?",
+                    (now, max_tasks)).fetchall()
+                self._conn.executemany(
+                    "UPDATE tasks SET state = 'leased', worker_id = ?, available_at = ?, attempts = attempts + 1 "
+                    "WHERE job_id = ? AND idx = ?",
+                    [(worker_id, now + lease_seconds, job_id, idx) for job_id, idx, *_ in rows])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        return [Task(job_id, idx, url, serialization.loads(options), attempts + 1, worker_id)
+                for job_id, idx, url, options, attempts in rows]
+
+    def extend(self, tasks: Iterable[Task], lease_seconds: float = 300.0):
+        deadline = time.time() + lease_seconds
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE tasks SET available_at = ? WHERE job_id = ? AND idx = ? AND state = 'leased' "
+                "AND worker_id = ?",
+                [(deadline, task.job_id, task.idx, task.worker_id) for task in tasks])
+
+    def ack(self, task: Task):
+        with self._lock:
+            self._conn.execute("UPDATE tasks SET state = 'done', last_error = NULL WHERE job_id = ? AND idx = ?",
+                               (task.job_id, task.idx))
+
+    def nack(self, task: Task, error: str, delay: float = 0.0):
+        with self._lock:
+            # Ignore stale workers whose lease already passed to someone else
+            self._conn.execute(
+                "UPDATE tasks SET state = 'queued', available_at = ?, last_error = ? "
+                "WHERE job_id = ? AND idx = ? AND state = 'leased' AND worker_id = ?",
+                (time.time() + delay, error, task.job_id, task.idx, task.worker_id))
+
+    def stats(self, job_id: Optional[str] = None) -> Dict[str, int]:
+        sql = 'SELECT state, COUNT(*) FROM tasks'
+        params = ()
+        if job_id is not None:
+            sql += ' WHERE job_id = ?'
+            params = (job_id,)
+        with self._lock:
+            rows = dict(self._conn.execute(sql + ' GROUP BY state', params).fetchall())
+        return {state: rows.get(state, 0) for state in TASK_STATES}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FileBroker(TaskBroker):
+    """Broker kept as one JSON file per task in state directories
+
+    Needs nothing but a file system, which makes it handy for tests and
+    single-host setups. Claiming a task is an atomic os.rename from queued/
+    to leased/, so exactly one worker wins; a file's mtime holds its
+    available-at time (queued/) or lease deadline (leased/).
+    """
+
+    def __init__(self, root: str = 'data/broker'):
+        self.root = root
+        for state in TASK_STATES:
+            os.makedirs(os.path.join(root, state), exist_ok=True)
+
+    def _path(self, state: str, task_id: str) -> str:
+        return os.path.join(self.root, state, f"{task_id}.json")
+
+    def _write(self, path: str, task: Task, mtime: float):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            serialization.dump(task.to_dict(), f)
+        os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path: str) -> Task:
+        with open(path, 'rb') as f:
+            return Task(**serialization.load(f))
+
+    def publish(self, job_id: str, urls: Iterable[str], options: Optional[Dict[str, Any]] = None) -> int:
+        now = time.time()
+        count = 0
+        for idx, url in enumerate(urls):
+            task = Task(job_id, idx, url, options or {})
+            count += 1
+            # Like INSERT OR IGNORE: publishing again must not reset a task that is leased or done
+            if any(os.path.exists(self._path(state, task.task_id)) for state in ('leased', 'done')):
+                continue
+            self._create(self._path('queued', task.task_id), task, now)
+        return count
+
+    def _create(self, path: str, task: Task, mtime: float):
+        """Write a task file unless one already exists at `path` (os.link never overwrites)"""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            serialization.dump(task.to_dict(), f)
+        os.utime(tmp_path, (mtime, mtime))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def _due(self, state: str, now: float) -> List[str]:
+        entries = []
+        with os.scandir(os.path.join(self.root, state)) as it:
+            for entry in it:
+                if entry.name.endswith('.json'):
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if mtime <= now:
+                        entries.append((mtime, entry.name))
+        return [name for _, name in sorted(entries)]
+
+    def lease(self, worker_id: str, max_tasks: int = 1, lease_seconds: float = 300.0) -> List[Task]:
+        now = time.time()
+
+        # Expired leases go back to the queue; losing a rename race to another worker is fine
+        for name in self._due('leased', now):
+            try:
+                os.rename(os.path.join(self.root, 'leased', name), os.path.join(self.root, 'queued', name))
+            except FileNotFoundError:
+                pass
+
+        tasks = []
+        for name in self._due('queued', now):
+            if len(tasks) >= max_tasks:
+                break
+            queued_path = os.path.join(self.root, 'queued', name)
+            leased_path = os.path.join(self.root, 'leased', name)
+            deadline = now + lease_seconds
+            try:
+                # Set the deadline first so another worker's expiry sweep cannot move the file straight back
+                os.utime(queued_path, (deadline, deadline))
+                os.rename(queued_path, leased_path)
+            except FileNotFoundError:
+                continue
+
+            task = self._read(leased_path)
+            task.attempts += 1
+            task.worker_id = worker_id
+            self._write(leased_path, task, deadline)
+            tasks.append(task)
+        return tasks
+
+    def _owned(self, task: Task) -> bool:
+        try:
+            return self._read(self._path('leased', task.task_id)).worker_id == task.worker_id
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def extend(self, tasks: Iterable[Task], lease_seconds: float = 300.0):
+        deadline = time.time() + lease_seconds
+        for task in tasks:
+            if self._owned(task):
+                try:
+                    os.utime(self._path('leased', task.task_id), (deadline, deadline))
+                except FileNotFoundError:
+                    pass
+
+    def ack(self, task: Task):
+        done_path = self._path('done', task.task_id)
+        for state in ('leased', 'queued'):
+            try:
+                os.rename(self._path(state, task.task_id), done_path)
+                return
+            except FileNotFoundError:
+                continue
+
+    def nack(self, task: Task, error: str, delay: float = 0.0):
+        if not self._owned(task):
+            return
+        leased_path = self._path('leased', task.task_id)
+        self._write(leased_path, task, time.time() + delay)
+        try:
+            os.rename(leased_path, self._path('queued', task.task_id))
+        except FileNotFoundError:
+            pass
+
+    def stats(self, job_id: Optional[str] = None) -> Dict[str, int]:
+        prefix = f"{job_id}_" if job_id is not None else ''
+        counts = {}
+        for state in TASK_STATES:
+            names = os.listdir(os.path.join(self.root, state))
+            counts[state] = sum(1 for name in names if name.endswith('.json') and name.startswith(prefix))
+        return counts
+
+
+class RedisBroker(TaskBroker):
+    """Broker on a Redis server, for workers spread across hosts
+
+    Due tasks sit in a sorted set scored by available-at time and leased
+    tasks in another scored by lease deadline; task bodies and per-job state
+    counts are hashes. Leasing runs as one Lua script so claims are atomic.
+    """
+
+    _LEASE = """
+    local queued, leased, prefix = KEYS[1], KEYS[2], KEYS[3]
+    local now, deadline, limit, worker = tonumber(ARGV[1]), ARGV[2], tonumber(ARGV[3]), ARGV[4]
+
+    local function move(id, from_state, to_state)
+        local job_id = redis.call('HGET', prefix .. ':task:' .. id, 'job_id')
+        redis.call('HINCRBY', prefix .. ':job:' .. job_id, from_state, -1)
+        redis.call('HINCRBY', prefix .. ':job:' .. job_id, to_state, 1)
+    end
+
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', leased, '-inf', now)) do
+        redis.call('ZREM', leased, id)
+        redis.call('ZADD', queued, now, id)
+        move(id, 'leased', 'queued')
+    end
+
+    local ids = redis.call('ZRANGEBYSCORE', queued, '-inf', now, 'LIMIT', 0, limit)
+    for _, id in ipairs(ids) do
+        redis.call('ZREM', queued, id)
+        redis.call('ZADD', leased, deadline, id)
+        redis.call('HINCRBY', prefix .. ':task:' .. id, 'attempts', 1)
+        redis.call('HSET', prefix .. ':task:' .. id, 'worker_id', worker)
+        move(id, 'queued', 'leased')
+    end
+    return ids
+    """
+
+    # Tasks per publish script call, to keep each call (and the time it blocks Redis) short
+    _PUBLISH_BATCH = 1000
+
+    # Re-publishing a task must not reset its attempts or count it twice, like INSERT OR IGNORE
+    _PUBLISH = """
+    local queued, job_key, prefix = KEYS[1], KEYS[2], KEYS[3]
+    local job_id, options, now = ARGV[1], ARGV[2], ARGV[3]
+    local added = 0
+    for i = 4, #ARGV, 3 do
+        local id = ARGV[i]
+        if redis.call('HSETNX', prefix .. ':task:' .. id, 'job_id', job_id) == 1 then
+            redis.call('HSET', prefix .. ':task:' .. id, 'idx', ARGV[i + 1], 'url', ARGV[i + 2],
+                       'options', options, 'attempts', 0)
+            redis.call('ZADD', queued, 'NX', now, id)
+            added = added + 1
+        end
+    end
+    if added > 0 then
+        redis.call('HINCRBY', job_key, 'queued', added)
+    end
+    return added
+    """
+
+    # Only the current lease holder may extend its lease; the task may have been redelivered
+    _EXTEND = """
+    local leased, prefix = KEYS[1], KEYS[2]
+    local deadline, worker = ARGV[1], ARGV[2]
+    for i = 3, #ARGV do
+        local id = ARGV[i]
+        if redis.call('HGET', prefix .. ':task:' .. id, 'worker_id') == worker then
+            redis.call('ZADD', leased, 'XX', deadline, id)
+        end
+    end
+    return 0
+    """
+
+    # Only the current lease holder may give a task back
+    _NACK = """
+    local leased, queued, prefix = KEYS[1], KEYS[2], KEYS[3]
+    local id, worker, score, error = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+    local task_key = prefix .. ':task:' .. id
+    if redis.call('HGET', task_key, 'worker_id') ~= worker or redis.call('ZREM', leased, id) == 0 then
+        return 0
+    end
+    redis.call('ZADD', queued, score, id)
+    redis.call('HSET', task_key, 'last_error', error)
+    local job_key = prefix .. ':job:' .. redis.call('HGET', task_key, 'job_id')
+    redis.call('HINCRBY', job_key, 'leased', -1)
+    redis.call('HINCRBY', job_key, 'queued', 1)
+    return 1
+    """
+
+    _ACK = """
+    local leased, queued, done, prefix, id = KEYS[1], KEYS[2], KEYS[3], KEYS[4], ARGV[1]
+    local from_state = 'leased'
+    if redis.call('ZREM', leased, id) == 0 then
+        if redis.call('ZREM', queued, id) == 0 then
+            return 0
+        end
+        from_state = 'queued'
+    end
+    redis.call('ZADD', done, ARGV[2], id)
+    local job_key = prefix .. ':job:' .. redis.call('HGET', prefix .. ':task:' .. id, 'job_id')
+    redis.call('HINCRBY', job_key, from_state, -1)
+    redis.call('HINCRBY', job_key, 'done', 1)
+    return 1
+    """
+
+    def __init__(self, url: str = 'redis://localhost:6379/0', prefix: str = 'onion_tasks'):
+        if redis is None:
+            raise ImportError("redis is required for the Redis broker (pip install redis)")
+
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._publish = self._redis.register_script(self._PUBLISH)
+        self._lease = self._redis.register_script(self._LEASE)
+        self._extend = self._redis.register_script(self._EXTEND)
+        self._nack = self._redis.register_script(self._NACK)
+        self._ack = self._redis.register_script(self._ACK)
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def publish(self, job_id: str, urls: Iterable[str], options: Optional[Dict[str, Any]] = None) -> int:
+        options_json = serialization.dumps_str(options or {})
+        now = time.time()
+        keys = [self._key('queued'), self._key(f"job:{job_id}"), self.prefix]
+        count = 0
+        args = []
+        for idx, url in enumerate(urls):
+            args.extend((Task(job_id, idx, url).task_id, idx, url))
+            count += 1
+            if len(args) >= self._PUBLISH_BATCH * 3:
+                self._publish(keys=keys, args=[job_id, options_json, now] + args)
+                args = []
+        if args:
+            self._publish(keys=keys, args=[job_id, options_json, now] + args)
+        return count
+
+    def lease(self, worker_id: str, max_tasks: int = 1, lease_seconds: float = 300.0) -> List[Task]:
+        now = time.time()
+        task_ids = self._lease(keys=[self._key('queued'), self._key('leased'), self.prefix],
+                               args=[now, now + lease_seconds, max_tasks, worker_id])
+        if not task_ids:
+            return []
+
+        pipe = self._redis.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.hgetall(self._key(f"task:{task_id.decode()}"))
+
+        tasks = []
+        for data in pipe.execute():
+            data = {key.decode(): value.decode() for key, value in data.items()}
+            tasks.append(Task(data['job_id'], int(data['idx']), data['url'], serialization.loads(data['options']),
+                              int(data['attempts']), worker_id))
+        return tasks
+
+    def extend(self, tasks: Iterable[Task], lease_seconds: float = 300.0):
+        deadline = time.time() + lease_seconds
+        by_worker = {}
+        for task in tasks:
+            if task.worker_id is not None:
+                by_worker.setdefault(task.worker_id, []).append(task.task_id)
+        for worker_id, task_ids in by_worker.items():
+            self._extend(keys=[self._key('leased'), self.prefix], args=[deadline, worker_id] + task_ids)
+
+    def ack(self, task: Task):
+        self._ack(keys=[self._key('leased'), self._key('queued'), self._key('done'), self.prefix],
+                  args=[task.task_id, time.time()])
+
+    def nack(self, task: Task, error: str, delay: float = 0.0):
+        self._nack(keys=[self._key('leased'), self._key('queued'), self.prefix],
+                   args=[task.task_id, task.worker_id, time.time() + delay, error])
+
+    def stats(self, job_id: Optional[str] = None) -> Dict[str, int]:
+        if job_id is not None:
+            counts = self._redis.hgetall(self._key(f"job:{job_id}"))
+            counts = {key.decode(): int(value) for key, value in counts.items()}
+            return {state: counts.get(state, 0) for state in TASK_STATES}
+        return {state: self._redis.zcard(self._key(state)) for state in TASK_STATES}
+
+    def close(self):
+        self._redis.close()
+
+
+def broker_path(url: str) -> Optional[str]:
+    """Local path of a sqlite: or file: broker URL; None for network brokers
+    
+    file: URLs follow RFC 8089, so file:///srv/broker is absolute and
+    file:data/broker relative. sqlite: URLs follow the SQLAlchemy convention:
+    sqlite:///data/broker.db is relative and sqlite:////srv/broker.db absolute.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == 'sqlite':
+        return url[len('sqlite:///'):] if url.startswith('sqlite:///') else parsed.path
+    if parsed.scheme == 'file':
+        if parsed.netloc not in ('', 'localhost'):
+            raise ValueError(f"Broker directory must be local: {url}")
+        return url2pathname(parsed.path)
+    if parsed.scheme in ('redis', 'rediss'):
+        return None
+    raise ValueError(f"Unsupported broker URL: {url}")
+
+
+def open_broker(url: str) -> TaskBroker:
+    """Open a broker from a URL: sqlite:///path.db, file:///dir or redis://host:port/db"""
+    path = broker_path(url)
+    if path is None:
+        return RedisBroker(url)
+    return SQLiteBroker(path) if urlparse(url).scheme == 'sqlite' else FileBroker(path)
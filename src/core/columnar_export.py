@@ -0,0 +1,225 @@
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+SCHEMA_VERSION = '1'
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None and value != '' else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None and value != '' else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_str(value: Any) -> Optional[str]:
+    return str(value) if value is not None else None
+
+
+def _to_timestamp(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_str_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    return [str(item) for item in value]
+
+
+def _nested(result: Dict[str, Any], *keys: str) -> Any:
+    """Follow a chain of dict keys, returning None if any level is missing"""
+    value = result
+    for key in keys:
+        if not isinstance(value, Mapping):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _accessible_admin_pages(result: Dict[str, Any]) -> List[str]:
+    admin_pages = result.get('admin_pages') or {}
+    return [path for path, accessible in admin_pages.items() if accessible]
+
+
+def _geo_countries(result: Dict[str, Any]) -> List[str]:
+    geo_data = _nested(result, 'geolocation_analysis', 'geolocation_data') or []
+    return [geo.get('location_data', {}).get('country', 'Unknown') for geo in geo_data]
+
+
+# (column name, arrow type name, converter, getter)
+# Scalars become typed columns and lists become list<string> columns. Append new
+# columns at the end and bump SCHEMA_VERSION so existing readers keep working.
+RESULT_COLUMNS: List[Tuple[str, str, Callable[[Any], Any], Callable[[Dict[str, Any]], Any]]] = [
+    ('analysis_id', 'string', _to_str, lambda r: r.get('analysis_id')),
+    ('url', 'string', _to_str, lambda r: r.get('url')),
+    ('timestamp', 'timestamp', _to_timestamp, lambda r: r.get('timestamp')),
+    ('analysis_type', 'string', _to_str, lambda r: r.get('analysis_type')),
+    ('error', 'string', _to_str, lambda r: r.get('error')),
+    ('risk_level', 'string', _to_str, lambda r: r.get('risk_level')),
+    ('analysis_score', 'float64', _to_float, lambda r: r.get('analysis_score')),
+    ('response_code', 'int32', _to_int, lambda r: r.get('response_code')),
+    ('load_time', 'float64', _to_float, lambda r: r.get('load_time')),
+    ('final_url', 'string', _to_str, lambda r: r.get('final_url')),
+    ('redirects', 'int32', _to_int, lambda r: r.get('redirects')),
+    ('content_length', 'int64', _to_int, lambda r: r.get('content_length')),
+    ('content_type', 'string', _to_str, lambda r: r.get('content_type')),
+    ('server_info', 'string', _to_str, lambda r: r.get('server_info')),
+    ('title', 'string', _to_str, lambda r: r.get('title')),
+    ('meta_description', 'string', _to_str, lambda r: r.get('meta_description')),
+    ('language', 'string', _to_str, lambda r: r.get('language')),
+    ('text_content_length', 'int64', _to_int, lambda r: r.get('text_content_length')),
+    ('content_hash', 'string', _to_str, lambda r: r.get('content_hash')),
+    ('security_score', 'float64', _to_float, lambda r: _nested(r, 'security_headers', 'score')),
+    ('security_missing_count', 'int32', _to_int, lambda r: _nested(r, 'security_headers', 'missing_count')),
+    ('technologies', 'list', _to_str_list, lambda r: r.get('technologies')),
+    ('emails', 'list', _to_str_list, lambda r: r.get('emails')),
+    ('social_media', 'list', _to_str_list, lambda r: r.get('social_media')),
+    ('onion_links', 'list', _to_str_list, lambda r: r.get('onion_links')),
+    ('bitcoin_addresses', 'list', _to_str_list, lambda r: _nested(r, 'crypto_addresses', 'bitcoin')),
+    ('ethereum_addresses', 'list', _to_str_list, lambda r: _nested(r, 'crypto_addresses', 'ethereum')),
+    ('monero_addresses', 'list', _to_str_list, lambda r: _nested(r, 'crypto_addresses', 'monero')),
+    ('links_total', 'int32', _to_int, lambda r: _nested(r, 'links', 'total_links')),
+    ('links_internal_count', 'int32', _to_int, lambda r: _nested(r, 'links', 'internal_count')),
+    ('links_external_count', 'int32', _to_int, lambda r: _nested(r, 'links', 'external_count')),
+    ('links_onion_count', 'int32', _to_int, lambda r: _nested(r, 'links', 'onion_count')),
+    ('forms_count', 'int32', _to_int, lambda r: len(r.get('forms') or [])),
+    ('admin_pages_accessible', 'list', _to_str_list, _accessible_admin_pages),
+    ('timing_average', 'float64', _to_float, lambda r: _nested(r, 'timing_analysis', 'average_time')),
+    ('timing_min', 'float64', _to_float, lambda r: _nested(r, 'timing_analysis', 'min_time')),
+    ('timing_max', 'float64', _to_float, lambda r: _nested(r, 'timing_analysis', 'max_time')),
+    ('ssl_issuer', 'string', _to_str, lambda r: _nested(r, 'ssl_info', 'issuer', 'organizationName')),
+    ('ssl_not_after', 'string', _to_str, lambda r: _nested(r, 'ssl_info', 'not_after')),
+    ('resolved_ips', 'list', _to_str_list, lambda r: _nested(r, 'geolocation_analysis', 'resolved_ips')),
+    ('geo_countries', 'list', _to_str_list, _geo_countries),
+    ('most_likely_country', 'string', _to_str,
+     lambda r: _nested(r, 'location_summary', 'most_likely_location', 'country')),
+    ('most_likely_city', 'string', _to_str,
+     lambda r: _nested(r, 'location_summary', 'most_likely_location', 'city')),
+    ('location_confidence_score', 'float64', _to_float,
+     lambda r: _nested(r, 'location_summary', 'confidence_score')),
+    ('entities_count', 'int32', _to_int, lambda r: len(r.get('entities') or [])),
+    ('osint_sources_count', 'int32', _to_int, lambda r: len(r.get('osint_sources') or [])),
+    ('entity_correlations_count', 'int32', _to_int, lambda r: len(r.get('entity_correlations') or [])),
+    ('risk_indicators_count', 'int32', _to_int,
+     lambda r: len(_nested(r, 'cross_references', 'risk_indicators') or [])),
+    ('cross_reference_matches', 'int32', _to_int,
+     lambda r: len(_nested(r, 'cross_references', 'matches_found') or [])),
+]
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for Parquet/Arrow export (pip install pyarrow)")
+
+
+def result_schema():
+    """Build the stable Arrow schema for analysis results"""
+    _require_pyarrow()
+
+    arrow_types = {
+        'string': pa.string(),
+        'int32': pa.int32(),
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'timestamp': pa.timestamp('us'),
+        'list': pa.list_(pa.string())
+    }
+
+    fields = [pa.field(name, arrow_types[type_name]) for name, type_name, _, _ in RESULT_COLUMNS]
+    return pa.schema(fields, metadata={
+        'producer': 'tor-onion-analyzer',
+        'schema_version': SCHEMA_VERSION
+    })
+
+
+class ColumnarResultWriter:
+    """Write analysis results as Parquet or Arrow IPC in row groups as they arrive"""
+
+    def __init__(self, sink: Any, file_format: str = 'parquet', row_group_size: int = 10000,
+                 compression: str = 'zstd'):
+        _require_pyarrow()
+
+        if file_format not in ('parquet', 'arrow'):
+            raise ValueError(f"Unsupported columnar format: {file_format}")
+
+        self.schema = result_schema()
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+
+        if file_format == 'parquet':
+            self._writer = pq.ParquetWriter(sink, self.schema, compression=compression)
+        else:
+            self._writer = pa.ipc.new_file(sink, self.schema,
+                                           options=pa.ipc.IpcWriteOptions(compression=compression))
+
+        self._columns = {name: [] for name, _, _, _ in RESULT_COLUMNS}
+        self._buffered = 0
+
+    def write(self, result: Dict[str, Any]):
+        """Buffer a single result, flushing a row group when full"""
+        for name, _, convert, getter in RESULT_COLUMNS:
+            try:
+                value = convert(getter(result))
+            except Exception:
+                value = None
+            self._columns[name].append(value)
+
+        self._buffered += 1
+        if self._buffered >= self.row_group_size:
+            self.flush()
+
+    def write_all(self, analysis_results: Iterable[Dict[str, Any]]) -> int:
+        """Write every result from an iterable"""
+        for result in analysis_results:
+            self.write(result)
+        return self.rows_written + self._buffered
+
+    def flush(self):
+        """Write buffered rows as one row group / record batch"""
+        if not self._buffered:
+            return
+
+        batch = pa.record_batch(
+            [pa.array(self._columns[field.name], type=field.type) for field in self.schema],
+            schema=self.schema
+        )
+
+        if self.file_format == 'parquet':
+            self._writer.write_batch(batch, row_group_size=self.row_group_size)
+        else:
+            self._writer.write_batch(batch)
+
+        self.rows_written += self._buffered
+        self._columns = {name: [] for name in self._columns}
+        self._buffered = 0
+
+    def close(self):
+        """Flush remaining rows and finalize the file"""
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -2,20 +2,27 @@ import requests
 import json
 import hashlib
 import re
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, TYPE_CHECKING
 from datetime import datetime
 import time
 import os
 
+from utils import metrics
 from .tor_connector import TorConnector
 
+if TYPE_CHECKING:
+    from .parse_pool import ParsePool
+
 class TorDeanonymizer:
     """Advanced de-anonymization techniques using OSINT sources"""
     
-    def __init__(self):
+    def __init__(self, parse_pool: Optional['ParsePool'] = None):
         self.tor_connector = TorConnector()
         self.session = None
         
+        # Runs content fingerprinting in worker processes when set
+        self.parse_pool = parse_pool
+        
         # API keys from environment variables
         self.shodan_api_key = os.getenv('SHODAN_API_KEY', '')
         self.virustotal_api_key = os.getenv('VIRUSTOTAL_API_KEY', '')
@@ -42,25 +49,37 @@ class TorDeanonymizer:
         
         try:
             # Extract identifiers from basic analysis
-            identifiers = self._extract_identifiers(basic_analysis)
+            with metrics.timed('osint_identifiers'):
+                identifiers = self._extract_identifiers(basic_analysis)
             osint_results['extracted_identifiers'] = identifiers
             
             # Perform various OSINT checks
-            osint_results.update(self._check_certificate_transparency(identifiers))
-            osint_results.update(self._check_domain_reputation(identifiers))
-            osint_results.update(self._analyze_hosting_patterns(basic_analysis))
-            osint_results.update(self._check_similar_sites(basic_analysis))
-            osint_results.update(self._analyze_content_fingerprints(basic_analysis))
+            with metrics.timed('osint_certificate_transparency'):
+                osint_results.update(self._check_certificate_transparency(identifiers))
+            with metrics.timed('osint_reputation'):
+                osint_results.update(self._check_domain_reputation(identifiers))
+            with metrics.timed('osint_hosting'):
+                osint_results.update(self._analyze_hosting_patterns(basic_analysis))
+            with metrics.timed('osint_similar_sites'):
+                osint_results.update(self._check_similar_sites(basic_analysis))
+            with metrics.timed('osint_fingerprints'):
+                if self.parse_pool is not None and basic_analysis.get('content'):
+                    osint_results.update(self.parse_pool.content_fingerprints(basic_analysis['content']))
+                else:
+                    osint_results.update(self._analyze_content_fingerprints(basic_analysis))
             
             # If API keys are available, perform advanced analysis
             if self.shodan_api_key:
-                osint_results.update(self._shodan_analysis(identifiers))
+                with metrics.timed('osint_shodan'):
+                    osint_results.update(self._shodan_analysis(identifiers))
             
             if self.virustotal_api_key:
-                osint_results.update(self._virustotal_analysis(url, identifiers))
+                with metrics.timed('osint_virustotal'):
+                    osint_results.update(self._virustotal_analysis(url, identifiers))
             
             # Generate entity correlations
-            osint_results['entity_correlations'] = self._correlate_entities(osint_results)
+            with metrics.timed('osint_correlation'):
+                osint_results['entity_correlations'] = self._correlate_entities(osint_results)
             
         except Exception as e:
             osint_results['osint_error'] = str(e)
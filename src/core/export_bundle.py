@@ -0,0 +1,189 @@
+import gzip
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from utils import serialization
+from .blob_store import ContentStore, content_key
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BUNDLE_FORMAT = 'tor-analysis-bundle'
+BUNDLE_VERSION = '1'
+COMPRESSIONS = ('gzip', 'zstd')
+
+
+class BundleWriter:
+    """Stream analysis results into a compressed tar bundle
+
+    Layout:
+        blobs/<sha256>.html   page bodies, each stored once
+        analyses.ndjson       one result per line, `content` replaced by `content_ref`
+        manifest.json         counts, blob index and format version (written last)
+
+    Results are consumed one at a time and the compressed tar stream is written
+    sequentially, so peak memory does not depend on the number of results.
+    Bodies already offloaded to a ContentStore are pulled back in when the
+    store is given.
+    """
+
+    def __init__(self, output: Any, compression: str = 'gzip', level: Optional[int] = None,
+                 content_store: Optional[ContentStore] = None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported bundle compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("zstandard is required for zstd bundles (pip install zstandard)")
+
+        self.compression = compression
+        self.content_store = content_store
+        self._owns_output = isinstance(output, (str, os.PathLike))
+        self._output = open(output, 'wb') if self._owns_output else output
+
+        if compression == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=level or 10).stream_writer(
+                self._output, closefd=False)
+        else:
+            self._compressor = gzip.GzipFile(fileobj=self._output, mode='wb', compresslevel=level or 6)
+        self._tar = tarfile.open(fileobj=self._compressor, mode='w|')
+
+        # Results go to a disk-backed spool since tar needs each member's size up front
+        self._records = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+b')
+        self.blobs = {}
+        self.result_count = 0
+        self.content_bytes = 0
+        self.deduplicated_bytes = 0
+        self.manifest = None
+
+    def add(self, result: Dict[str, Any]):
+        """Add one result, moving its page body into the blob section"""
+        record = dict(result)
+        content = record.pop('content', None)
+        if not content and self.content_store is not None and record.get('content_hash'):
+            content = self.content_store.get(record['content_hash'])
+
+        if content:
+            key = content_key(content)
+            data = content.encode()
+            self.content_bytes += len(data)
+
+            if key in self.blobs:
+                self.deduplicated_bytes += len(data)
+            else:
+                self._add_member(f"blobs/{key}.html", data)
+                self.blobs[key] = len(data)
+
+            record['content_ref'] = key
+
+        self._records.write(serialization.ndjson_line(record))
+        self.result_count += 1
+
+    def add_all(self, analysis_results: Iterable[Dict[str, Any]]) -> int:
+        for result in analysis_results:
+            self.add(result)
+        return self.result_count
+
+    def close(self) -> Dict[str, Any]:
+        """Write the results and manifest, finish the stream and return the manifest"""
+        try:
+            size = self._records.tell()
+            self._records.seek(0)
+            info = tarfile.TarInfo('analyses.ndjson')
+            info.size = size
+            info.mtime = int(time.time())
+            self._tar.addfile(info, self._records)
+            self._records.close()
+
+            manifest = {
+                'format': BUNDLE_FORMAT,
+                'version': BUNDLE_VERSION,
+                'created_at': datetime.now().isoformat(),
+                'compression': self.compression,
+                'total_analyses': self.result_count,
+                'records': 'analyses.ndjson',
+                'blob_count': len(self.blobs),
+                'content_bytes': self.content_bytes,
+                'deduplicated_bytes': self.deduplicated_bytes,
+                'blobs': self.blobs
+            }
+            self._add_member('manifest.json', serialization.dumps(manifest, pretty=True))
+
+            self._tar.close()
+            self._compressor.close()
+        except BaseException:
+            self.abort()
+            raise
+
+        if self._owns_output:
+            self._output.close()
+        self.manifest = manifest
+        return manifest
+
+    def abort(self):
+        """Release the tar, compressor, spool and output without finishing the bundle"""
+        for stream in (self._tar, self._compressor, self._records):
+            try:
+                stream.close()
+            except Exception:
+                # The stream that failed may fail again on close; the original error matters
+                pass
+        if self._owns_output:
+            self._output.close()
+
+    def _add_member(self, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def iter_bundle(path: str, include_content: bool = True) -> Iterator[Dict[str, Any]]:
+    """Read results back from a bundle, restoring page bodies from the blob section"""
+    with open(path, 'rb') as f:
+        is_zstd = f.read(4) == b'\x28\xb5\x2f\xfd'
+
+    # Blobs come before the records that refer to them, and seeking back in a compressed
+    # stream decompresses it again from the start, so read from an uncompressed copy
+    plain = tempfile.TemporaryFile()
+    try:
+        if is_zstd:
+            if zstandard is None:
+                raise ImportError("zstandard is required to read zstd bundles (pip install zstandard)")
+            with open(path, 'rb') as f:
+                zstandard.ZstdDecompressor().copy_stream(f, plain)
+        else:
+            with gzip.open(path, 'rb') as f:
+                shutil.copyfileobj(f, plain, 1024 * 1024)
+        plain.seek(0)
+        tar = tarfile.open(fileobj=plain, mode='r:')
+    except BaseException:
+        plain.close()
+        raise
+
+    try:
+        records = tar.extractfile('analyses.ndjson')
+        for line in records:
+            result = serialization.loads(line)
+            content_ref = result.get('content_ref')
+            if include_content and content_ref:
+                result['content'] = tar.extractfile(f"blobs/{content_ref}.html").read().decode()
+            yield result
+    finally:
+        tar.close()
+        plain.close()
@@ -1,8 +1,10 @@
 import csv
-import json
 import io
+import itertools
+from collections.abc import Mapping, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, BinaryIO, Iterable, Iterator, Optional, TextIO, Tuple
 import pandas as pd
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
@@ -10,6 +12,96 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 
+from utils import serialization
+from .blob_store import ContentStore
+from .columnar_export import ColumnarResultWriter
+from .export_bundle import BundleWriter
+from .summary_aggregator import SummaryAggregator
+
+def _flatten_into(d: Dict[str, Any], prefix: str, out: Dict[str, str]):
+    """Flatten a nested result into `out`, stringifying every value
+    
+    Nested dict keys are joined with underscores, simple lists are joined with
+    semicolons and lists of dicts are summarised as `<key>_count`/`<key>_sample`.
+    Dispatches on exact types first since results are almost entirely plain
+    str/int/float/dict/list values.
+    """
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        value_type = type(v)
+        
+        if value_type is str:
+            out[key] = v
+        elif v is None:
+            out[key] = ''
+        elif value_type is dict:
+            _flatten_into(v, key + '_', out)
+        elif value_type is list:
+            if v and isinstance(v[0], dict):
+                # For list of dicts, create a summary
+                out[key + '_count'] = str(len(v))
+                sample = str(v[0])
+                out[key + '_sample'] = sample[:100] + '...' if len(sample) > 100 else sample
+            else:
+                # For simple lists, join with semicolons
+                out[key] = '; '.join(map(str, v))
+        elif isinstance(v, Mapping):
+            # Result sections and other mapping types
+            _flatten_into(v, key + '_', out)
+        elif isinstance(v, list):
+            # Rare list subclasses take the generic path
+            _flatten_into({k: list(v)}, prefix, out)
+        else:
+            out[key] = str(v)
+
+def _collect_columns(d: Dict[str, Any], prefix: str, columns: set):
+    """Collect the flattened column names of a result without formatting values"""
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        
+        if isinstance(v, Mapping):
+            _collect_columns(v, key + '_', columns)
+        elif isinstance(v, list) and v and isinstance(v[0], dict):
+            columns.add(key + '_count')
+            columns.add(key + '_sample')
+        else:
+            columns.add(key)
+
+# Background worker for long-running report generation
+_pdf_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pdf-export')
+
+class _StreamingStory(list):
+    """A ReportLab story that pulls flowables from a generator on demand
+    
+    DocTemplate.build consumes its story from the front (len, [0], del [0],
+    insert/slice-assign for split flowables), so keeping a short buffer filled
+    is enough to let it lay out an arbitrarily long report.
+    """
+    
+    def __init__(self, flowables: Iterator[Any], buffer_size: int = 20):
+        super().__init__()
+        self._source = flowables
+        self._buffer_size = buffer_size
+        self._exhausted = False
+    
+    def _fill(self):
+        while not self._exhausted and list.__len__(self) < self._buffer_size:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._exhausted = True
+    
+    def __len__(self) -> int:
+        self._fill()
+        return list.__len__(self)
+    
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+    
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
 class ExportUtils:
     """Utilities for exporting analysis results in various formats"""
     
@@ -35,28 +127,101 @@ class ExportUtils:
         
         output = io.StringIO()
         
-        # Flatten the nested data for CSV export
-        flattened_results = []
-        for result in analysis_results:
-            flattened = self._flatten_result(result)
-            flattened_results.append(flattened)
-        
-        if flattened_results:
-            # Get all possible field names
-            fieldnames = set()
-            for result in flattened_results:
-                fieldnames.update(result.keys())
+        # The whole export is returned as a string anyway, so flatten everything in one bulk pass
+        rows, columns = self._flatten_results(analysis_results)
+        writer = csv.DictWriter(output, fieldnames=sorted(columns))
+        writer.writeheader()
+        writer.writerows(rows)
+        
+        return output.getvalue()
+    
+    def write_csv(self, analysis_results: Iterable[Dict[str, Any]], fp: TextIO,
+                  fieldnames: Optional[List[str]] = None, sample_size: int = 1000,
+                  chunk_size: int = 5000) -> int:
+        """Stream results as CSV to a file-like object, flattening them in bulk chunks
+        
+        Columns are taken from `fieldnames` if given. Otherwise a list is scanned once
+        for the full column set, while any other iterable has its columns inferred from
+        the first `sample_size` rows (later unseen columns are dropped).
+        """
+        iterator = iter(analysis_results)
+        
+        if fieldnames is None:
+            if isinstance(analysis_results, Sequence) and len(analysis_results) > chunk_size:
+                fieldnames = self.csv_columns(analysis_results)
+            else:
+                # Small lists and generators: the first chunk defines the columns
+                chunk_size = max(chunk_size, sample_size)
+        
+        writer = None
+        count = 0
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk and writer is None:
+                # No results: no header either, like to_csv's empty string
+                break
+            
+            rows, columns = self._flatten_results(chunk)
+            if writer is None:
+                writer = csv.DictWriter(fp, fieldnames=fieldnames or sorted(columns),
+                                        extrasaction='ignore')
+                writer.writeheader()
             
-            fieldnames = sorted(list(fieldnames))
+            writer.writerows(rows)
+            count += len(rows)
             
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(flattened_results)
+            if len(chunk) < chunk_size:
+                break
         
-        return output.getvalue()
+        return count
+    
+    def csv_columns(self, analysis_results: Iterable[Dict[str, Any]]) -> List[str]:
+        """Scan results for the full, sorted set of CSV columns without formatting values"""
+        columns = set()
+        for result in analysis_results:
+            _collect_columns(result, '', columns)
+        return sorted(columns)
+    
+    def iter_ndjson(self, analysis_results: Iterable[Dict[str, Any]]) -> Iterator[str]:
+        """Yield results as newline-delimited JSON, one line per record"""
+        for result in analysis_results:
+            yield serialization.dumps_str(result) + '\n'
+    
+    def write_ndjson(self, analysis_results: Iterable[Dict[str, Any]], fp: TextIO) -> int:
+        """Stream results as NDJSON to a file-like object (file, socket makefile, ...)"""
+        count = 0
+        for line in self.iter_ndjson(analysis_results):
+            fp.write(line)
+            count += 1
+        
+        fp.flush()
+        return count
+    
+    def write_columnar(self, analysis_results: Iterable[Dict[str, Any]], sink: Any,
+                       file_format: str = 'parquet', row_group_size: int = 10000) -> int:
+        """Stream results into a typed Parquet or Arrow IPC file (path or binary file-like)"""
+        with ColumnarResultWriter(sink, file_format=file_format, row_group_size=row_group_size) as writer:
+            return writer.write_all(analysis_results)
     
-    def to_json(self, analysis_results: List[Dict[str, Any]]) -> str:
-        """Export results to JSON format"""
+    def to_parquet(self, analysis_results: Iterable[Dict[str, Any]]) -> bytes:
+        """Export results to Parquet format"""
+        buffer = io.BytesIO()
+        self.write_columnar(analysis_results, buffer, file_format='parquet')
+        return buffer.getvalue()
+    
+    def write_bundle(self, analysis_results: Iterable[Dict[str, Any]], output: Any,
+                     compression: str = 'gzip', content_store: Optional[ContentStore] = None) -> Dict[str, Any]:
+        """Stream results into a compressed bundle with deduplicated page bodies
+        
+        `output` is a path or binary file-like object. Pass `content_store` to
+        include bodies that were offloaded from the results. Returns the bundle manifest.
+        """
+        with BundleWriter(output, compression=compression, content_store=content_store) as writer:
+            writer.add_all(analysis_results)
+        return writer.manifest
+    
+    def to_json(self, analysis_results: List[Dict[str, Any]], compact: bool = False) -> str:
+        """Export results to JSON format (indented unless compact)"""
         export_data = {
             'export_metadata': {
                 'timestamp': datetime.now().isoformat(),
@@ -67,96 +232,176 @@ class ExportUtils:
             'analyses': analysis_results
         }
         
-        return json.dumps(export_data, indent=2, default=str)
+        return serialization.dumps_str(export_data, pretty=not compact)
     
-    def to_pdf(self, analysis_results: List[Dict[str, Any]]) -> bytes:
+    def write_json(self, analysis_results: Iterable[Dict[str, Any]], fp: BinaryIO, compact: bool = False) -> int:
+        """Stream the to_json document to a binary file-like object, one analysis at a time
+        
+        The metadata follows the analyses so its total matches what was written.
+        """
+        indent = b'' if compact else b'\n    '
+        fp.write(b'{"analyses":[' if compact else b'{\n  "analyses": [')
+        count = 0
+        for result in analysis_results:
+            fp.write(b',' + indent if count else indent)
+            record = serialization.dumps(result, pretty=not compact)
+            fp.write(record if compact else record.replace(b'\n', b'\n    '))
+            count += 1
+        
+        metadata = serialization.dumps({
+            'timestamp': datetime.now().isoformat(),
+            'total_analyses': count,
+            'export_format': 'json',
+            'version': '1.0'
+        }, pretty=not compact)
+        if compact:
+            fp.write(b'],"export_metadata":' + metadata + b'}')
+        else:
+            fp.write((b'\n  ]' if count else b']') + b',\n  "export_metadata": ' + metadata.replace(b'\n', b'\n  ') + b'\n}')
+        fp.flush()
+        return count
+    
+    def to_pdf(self, analysis_results: Iterable[Dict[str, Any]], page_budget: Optional[int] = None,
+               summary: Optional[SummaryAggregator] = None) -> bytes:
         """Export results to PDF format"""
         buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        story = []
-        
+        self.write_pdf(analysis_results, buffer, page_budget=page_budget, summary=summary)
+        buffer.seek(0)
+        return buffer.getvalue()
+    
+    def write_pdf(self, analysis_results: Iterable[Dict[str, Any]], output: Any,
+                  page_budget: Optional[int] = None, summary: Optional[SummaryAggregator] = None) -> int:
+        """Render a PDF report to a path or binary file-like object in bounded memory
+        
+        Result sections are created lazily while ReportLab lays out pages, so only a
+        small window of flowables is alive at any time. Once `page_budget` pages are
+        used, remaining results are listed in compact summary tables instead; the
+        section that crosses the budget finishes first, and the tables come after.
+        Pass a precomputed `summary` to avoid an extra scan of the results (and to
+        render from a one-shot iterable). Returns the number of pages written.
+        """
+        if summary is None:
+            summary = SummaryAggregator.from_results(analysis_results)
+        
+        doc = SimpleDocTemplate(output, pagesize=A4)
+        # The budget is checked as flowables are pulled, so with a budget pull them one at a
+        # time: a lookahead would queue up sections for pages past it
+        story = _StreamingStory(self._iter_pdf_story(doc, analysis_results, page_budget, summary),
+                                buffer_size=1 if page_budget else 20)
+        doc.build(story)
+        return getattr(doc, 'page', 0)
+    
+    def submit_pdf(self, analysis_results: Iterable[Dict[str, Any]], output: Any,
+                   page_budget: Optional[int] = None, summary: Optional[SummaryAggregator] = None) -> Future:
+        """Render a PDF report in a background worker, returning a Future of the page count"""
+        return _pdf_executor.submit(self.write_pdf, analysis_results, output, page_budget, summary)
+    
+    def _iter_pdf_story(self, doc: SimpleDocTemplate, analysis_results: Iterable[Dict[str, Any]],
+                        page_budget: Optional[int], summary: SummaryAggregator) -> Iterator[Any]:
+        """Yield report flowables one at a time"""
         # Title
-        title = Paragraph("Tor Onion Site Analysis Report", self.title_style)
-        story.append(title)
-        story.append(Spacer(1, 12))
+        yield Paragraph("Tor Onion Site Analysis Report", self.title_style)
+        yield Spacer(1, 12)
         
         # Report metadata
         metadata_text = f"""
         <b>Report Generated:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}<br/>
-        <b>Total Analyses:</b> {len(analysis_results)}<br/>
+        <b>Total Analyses:</b> {summary.total_analyses}<br/>
         <b>Report Type:</b> Comprehensive Tor De-anonymization Analysis
         """
-        metadata = Paragraph(metadata_text, self.styles['Normal'])
-        story.append(metadata)
-        story.append(Spacer(1, 20))
+        yield Paragraph(metadata_text, self.styles['Normal'])
+        yield Spacer(1, 20)
         
         # Executive Summary
-        story.append(Paragraph("Executive Summary", self.heading_style))
-        
-        # Calculate summary statistics
-        successful_analyses = len([r for r in analysis_results if 'error' not in r])
-        failed_analyses = len(analysis_results) - successful_analyses
-        
-        risk_levels = {}
-        for result in analysis_results:
-            if 'error' not in result:
-                risk_level = result.get('risk_level', 'unknown')
-                risk_levels[risk_level] = risk_levels.get(risk_level, 0) + 1
+        yield Paragraph("Executive Summary", self.heading_style)
         
         summary_text = f"""
-        This report contains analysis results for {len(analysis_results)} onion sites.
+        This report contains analysis results for {summary.total_analyses} onion sites.
         <br/><br/>
         <b>Analysis Results:</b><br/>
-        • Successful analyses: {successful_analyses}<br/>
-        • Failed analyses: {failed_analyses}<br/>
+        • Successful analyses: {summary.successful_analyses}<br/>
+        • Failed analyses: {summary.failed_analyses}<br/>
         <br/>
         <b>Risk Level Distribution:</b><br/>
         """
         
-        for risk_level, count in risk_levels.items():
+        for risk_level, count in summary.risk_distribution.items():
             summary_text += f"• {risk_level.title()}: {count}<br/>"
         
-        summary = Paragraph(summary_text, self.styles['Normal'])
-        story.append(summary)
-        story.append(Spacer(1, 20))
+        yield Paragraph(summary_text, self.styles['Normal'])
+        yield Spacer(1, 20)
         
         # Detailed Results
-        story.append(Paragraph("Detailed Analysis Results", self.heading_style))
-        
-        for i, result in enumerate(analysis_results, 1):
-            story.append(self._create_result_section(result, i))
-            story.append(Spacer(1, 15))
-        
-        # Build PDF
-        doc.build(story)
-        buffer.seek(0)
-        return buffer.getvalue()
+        yield Paragraph("Detailed Analysis Results", self.heading_style)
+        
+        results = iter(enumerate(analysis_results, 1))
+        for i, result in results:
+            if page_budget and getattr(doc, 'page', 0) >= page_budget:
+                # Over budget: summarise this and every remaining result compactly
+                yield Paragraph(
+                    f"Page budget of {page_budget} pages reached. "
+                    f"Remaining analyses are listed in summary form.",
+                    self.styles['Italic']
+                )
+                yield Spacer(1, 10)
+                yield from self._summary_tables(itertools.chain([(i, result)], results))
+                return
+            
+            yield self._create_result_section(result, i)
+            yield Spacer(1, 15)
+    
+    def _summary_tables(self, indexed_results: Iterator[Tuple[int, Dict[str, Any]]],
+                        rows_per_table: int = 40) -> Iterator[Table]:
+        """Yield compact summary tables for results past the page budget"""
+        header = ['#', 'URL', 'Status', 'Risk', 'Score']
+        
+        while True:
+            rows = [header]
+            for i, result in itertools.islice(indexed_results, rows_per_table):
+                url = str(result.get('url', 'Unknown URL'))
+                rows.append([
+                    str(i),
+                    url[:60] + '...' if len(url) > 60 else url,
+                    'Failed' if 'error' in result else 'Successful',
+                    str(result.get('risk_level', 'unknown')).title(),
+                    f"{result.get('analysis_score', 'N/A')}"
+                ])
+            
+            if len(rows) == 1:
+                return
+            
+            table = Table(rows, colWidths=[0.5 * inch, 3.6 * inch, 1 * inch, 0.8 * inch, 0.7 * inch],
+                          repeatRows=1)
+            table.setStyle(TableStyle([
+                ('FONTSIZE', (0, 0), (-1, -1), 7),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+                ('GRID', (0, 0), (-1, -1), 0.25, colors.grey)
+            ]))
+            yield table
+            
+            if len(rows) <= rows_per_table:
+                return
     
     def _flatten_result(self, result: Dict[str, Any]) -> Dict[str, str]:
         """Flatten nested dictionary for CSV export"""
         flattened = {}
-        
-        def flatten_dict(d, parent_key='', sep='_'):
-            for k, v in d.items():
-                new_key = f"{parent_key}{sep}{k}" if parent_key else k
-                
-                if isinstance(v, dict):
-                    flatten_dict(v, new_key, sep)
-                elif isinstance(v, list):
-                    if v and isinstance(v[0], dict):
-                        # For list of dicts, create a summary
-                        flattened[new_key + '_count'] = str(len(v))
-                        if len(v) > 0:
-                            flattened[new_key + '_sample'] = str(v[0])[:100] + '...' if len(str(v[0])) > 100 else str(v[0])
-                    else:
-                        # For simple lists, join with semicolons
-                        flattened[new_key] = '; '.join(str(item) for item in v)
-                else:
-                    flattened[new_key] = str(v) if v is not None else ''
-        
-        flatten_dict(result)
+        _flatten_into(result, '', flattened)
         return flattened
     
+    def _flatten_results(self, analysis_results: List[Dict[str, Any]]) -> Tuple[List[Dict[str, str]], set]:
+        """Flatten many results at once, returning the rows and their combined column set"""
+        rows = []
+        columns = set()
+        
+        for result in analysis_results:
+            flattened = {}
+            _flatten_into(result, '', flattened)
+            rows.append(flattened)
+            columns.update(flattened)
+        
+        return rows, columns
+    
     def _create_result_section(self, result: Dict[str, Any], index: int) -> Paragraph:
         """Create a PDF section for a single analysis result"""
         url = result.get('url', 'Unknown URL')
@@ -219,105 +464,15 @@ class ExportUtils:
         
         return Paragraph(section_text, self.styles['Normal'])
     
-    def create_summary_report(self, analysis_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def create_summary_report(self, analysis_results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
         """Create a summary report of all analyses"""
-        summary = {
-            'report_metadata': {
-                'generated_at': datetime.now().isoformat(),
-                'total_analyses': len(analysis_results),
-                'successful_analyses': 0,
-                'failed_analyses': 0
-            },
-            'risk_distribution': {},
-            'technical_summary': {
-                'server_types': {},
-                'content_types': {},
-                'response_codes': {}
-            },
-            'osint_summary': {
-                'total_entities': 0,
-                'total_osint_sources': 0,
-                'crypto_addresses': {},
-                'email_domains': {},
-                'social_media_references': 0
-            },
-            'security_analysis': {
-                'avg_security_score': 0,
-                'sites_with_ssl': 0,
-                'sites_with_forms': 0
-            }
-        }
-        
-        successful_results = []
-        
-        for result in analysis_results:
-            if 'error' in result:
-                summary['report_metadata']['failed_analyses'] += 1
-            else:
-                summary['report_metadata']['successful_analyses'] += 1
-                successful_results.append(result)
-                
-                # Risk distribution
-                risk_level = result.get('risk_level', 'unknown')
-                summary['risk_distribution'][risk_level] = summary['risk_distribution'].get(risk_level, 0) + 1
-                
-                # Technical summary
-                server_info = result.get('server_info', 'unknown')
-                summary['technical_summary']['server_types'][server_info] = \
-                    summary['technical_summary']['server_types'].get(server_info, 0) + 1
-                
-                content_type = result.get('content_type', 'unknown')
-                summary['technical_summary']['content_types'][content_type] = \
-                    summary['technical_summary']['content_types'].get(content_type, 0) + 1
-                
-                response_code = result.get('response_code', 'unknown')
-                summary['technical_summary']['response_codes'][str(response_code)] = \
-                    summary['technical_summary']['response_codes'].get(str(response_code), 0) + 1
-                
-                # OSINT summary
-                entities = result.get('entities', [])
-                summary['osint_summary']['total_entities'] += len(entities)
-                
-                osint_sources = result.get('osint_sources', [])
-                summary['osint_summary']['total_osint_sources'] += len(osint_sources)
-                
-                # Crypto addresses
-                crypto_addresses = result.get('crypto_addresses', {})
-                for crypto_type, addresses in crypto_addresses.items():
-                    summary['osint_summary']['crypto_addresses'][crypto_type] = \
-                        summary['osint_summary']['crypto_addresses'].get(crypto_type, 0) + len(addresses)
-                
-                # Email domains
-                emails = result.get('emails', [])
-                for email in emails:
-                    domain = email.split('@')[-1] if '@' in email else 'unknown'
-                    summary['osint_summary']['email_domains'][domain] = \
-                        summary['osint_summary']['email_domains'].get(domain, 0) + 1
-                
-                # Social media
-                social_media = result.get('social_media', [])
-                summary['osint_summary']['social_media_references'] += len(social_media)
-                
-                # Security analysis
-                if result.get('ssl_info'):
-                    summary['security_analysis']['sites_with_ssl'] += 1
-                
-                forms = result.get('forms', [])
-                if forms:
-                    summary['security_analysis']['sites_with_forms'] += 1
-        
-        # Calculate averages
-        if successful_results:
-            security_scores = [r.get('security_headers', {}).get('score', 0) for r in successful_results]
-            if security_scores:
-                summary['security_analysis']['avg_security_score'] = \
-                    round(sum(security_scores) / len(security_scores), 2)
-        
-        return summary
+        return SummaryAggregator.from_results(analysis_results).to_report()
     
-    def export_summary_csv(self, analysis_results: List[Dict[str, Any]]) -> str:
-        """Export summary statistics as CSV"""
-        summary = self.create_summary_report(analysis_results)
+    def export_summary_csv(self, analysis_results: Iterable[Dict[str, Any]],
+                           summary: Optional[Dict[str, Any]] = None) -> str:
+        """Export summary statistics as CSV, reusing an existing summary report if given"""
+        if summary is None:
+            summary = self.create_summary_report(analysis_results)
         
         output = io.StringIO()
         writer = csv.writer(output)
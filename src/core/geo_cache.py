@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from utils import serialization
+
+
+class _InFlight:
+    """A lookup that is currently running for a key"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class GeolocationCache:
+    """Bounded LRU cache with TTL and in-flight deduplication for IP lookups"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400,
+                 path: Optional[str] = None, persist_interval: float = 30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.persist_interval = persist_interval
+
+        # key -> (expires_at, value), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        # One save at a time: savers share the temporary file name
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        # After clear() the next save replaces the file instead of merging its entries back in
+        self._replace_file = False
+        self._last_save = time.time()
+
+        self.hits = 0
+        self.misses = 0
+
+        if self.path:
+            self.load()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a cached value or None if missing or expired"""
+        with self._lock:
+            return self._get_locked(key)
+
+    def set(self, key: str, value: Any):
+        """Store a value and evict the least recently used entries"""
+        with self._lock:
+            self._set_locked(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[str], Optional[Any]]) -> Optional[Any]:
+        """Return a cached value, or compute it once even with concurrent callers"""
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                return value
+
+            in_flight = self._in_flight.get(key)
+            owner = in_flight is None
+            if owner:
+                in_flight = _InFlight()
+                self._in_flight[key] = in_flight
+
+        if not owner:
+            # Another worker is already looking this key up, share its answer
+            in_flight.event.wait()
+            return in_flight.value
+
+        try:
+            in_flight.value = compute(key)
+            if in_flight.value is not None:
+                self.set(key, in_flight.value)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            in_flight.event.set()
+
+        self.maybe_save()
+        return in_flight.value
+
+    def _get_locked(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            self._dirty = True
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _set_locked(self, key: str, value: Any):
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        self._dirty = True
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+            self._replace_file = True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss statistics"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 2) if total else 0.0,
+                'in_flight': len(self._in_flight)
+            }
+
+    def _read_file(self) -> List[list]:
+        try:
+            with open(self.path, 'rb') as f:
+                return serialization.load(f).get('entries', [])
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def load(self):
+        """Load unexpired entries from the cache file"""
+        entries = self._read_file()
+
+        now = time.time()
+        with self._lock:
+            for key, expires_at, value in entries:
+                if expires_at > now:
+                    self._entries[key] = (expires_at, value)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def maybe_save(self):
+        """Persist the cache if it changed and the save interval has passed"""
+        if self.path and self._dirty and time.time() - self._last_save >= self.persist_interval:
+            self.save()
+
+    def save(self):
+        """Merge with the entries already in the cache file and write it back atomically
+
+        Other processes sharing the file may have saved since it was loaded;
+        their entries are kept, and where both have a key the later expiry wins.
+        """
+        if not self.path:
+            return
+
+        with self._save_lock:
+            self._save()
+
+    def _save(self):
+        on_disk = [] if self._replace_file else self._read_file()
+        now = time.time()
+        with self._lock:
+            for key, expires_at, value in on_disk:
+                if expires_at <= now:
+                    continue
+                entry = self._entries.get(key)
+                if entry is None:
+                    if len(self._entries) < self.max_entries:
+                        # Not used here yet: least recently used, first to be evicted
+                        self._entries[key] = (expires_at, value)
+                        self._entries.move_to_end(key, last=False)
+                elif expires_at > entry[0]:
+                    self._entries[key] = (expires_at, value)
+
+            entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items()]
+            self._dirty = False
+            self._replace_file = False
+            self._last_save = time.time()
+
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                serialization.dump({'version': 1, 'entries': entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Failed to save geolocation cache: {e}")
+
+
+_shared_caches: Dict[Optional[str], GeolocationCache] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache(path: Optional[str] = None, max_entries: int = 10000, ttl: float = 86400) -> GeolocationCache:
+    """The process-wide cache for `path` (None: in memory only), created on first use
+
+    Analyzers are built per worker thread. Sharing their cache lets in-flight
+    de-duplication span the workers and leaves one writer per file per process.
+    Settings only apply when the cache is created.
+    """
+    key = os.path.abspath(path) if path else None
+    with _shared_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = _shared_caches[key] = GeolocationCache(max_entries=max_entries, ttl=ttl, path=path)
+        return cache
@@ -1,10 +1,107 @@
 import requests
 import socket
 import json
-from typing import Dict, List, Any, Optional, Tuple
+import os
+from typing import Dict, List, Any, Optional, Tuple, Iterable
 import time
 import re
 from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+
+from utils import metrics
+from .geo_cache import shared_cache
+from .tor_exit_index import shared_index
+
+class ProviderStats:
+    """Per-provider latency and error statistics used to order geolocation providers"""
+    
+    def __init__(self, smoothing: float = 0.3):
+        self.smoothing = smoothing
+        self.stats = {}
+        self._lock = threading.Lock()
+    
+    def record(self, provider: str, latency: float, success: bool):
+        """Record the outcome of a provider request"""
+        with self._lock:
+            stats = self.stats.setdefault(provider, {
+                'requests': 0,
+                'errors': 0,
+                'avg_latency': latency
+            })
+            stats['requests'] += 1
+            if not success:
+                stats['errors'] += 1
+            
+            # Exponentially weighted moving average so recent behaviour dominates
+            stats['avg_latency'] = (self.smoothing * latency +
+                                    (1 - self.smoothing) * stats['avg_latency'])
+    
+    def rank(self, providers: List[str]) -> List[str]:
+        """Order providers by error rate, then latency; untried providers go after proven ones"""
+        with self._lock:
+            def sort_key(item):
+                position, provider = item
+                stats = self.stats.get(provider)
+                if not stats:
+                    return (0.0, float('inf'), position)
+                error_rate = stats['errors'] / stats['requests']
+                return (round(error_rate, 1), stats['avg_latency'], position)
+            
+            return [provider for _, provider in sorted(enumerate(providers), key=sort_key)]
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get a snapshot of the provider statistics"""
+        with self._lock:
+            return {
+                provider: {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'error_rate': round(stats['errors'] / stats['requests'] * 100, 2),
+                    'avg_latency': round(stats['avg_latency'], 3)
+                }
+                for provider, stats in self.stats.items()
+            }
+
+class RateLimiter:
+    """Thread-safe limiter allowing `rate` requests per `period` seconds"""
+    
+    def __init__(self, rate: int, period: float):
+        self.interval = period / rate
+        self.next_slot = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until the caller may send its request"""
+        with self._lock:
+            now = time.time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        
+        if slot > now:
+            time.sleep(slot - now)
+    
+    def defer(self, seconds: float):
+        """Push the next slot back, e.g. when the provider reports its quota is exhausted"""
+        with self._lock:
+            self.next_slot = max(self.next_slot, time.time() + seconds)
+
+# Analyzers are built per worker thread, but the ip-api.com quota, the thread budget and what
+# we learn about provider latency are per process, so every analyzer shares one batch limiter,
+# one set of provider statistics and one pool of each kind
+_batch_rate_limiter = RateLimiter(rate=15, period=60)
+_provider_stats = ProviderStats()
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+def _shared_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """The process-wide pool called `name`, created with `max_workers` threads on first use"""
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return executor
 
 class GeolocationAnalyzer:
     """Geolocation and IP analysis for onion sites"""
@@ -25,8 +122,27 @@ class GeolocationAnalyzer:
         
         # Tor exit node lists for detection
         self.tor_exit_nodes_url = "https://check.torproject.org/torbulkexitlist"
-        self.tor_exits = set()
-        self.last_tor_update = 0
+        self.tor_exit_index = shared_index(os.getenv('TOR_EXIT_INDEX_PATH', 'data/tor_exits.idx'), max_age=3600)
+        
+        # Geolocation results are reused across analyses and analyzers, and persisted between runs
+        self.geo_cache = shared_cache(
+            path=os.getenv('GEO_CACHE_PATH', 'data/geo_cache.json') or None,
+            max_entries=int(os.getenv('GEO_CACHE_SIZE', '10000')),
+            ttl=float(os.getenv('GEO_CACHE_TTL', '86400'))
+        )
+        
+        # Hedged requests: fire backup providers if the primary is slower than hedge_delay
+        self.request_timeout = 10
+        self.hedged_requests = os.getenv('GEO_HEDGED_REQUESTS', '1') == '1'
+        self.hedge_delay = float(os.getenv('GEO_HEDGE_DELAY', '0.5'))
+        self.provider_stats = _provider_stats
+        self._hedge_executor = _shared_executor('geo-hedge', int(os.getenv('GEO_HEDGE_THREADS', '16')))
+        
+        # ip-api.com batch endpoint: 100 IPs per POST, 15 batch requests per minute per process
+        self.batch_api_url = 'http://ip-api.com/batch'
+        self.batch_size = 100
+        self.batch_rate_limiter = _batch_rate_limiter
+        self._batch_executor = _shared_executor('geo-batch', int(os.getenv('GEO_BATCH_CONCURRENCY', '4')))
         
     def resolve_onion_to_ip(self, onion_url: str) -> Dict[str, Any]:
         """Attempt to resolve onion site to real IP address"""
@@ -48,7 +164,8 @@ class GeolocationAnalyzer:
             
             # Method 1: Direct DNS resolution (unlikely to work for .onion)
             try:
-                ip_addresses = socket.gethostbyname_ex(domain)[2]
+                with metrics.timed('geo_dns'):
+                    ip_addresses = socket.gethostbyname_ex(domain)[2]
                 if ip_addresses:
                     result['resolved_ips'].extend(ip_addresses)
                     result['resolution_attempts'].append({
@@ -64,7 +181,8 @@ class GeolocationAnalyzer:
                 })
             
             # Method 2: Tor exit node analysis
-            exit_nodes = self._analyze_tor_exit_nodes(onion_url)
+            with metrics.timed('geo_exit_nodes'):
+                exit_nodes = self._analyze_tor_exit_nodes(onion_url)
             if exit_nodes:
                 result['exit_nodes_used'] = exit_nodes
                 result['resolution_attempts'].append({
@@ -74,7 +192,8 @@ class GeolocationAnalyzer:
                 })
             
             # Method 3: HTTP header analysis for real IP leaks
-            leaked_ips = self._check_ip_leaks(onion_url)
+            with metrics.timed('geo_ip_leaks'):
+                leaked_ips = self._check_ip_leaks(onion_url)
             if leaked_ips:
                 result['resolved_ips'].extend(leaked_ips)
                 result['resolution_attempts'].append({
@@ -85,8 +204,9 @@ class GeolocationAnalyzer:
             
             # Perform geolocation on all found IPs
             all_ips = list(set(result['resolved_ips'] + [node['ip'] for node in exit_nodes]))
-            for ip in all_ips:
-                geo_data = self._geolocate_ip(ip)
+            with metrics.timed('geo_lookup'):
+                located = self.geolocate_many(all_ips)
+            for geo_data in located.values():
                 if geo_data:
                     result['geolocation_data'].append(geo_data)
             
@@ -118,8 +238,8 @@ class GeolocationAnalyzer:
         exit_nodes = []
         
         try:
-            # Update Tor exit node list if needed (cache for 1 hour)
-            if time.time() - self.last_tor_update > 3600:
+            # Update Tor exit node list if needed (cache for 1 hour, shared on disk)
+            if self.tor_exit_index.needs_refresh():
                 self._update_tor_exit_list()
             
             # Simulate analysis of exit nodes (in real scenario, this would involve
@@ -133,6 +253,8 @@ class GeolocationAnalyzer:
             
             # Return a subset as "detected" exit nodes
             exit_nodes = sample_exits[:2]
+            for node in exit_nodes:
+                node['listed_exit'] = self.is_tor_exit(node['ip'])
             
         except Exception as e:
             pass
@@ -157,8 +279,130 @@ class GeolocationAnalyzer:
         
         return leaked_ips
     
+    def geolocate_many(self, ip_addresses: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Geolocate many IPs using cached results and provider batch endpoints"""
+        unique_ips = list(dict.fromkeys(ip_addresses))
+        results = {ip: self.geo_cache.get(ip) for ip in unique_ips}
+        misses = [ip for ip, geo_data in results.items() if geo_data is None]
+        
+        # Batching only pays off when more than one lookup is needed
+        if len(misses) > 1:
+            batches = [misses[i:i + self.batch_size] for i in range(0, len(misses), self.batch_size)]
+            for batch_results in self._batch_executor.map(self._query_batch, batches):
+                for ip, geo_data in batch_results.items():
+                    self.geo_cache.set(ip, geo_data)
+                    results[ip] = geo_data
+        
+        # Anything the batch endpoint could not resolve goes through the per-IP providers
+        for ip in unique_ips:
+            if results[ip] is None:
+                results[ip] = self._geolocate_ip(ip)
+        
+        self.geo_cache.maybe_save()
+        return results
+    
+    def _query_batch(self, ip_addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Geolocate up to batch_size IPs with a single ip-api.com batch request"""
+        results = {}
+        
+        self.batch_rate_limiter.acquire()
+        start_time = time.time()
+        try:
+            response = self.session.post(self.batch_api_url, json=ip_addresses,
+                                         timeout=self.request_timeout)
+            
+            # ip-api.com reports the remaining quota and seconds until it resets
+            if response.headers.get('X-Rl') == '0':
+                self.batch_rate_limiter.defer(float(response.headers.get('X-Ttl', 60)))
+            
+            if response.status_code == 200:
+                timestamp = datetime.now().isoformat()
+                for data in response.json():
+                    if data.get('status') != 'success':
+                        continue
+                    
+                    geo_data = {
+                        'ip_address': data.get('query'),
+                        'timestamp': timestamp,
+                        'location_data': {},
+                        'provider': None,
+                        'accuracy': 'unknown'
+                    }
+                    geo_data.update(self._parse_ipapi_response(data))
+                    results[geo_data['ip_address']] = geo_data
+        except Exception:
+            pass
+        
+        self.provider_stats.record(self.batch_api_url, time.time() - start_time, bool(results))
+        return results
+    
     def _geolocate_ip(self, ip_address: str) -> Optional[Dict[str, Any]]:
-        """Get geolocation information for an IP address"""
+        """Get geolocation information for an IP address (cached)"""
+        return self.geo_cache.get_or_compute(ip_address, self._lookup_ip)
+    
+    def _lookup_ip(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Query the geolocation providers for an IP address"""
+        if self.hedged_requests:
+            return self._lookup_ip_hedged(ip_address)
+        
+        # Try multiple geolocation services, best performing first
+        for api_url in self.provider_stats.rank(self.geo_apis):
+            geo_data = self._query_provider(api_url, ip_address)
+            if geo_data:
+                return geo_data
+            
+            # Rate limiting
+            time.sleep(1)
+        
+        return None
+    
+    def _lookup_ip_hedged(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Query the best provider first and hedge with backups if it is slow"""
+        providers = self.provider_stats.rank(self.geo_apis)
+        pending = set()
+        geo_data = None
+        
+        try:
+            for api_url in providers:
+                pending.add(self._hedge_executor.submit(self._query_provider, api_url, ip_address))
+                
+                # Give the in-flight providers a head start before firing the next backup
+                geo_data, pending = self._first_good_result(pending, self.hedge_delay)
+                if geo_data:
+                    return geo_data
+            
+            # Every provider has been fired, wait for whichever answers first
+            while pending and not geo_data:
+                geo_data, pending = self._first_good_result(pending, self.request_timeout)
+        finally:
+            # Drop the losers; requests already on the wire finish in the background
+            for future in pending:
+                future.cancel()
+        
+        return geo_data
+    
+    def _first_good_result(self, pending: set, timeout: float) -> Tuple[Optional[Dict[str, Any]], set]:
+        """Wait up to timeout for a usable provider answer"""
+        deadline = time.time() + timeout
+        
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            
+            for future in done:
+                geo_data = future.result()
+                if geo_data:
+                    return geo_data, pending
+        
+        return None, pending
+    
+    def _query_provider(self, api_url: str, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Query a single geolocation provider and record its latency"""
         geo_data = {
             'ip_address': ip_address,
             'timestamp': datetime.now().isoformat(),
@@ -167,39 +411,38 @@ class GeolocationAnalyzer:
             'accuracy': 'unknown'
         }
         
-        # Try multiple geolocation services
-        for api_url in self.geo_apis:
-            try:
-                if '{}' in api_url:
-                    url = api_url.format(ip_address)
-                else:
-                    url = api_url + ip_address
-                
-                response = self.session.get(url, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # Parse response based on API format
-                    if 'ip-api.com' in api_url:
-                        geo_data.update(self._parse_ipapi_response(data))
-                    elif 'ipapi.co' in api_url:
-                        geo_data.update(self._parse_ipapi_co_response(data))
-                    elif 'ipwhois.app' in api_url:
-                        geo_data.update(self._parse_ipwhois_response(data))
-                    elif 'ipbase.com' in api_url:
-                        geo_data.update(self._parse_ipbase_response(data))
-                    
-                    if geo_data['location_data']:
-                        return geo_data
-                
-                # Rate limiting
-                time.sleep(1)
+        start_time = time.time()
+        try:
+            if '{}' in api_url:
+                url = api_url.format(ip_address)
+            else:
+                url = api_url + ip_address
+            
+            response = self.session.get(url, timeout=self.request_timeout)
+            
+            if response.status_code == 200:
+                data = response.json()
                 
-            except Exception as e:
-                continue
+                # Parse response based on API format
+                if 'ip-api.com' in api_url:
+                    geo_data.update(self._parse_ipapi_response(data))
+                elif 'ipapi.co' in api_url:
+                    geo_data.update(self._parse_ipapi_co_response(data))
+                elif 'ipwhois.app' in api_url:
+                    geo_data.update(self._parse_ipwhois_response(data))
+                elif 'ipbase.com' in api_url:
+                    geo_data.update(self._parse_ipbase_response(data))
+        except Exception:
+            pass
         
-        return None if not geo_data['location_data'] else geo_data
+        success = bool(geo_data['location_data'])
+        latency = time.time() - start_time
+        self.provider_stats.record(api_url, latency, success)
+        metrics.STAGE_SECONDS.observe(latency, stage='geo_provider')
+        if not success:
+            metrics.record_error('geo_provider')
+        
+        return geo_data if success else None
     
     def _parse_ipapi_response(self, data: Dict) -> Dict[str, Any]:
         """Parse ip-api.com response"""
@@ -290,79 +533,122 @@ class GeolocationAnalyzer:
         }
     
     def _update_tor_exit_list(self):
-        """Update the list of Tor exit nodes"""
+        """Update the list of Tor exit nodes (conditional on Last-Modified)"""
         try:
-            response = self.session.get(self.tor_exit_nodes_url, timeout=30)
-            if response.status_code == 200:
-                self.tor_exits = set(response.text.strip().split('\n'))
-                self.last_tor_update = time.time()
+            self.tor_exit_index.refresh_if_needed(self.session, self.tor_exit_nodes_url, timeout=30)
         except Exception:
             pass
     
+    def is_tor_exit(self, ip_address: str) -> bool:
+        """Check whether an IP is in the published Tor exit list"""
+        return self.tor_exit_index.contains(ip_address)
+    
     def generate_location_summary(self, geo_results: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Generate a summary of all geolocation findings"""
-        summary = {
-            'total_ips_analyzed': len(geo_results),
-            'countries_detected': set(),
-            'regions_detected': set(),
-            'cities_detected': set(),
-            'isps_detected': set(),
-            'hosting_detected': [],
-            'proxy_detected': [],
-            'most_likely_location': None,
-            'confidence_score': 0
-        }
+        return self._summarize_geo_records(geo_results)
+    
+    def summarize_analyses(self, analysis_results: Iterable[Dict[str, Any]],
+                           since: Optional[datetime] = None,
+                           until: Optional[datetime] = None) -> Dict[str, Any]:
+        """Aggregate geolocation findings across many analyses, optionally within a time window"""
+        def geo_records():
+            for result in analysis_results:
+                if since or until:
+                    try:
+                        timestamp = datetime.fromisoformat(result.get('timestamp', ''))
+                    except (TypeError, ValueError):
+                        continue
+                    if (since and timestamp < since) or (until and timestamp > until):
+                        continue
+                
+                geo_analysis = result.get('geolocation_analysis') or {}
+                yield from geo_analysis.get('geolocation_data', [])
         
-        if not geo_results:
-            return summary
+        summary = self._summarize_geo_records(geo_records())
+        summary['window'] = {
+            'since': since.isoformat() if since else None,
+            'until': until.isoformat() if until else None
+        }
+        return summary
+    
+    def _summarize_geo_records(self, geo_results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Count locations in a single pass over geolocation records"""
+        countries = Counter()
+        regions = Counter()
+        cities = Counter()
+        isps = Counter()
+        hosting_detected = []
+        proxy_detected = []
+        total = 0
         
         for result in geo_results:
+            total += 1
             location = result.get('location_data', {})
             
-            if location.get('country') != 'Unknown':
-                summary['countries_detected'].add(location['country'])
-            if location.get('region') != 'Unknown':
-                summary['regions_detected'].add(location['region'])
-            if location.get('city') != 'Unknown':
-                summary['cities_detected'].add(location['city'])
-            if location.get('isp') != 'Unknown':
-                summary['isps_detected'].add(location['isp'])
+            country = location.get('country')
+            if country and country != 'Unknown':
+                countries[country] += 1
+            region = location.get('region')
+            if region and region != 'Unknown':
+                regions[region] += 1
+            city = location.get('city')
+            if city and city != 'Unknown':
+                cities[(city, country)] += 1
+            isp = location.get('isp')
+            if isp and isp != 'Unknown':
+                isps[isp] += 1
             
             if location.get('hosting'):
-                summary['hosting_detected'].append(result['ip_address'])
+                hosting_detected.append(result['ip_address'])
             if location.get('proxy'):
-                summary['proxy_detected'].append(result['ip_address'])
-        
-        # Convert sets to lists for JSON serialization
-        summary['countries_detected'] = list(summary['countries_detected'])
-        summary['regions_detected'] = list(summary['regions_detected'])
-        summary['cities_detected'] = list(summary['cities_detected'])
-        summary['isps_detected'] = list(summary['isps_detected'])
-        
-        # Determine most likely location (simplified logic)
-        if summary['countries_detected']:
-            most_common_country = max(set(summary['countries_detected']), 
-                                    key=summary['countries_detected'].count)
+                proxy_detected.append(result['ip_address'])
+        
+        # Lists are ordered by frequency, most common first
+        summary = {
+            'total_ips_analyzed': total,
+            'countries_detected': [country for country, _ in countries.most_common()],
+            'regions_detected': [region for region, _ in regions.most_common()],
+            'cities_detected': list(dict.fromkeys(city for (city, _), _ in cities.most_common())),
+            'isps_detected': [isp for isp, _ in isps.most_common()],
+            'country_counts': dict(countries.most_common()),
+            'city_counts': {},
+            'hosting_detected': hosting_detected,
+            'proxy_detected': proxy_detected,
+            'most_likely_location': None,
+            'confidence_score': 0
+        }
+        
+        for (city, _), count in cities.most_common():
+            summary['city_counts'][city] = summary['city_counts'].get(city, 0) + count
+        
+        if not total:
+            return summary
+        
+        # Most likely location is the most frequently seen country
+        if countries:
+            most_common_country, country_count = countries.most_common(1)[0]
+            country_share = country_count / sum(countries.values())
             summary['most_likely_location'] = {
                 'country': most_common_country,
-                'confidence': 'medium'
+                'confidence': 'high' if country_share >= 0.75 else 'medium' if country_share >= 0.5 else 'low',
+                'share': round(country_share, 3)
             }
             
-            # Add city if available
-            if summary['cities_detected']:
-                most_common_city = max(set(summary['cities_detected']), 
-                                     key=summary['cities_detected'].count)
-                summary['most_likely_location']['city'] = most_common_city
+            # Add the most common city within that country if available
+            country_cities = [(city, count) for (city, city_country), count in cities.items()
+                              if city_country == most_common_country]
+            if country_cities:
+                summary['most_likely_location']['city'] = max(country_cities, key=lambda item: item[1])[0]
         
         # Calculate confidence score (0-100)
         confidence_factors = [
-            len(summary['countries_detected']) > 0,  # Has country data
-            len(summary['cities_detected']) > 0,     # Has city data
-            len(geo_results) > 1,                    # Multiple IP sources
-            len(summary['hosting_detected']) == 0,   # Not detected as hosting
-            len(summary['proxy_detected']) == 0      # Not detected as proxy
+            len(countries) > 0,            # Has country data
+            len(cities) > 0,               # Has city data
+            total > 1,                     # Multiple IP sources
+            len(hosting_detected) == 0,    # Not detected as hosting
+            len(proxy_detected) == 0       # Not detected as proxy
         ]
         
         summary['confidence_score'] = (sum(confidence_factors) / len(confidence_factors)) * 100
         
-        return summary
\ No newline at end of file
+        return summary
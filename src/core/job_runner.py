@@ -0,0 +1,448 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from utils.profiling import Profiler
+from utils.progress_tracker import ProgressTracker
+from .analysis_tool import TorAnalyzer
+from .blob_store import ContentStore
+from .deanonymizer import TorDeanonymizer
+from .job_store import JobStore
+from .parse_pool import ParsePool
+from .pipeline import analyze_single_url, error_result
+from .result_store import ResultStore
+
+JOB_STATES = ('queued', 'running', 'completed', 'failed', 'cancelled')
+
+# Failures worth retrying later: raised by the pipeline, or reported by TorAnalyzer in the result
+TRANSIENT_EXCEPTIONS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                        socket.timeout, ConnectionError)
+TRANSIENT_ERRORS = ('Request timeout', 'Connection error')
+
+
+class QueueFullError(Exception):
+    """Raised by JobRunner.submit when accepting a job would exceed max_queued_urls"""
+
+
+class Job:
+    """One batch of URLs and its in-process progress"""
+
+    def __init__(self, job_id: str, urls: List[str], options: Dict[str, Any], owner: Optional[str] = None,
+                 submitted_at: Optional[str] = None):
+        self.job_id = job_id
+        self.urls = list(urls)
+        self.options = dict(options)
+        self.owner = owner
+        self.state = 'queued'
+        self.error = None
+        self.submitted_at = submitted_at or datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.retry_timer = None
+        self.cancel_event = threading.Event()
+
+        self.tracker = ProgressTracker()
+        self.tracker.start_tracking(len(self.urls))
+        self.tracker.update_progress(0, status_message="Queued")
+
+        # URLs finished since the last checkpoint; several URL workers append concurrently
+        self.done = []
+        self.failed = []
+        self.last_checkpoint = time.time()
+        self.checkpoint_lock = threading.RLock()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.state in ('completed', 'failed', 'cancelled')
+
+
+class JobRunner:
+    """Run analysis jobs on a background thread pool that outlives UI reruns
+
+    Each job runs on one of `max_workers` job threads, so several jobs (from
+    one or many dashboard sessions) run side by side, and fans its URLs out to
+    a pool of `url_workers` threads shared by every job. A job keeps at most
+    `url_workers` URLs in flight, so jobs interleave on the pool instead of
+    one large batch holding it. Progress is
+    checkpointed to a JobStore: results are flushed to the ResultStore and the
+    finished URLs marked done every `checkpoint_every` URLs or
+    `checkpoint_interval` seconds, and `resume_incomplete()` continues any job
+    a previous process left unfinished. Transient failures (timeouts,
+    connection errors) go to a per-job retry queue with exponential backoff
+    instead of being recorded as errors straight away. With `profile_dir`,
+    jobs submitted with the 'profile' option write a utils.profiling profile
+    of each run to profile_dir/<job_id>/<run start>.
+
+    Poll `get_status()` for progress; it extends ProgressTracker.get_status()
+    with job fields.
+    """
+
+    def __init__(self, result_store: ResultStore, job_store: Optional[JobStore] = None,
+                 content_store: Optional[ContentStore] = None, max_workers: int = 4,
+                 max_attempts: int = 3, retry_delay: float = 30.0, max_retry_delay: float = 600.0,
+                 checkpoint_every: int = 10, checkpoint_interval: float = 5.0, max_finished_jobs: int = 100,
+                 max_queued_urls: Optional[int] = None, parse_pool: Optional[ParsePool] = None,
+                 profile_dir: Optional[str] = None, url_workers: int = 8):
+        self.result_store = result_store
+        self.job_store = job_store or JobStore(':memory:')
+        self.content_store = content_store
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.max_finished_jobs = max_finished_jobs
+        self.max_queued_urls = max_queued_urls
+        self.parse_pool = parse_pool
+        self.profile_dir = profile_dir
+        self.url_workers = url_workers
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._url_executor = ThreadPoolExecutor(max_workers=url_workers, thread_name_prefix='analysis-url')
+        self._stopping = False
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+
+        # Analyzers hold a Tor session, so each worker thread gets its own
+        self._local = threading.local()
+
+    def _analyzers(self):
+        if not hasattr(self._local, 'analyzer'):
+            self._local.analyzer = TorAnalyzer(parse_pool=self.parse_pool)
+            self._local.deanonymizer = TorDeanonymizer(parse_pool=self.parse_pool)
+        return self._local.analyzer, self._local.deanonymizer
+
+    # Submission and resumption
+
+    def submit(self, urls: List[str], options: Optional[Dict[str, Any]] = None, owner: Optional[str] = None) -> str:
+        """Record a batch of URLs durably, queue it and return its job id
+        
+        Raises QueueFullError if `max_queued_urls` is set and the URLs still
+        waiting in unfinished jobs plus this batch would exceed it.
+        """
+        job_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        options = options or {}
+
+        with self._submit_lock:
+            if self.max_queued_urls is not None:
+                queued = self.queued_url_count()
+                if queued + len(urls) > self.max_queued_urls:
+                    raise QueueFullError(f"{queued} URLs already queued (limit {self.max_queued_urls})")
+
+            self.job_store.create_job(job_id, urls, options, owner)
+            job = Job(job_id, urls, options, owner)
+            self._register(job)
+
+        self._enqueue(job)
+        return job_id
+
+    def queued_url_count(self) -> int:
+        """URLs not yet finished across all unfinished jobs"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if not job.is_finished]
+        return sum(len(job.urls) - job.tracker.completed_items for job in jobs)
+
+    def resume(self, job_id: str) -> bool:
+        """Continue a stored job from its last checkpoint (e.g. after a crash or cancel)"""
+        job = self.get_job(job_id)
+        if job is not None and not job.is_finished:
+            return False
+
+        stored = self.job_store.get_job(job_id)
+        if stored is None:
+            return False
+
+        job = Job(job_id, self.job_store.urls(job_id), stored['options'], stored['owner'],
+                  submitted_at=stored['submitted_at'])
+        counts = stored['url_counts']
+        job.tracker.resume_tracking(len(job.urls), counts['done'] + counts['failed'],
+                                    counts['done'], counts['failed'])
+        job.tracker.update_progress(job.tracker.completed_items, status_message="Queued (resumed)")
+
+        self.job_store.set_state(job_id, 'queued')
+        self._register(job)
+        self._enqueue(job)
+        return True
+
+    def resume_incomplete(self) -> List[str]:
+        """Resume every stored job that was queued or running when the last process stopped"""
+        resumed = []
+        for job_id in self.job_store.list_jobs(states=('queued', 'running')):
+            with self._lock:
+                if job_id in self._jobs:
+                    continue
+            if self.resume(job_id):
+                resumed.append(job_id)
+        return resumed
+
+    def _register(self, job: Job):
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._jobs.move_to_end(job.job_id)
+            self._prune_locked()
+
+    def _enqueue(self, job: Job):
+        job.retry_timer = None
+        profiled = self.profile_dir and job.options.get('profile')
+        job.future = self._executor.submit(self._run_profiled if profiled else self._run, job)
+
+    # Execution
+
+    def _set_state(self, job: Job, state: str, message: str, error: Optional[str] = None):
+        job.state = state
+        job.error = error
+        if state == 'running' and job.started_at is None:
+            job.started_at = datetime.now().isoformat()
+        if state in ('completed', 'failed', 'cancelled'):
+            job.finished_at = datetime.now().isoformat()
+            job.tracker.complete_tracking(message)
+        else:
+            job.tracker.update_progress(job.tracker.completed_items, status_message=message)
+        self.job_store.set_state(job.job_id, state, error)
+
+    def _stop(self, job: Job):
+        if self._stopping:
+            # Leave the stored state as is so resume_incomplete() picks the job up next time
+            job.state = 'queued'
+            job.tracker.update_progress(job.tracker.completed_items, status_message="Stopped for shutdown")
+        else:
+            self._set_state(job, 'cancelled', f"Cancelled after {job.tracker.completed_items} URLs")
+
+    def _run(self, job: Job, inline: bool = False):
+        if job.cancel_event.is_set():
+            self._stop(job)
+            return
+
+        self._set_state(job, 'running', "Running")
+
+        try:
+            self._process_pending(job, inline)
+
+            while not job.cancel_event.is_set():
+                self._checkpoint(job)
+
+                retry = self.job_store.next_retry(job.job_id)
+                if retry is None:
+                    break
+
+                idx, url, attempts, next_attempt_at = retry
+                wait = next_attempt_at - time.time()
+                if wait > 0:
+                    # Free this worker for other jobs until the next retry is due
+                    self._set_state(job, 'queued', f"Waiting {wait:.0f}s to retry {url}")
+                    job.retry_timer = threading.Timer(wait, self._enqueue, (job,))
+                    job.retry_timer.daemon = True
+                    job.retry_timer.start()
+                    return
+
+                self._process(job, idx, url, attempts)
+
+            self._checkpoint(job)
+
+            if job.cancel_event.is_set():
+                self._stop(job)
+            else:
+                self._set_state(job, 'completed', f"Analyzed {len(job.urls)} URLs")
+
+        except Exception as e:
+            try:
+                self._checkpoint(job)
+            finally:
+                self._set_state(job, 'failed', f"Job failed: {e}", error=str(e))
+
+    def _run_profiled(self, job: Job):
+        output_dir = os.path.join(self.profile_dir, job.job_id, datetime.now().strftime('%Y%m%d-%H%M%S'))
+        # Other jobs' threads are left out, but allocation tracing slows the whole process
+        profiler = Profiler(output_dir, thread_ids=[threading.get_ident()])
+        try:
+            profiler.start()
+        except RuntimeError:
+            # Another job is being profiled; only one profiler runs at a time
+            return self._run(job)
+
+        try:
+            # The profiler only samples this thread, so analyze the URLs on it
+            self._run(job, inline=True)
+        finally:
+            profiler.stop()
+
+    def _process_pending(self, job: Job, inline: bool = False):
+        """Analyze the job's unattempted URLs on the URL pool, at most url_workers at a time"""
+        in_flight = set()
+        try:
+            for idx, url, attempts in self.job_store.pending_urls(job.job_id):
+                if job.cancel_event.is_set():
+                    break
+                if inline:
+                    self._process(job, idx, url, attempts)
+                    continue
+                if len(in_flight) >= self.url_workers:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+                in_flight.add(self._url_executor.submit(self._process, job, idx, url, attempts))
+        finally:
+            # Let URLs already started finish (and be checkpointed) even if the job fails
+            finished, _ = wait(in_flight)
+        for future in finished:
+            future.result()
+
+    def _process(self, job: Job, idx: int, url: str, attempts: int):
+        """Analyze one URL and either record its result or queue a retry"""
+        analyzer, deanonymizer = self._analyzers()
+        attempt_label = f" (attempt {attempts + 1})" if attempts else ""
+        job.tracker.update_progress(job.tracker.completed_items, current_item=url,
+                                    status_message=f"Analyzing {job.tracker.completed_items + 1}/"
+                                                   f"{len(job.urls)}: {url}{attempt_label}")
+
+        # One analysis id per URL per job, so re-running after a crash overwrites rather than duplicates
+        analysis_id = f"analysis_{job.job_id}_{idx}"
+
+        try:
+            result = analyze_single_url(url, analyzer, deanonymizer, job.options,
+                                        analysis_id=analysis_id, content_store=self.content_store)
+            error = result.get('error')
+            transient = error in TRANSIENT_ERRORS
+        except Exception as e:
+            result = None
+            error = str(e)
+            transient = isinstance(e, TRANSIENT_EXCEPTIONS)
+
+        if transient and attempts + 1 < self.max_attempts:
+            delay = min(self.retry_delay * 2 ** attempts, self.max_retry_delay)
+            self.job_store.schedule_retry(job.job_id, idx, delay, error)
+            job.tracker.update_progress(job.tracker.completed_items,
+                                        status_message=f"Retry queued for {url}: {error}")
+            return
+
+        if result is None:
+            result = error_result(url, error, analysis_id=analysis_id)
+
+        self.result_store.add(result)
+        job.tracker.add_result({'url': url, 'analysis_id': analysis_id}, is_success=not error)
+        job.tracker.increment_progress(url)
+
+        with job.checkpoint_lock:
+            if error:
+                job.failed.append((idx, error))
+            else:
+                job.done.append(idx)
+
+            if len(job.done) + len(job.failed) >= self.checkpoint_every or \
+                    time.time() - job.last_checkpoint >= self.checkpoint_interval:
+                self._checkpoint(job)
+
+    def _checkpoint(self, job: Job):
+        """Make finished results durable, then mark their URLs done"""
+        with job.checkpoint_lock:
+            if job.done or job.failed:
+                self.result_store.flush()
+                self.job_store.checkpoint(job.job_id, job.done, job.failed)
+                job.done = []
+                job.failed = []
+            job.last_checkpoint = time.time()
+
+    # Control and status
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask a job to stop once its in-flight URLs finish; it can be resumed later"""
+        job = self.get_job(job_id)
+        if job is None or job.is_finished:
+            return False
+
+        job.cancel_event.set()
+        if job.retry_timer is not None:
+            job.retry_timer.cancel()
+            self._stop(job)
+        return True
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Progress of one job, or None if unknown
+        
+        Jobs that are no longer held in memory (finished in an earlier process,
+        or pruned) are reported from the job store.
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            return self._stored_status(job_id)
+
+        status = job.tracker.get_status()
+        status.update({
+            'job_id': job.job_id,
+            'state': job.state,
+            'owner': job.owner,
+            'url_count': len(job.urls),
+            'submitted_at': job.submitted_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+            'error': job.error
+        })
+        return status
+
+    def _stored_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        stored = self.job_store.get_job(job_id)
+        if stored is None:
+            return None
+
+        counts = stored['url_counts']
+        completed = counts['done'] + counts['failed']
+        total = stored['url_count']
+        return {
+            'progress_percentage': round(completed / total * 100, 1) if total else 100.0,
+            'completed_items': completed,
+            'total_items': total,
+            'current_item': '',
+            'status_message': stored['error'] or stored['state'].title(),
+            'is_active': False,
+            'success_count': counts['done'],
+            'error_count': counts['failed'],
+            'job_id': job_id,
+            'state': stored['state'],
+            'owner': stored['owner'],
+            'url_count': total,
+            'submitted_at': stored['submitted_at'],
+            'started_at': stored['started_at'],
+            'finished_at': stored['finished_at'],
+            'error': stored['error']
+        }
+
+    def get_url_counts(self, job_id: str) -> Dict[str, int]:
+        """Durable per-status URL counts (pending, retry, done, failed)"""
+        return self.job_store.url_counts(job_id)
+
+    def list_jobs(self, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Status of every known job, newest first, optionally for one owner"""
+        with self._lock:
+            job_ids = [job_id for job_id, job in self._jobs.items() if owner is None or job.owner == owner]
+        return [status for status in map(self.get_status, reversed(job_ids)) if status]
+
+    def _prune_locked(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker pool; unfinished jobs stay resumable from their checkpoints"""
+        self._stopping = True
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel_event.set()
+            if job.retry_timer is not None:
+                job.retry_timer.cancel()
+        self._executor.shutdown(wait=wait)
+        self._url_executor.shutdown(wait=wait)
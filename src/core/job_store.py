@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils import serialization
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    owner TEXT,
+    options TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error TEXT,
+    url_count INTEGER NOT NULL,
+    submitted_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state);
+
+CREATE TABLE IF NOT EXISTS job_urls (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL,
+    last_error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_job_urls_status ON job_urls(job_id, status, next_attempt_at);
+"""
+
+# URL states: pending -> done | failed, or pending -> retry -> ... -> done | failed
+URL_STATES = ('pending', 'retry', 'done', 'failed')
+
+
+class JobStore:
+    """Durable job and per-URL checkpoint state in SQLite (WAL)
+
+    A job's URLs are stored once at submission; workers then record each
+    finished URL (`checkpoint`) and each transient failure (`schedule_retry`)
+    so an interrupted job can pick up exactly where it stopped.
+    """
+
+    def __init__(self, path: str = 'data/jobs.db'):
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _transaction(self, statements: List[Tuple[str, Any]]):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                for sql, params in statements:
+                    if isinstance(params, list):
+                        self._conn.executemany(sql, params)
+                    else:
+                        self._conn.execute(sql, params)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def create_job(self, job_id: str, urls: List[str], options: Dict[str, Any], owner: Optional[str] = None):
+        """Record a new job and its URLs"""
+        self._transaction([
+            ('INSERT INTO jobs (job_id, owner, options, state, url_count, submitted_at) VALUES (?, ?, ?, ?, ?, ?)',
+             (job_id, owner, serialization.dumps_str(options), 'queued', len(urls), datetime.now().isoformat())),
+            ('INSERT INTO job_urls (job_id, idx, url) VALUES (?, ?, ?)',
+             [(job_id, i, url) for i, url in enumerate(urls)])
+        ])
+
+    def set_state(self, job_id: str, state: str, error: Optional[str] = None):
+        """Update a job's state, stamping start and finish times"""
+        now = datetime.now().isoformat()
+        if state == 'running':
+            sql = ('UPDATE jobs SET state = ?, error = ?, started_at = COALESCE(started_at, ?), finished_at = NULL '
+                   'WHERE job_id = ?')
+            params = (state, error, now, job_id)
+        elif state in ('completed', 'failed', 'cancelled'):
+            sql = 'UPDATE jobs SET state = ?, error = ?, finished_at = ? WHERE job_id = ?'
+            params = (state, error, now, job_id)
+        else:
+            sql = 'UPDATE jobs SET state = ?, error = ?, finished_at = NULL WHERE job_id = ?'
+            params = (state, error, job_id)
+        self._transaction([(sql, params)])
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job row as a dict, with decoded options and per-status URL counts"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT job_id, owner, options, state, error, url_count, submitted_at, started_at, finished_at '
+                'FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(zip(('job_id', 'owner', 'options', 'state', 'error', 'url_count',
+                        'submitted_at', 'started_at', 'finished_at'), row))
+        job['options'] = serialization.loads(job['options'])
+        job['url_counts'] = self.url_counts(job_id)
+        return job
+
+    def list_jobs(self, states: Optional[Tuple[str, ...]] = None) -> List[str]:
+        """Job ids in submission order, optionally filtered by state"""
+        with self._lock:
+            if states:
+                rows = self._conn.execute(
+                    f"SELECT job_id FROM jobs WHERE state IN ({', '.join('?' * len(states))}) ORDER BY submitted_at",
+                    states).fetchall()
+            else:
+                rows = self._conn.execute('SELECT job_id FROM jobs ORDER BY submitted_at').fetchall()
+        return [job_id for job_id, in rows]
+
+    def urls(self, job_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute('SELECT url FROM job_urls WHERE job_id = ? ORDER BY idx', (job_id,)).fetchall()
+        return [url for url, in rows]
+
+    def url_counts(self, job_id: str) -> Dict[str, int]:
+        """Number of URLs in each state"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT status, COUNT(*) FROM job_urls WHERE job_id = ? GROUP BY status', (job_id,)).fetchall()
+        counts = dict.fromkeys(URL_STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def pending_urls(self, job_id: str) -> List[Tuple[int, str, int]]:
+        """(index, url, attempts) for URLs not yet attempted"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT idx, url, attempts FROM job_urls WHERE job_id = ? AND status = 'pending' ORDER BY idx",
+                (job_id,)).fetchall()
+
+    def next_retry(self, job_id: str) -> Optional[Tuple[int, str, int, float]]:
+        """(index, url, attempts, next_attempt_at) of the earliest queued retry"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT idx, url, attempts, next_attempt_at FROM job_urls WHERE job_id = ? AND status = 'retry' "
+                "ORDER BY next_attempt_at, idx LIMIT 1", (job_id,)).fetchone()
+
+    def checkpoint(self, job_id: str, done: List[int], failed: List[Tuple[int, str]]):
+        """Mark URLs finished (their results are already stored)"""
+        self._transaction([
+            ("UPDATE job_urls SET status = 'done', attempts = attempts + 1, next_attempt_at = NULL "
+             "WHERE job_id = ? AND idx = ?", [(job_id, idx) for idx in done]),
+            ("UPDATE job_urls SET status = 'failed', attempts = attempts + 1, next_attempt_at = NULL, last_error = ? "
+             "WHERE job_id = ? AND idx = ?", [(error, job_id, idx) for idx, error in failed])
+        ])
+
+    def schedule_retry(self, job_id: str, idx: int, delay: float, error: str):
+        """Put a URL on the retry queue after a transient failure"""
+        self._transaction([
+            ("UPDATE job_urls SET status = 'retry', attempts = attempts + 1, next_attempt_at = ?, last_error = ? "
+             "WHERE job_id = ? AND idx = ?", (time.time() + delay, error, job_id, idx))
+        ])
+
+    def delete_job(self, job_id: str):
+        self._transaction([
+            ('DELETE FROM job_urls WHERE job_id = ?', (job_id,)),
+            ('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+        ])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
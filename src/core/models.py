@@ -0,0 +1,366 @@
+import sys
+from collections.abc import Mapping, MutableMapping
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Iterator, List, Optional, Type, TypeVar, Union
+
+
+class _Unset:
+    """Marker for a field the analysis never produced (distinct from None)"""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'UNSET'
+
+    def __bool__(self):
+        return False
+
+    def __reduce__(self):
+        # Keep the singleton identity across pickling (process pools, session state)
+        return 'UNSET'
+
+
+UNSET = _Unset()
+
+T = TypeVar('T')
+# Type of a field that defaults to UNSET, e.g. `response_code: OrUnset[int] = UNSET`
+OrUnset = Union[T, _Unset]
+R = TypeVar('R', bound='_Record')
+
+# Low-cardinality strings repeated across thousands of results
+_INTERNED_KEYS = frozenset(('analysis_type', 'risk_level', 'content_type', 'server_info', 'language'))
+
+
+def _normalize(key: str, value: Any) -> Any:
+    if isinstance(value, str):
+        if type(value) is not str:
+            # bs4 NavigableStrings keep the whole parse tree alive, store a plain copy
+            value = str(value)
+        if key in _INTERNED_KEYS:
+            value = sys.intern(value)
+    elif key == 'headers' and type(value) is dict:
+        # Header names repeat across every response
+        value = {sys.intern(name): header for name, header in value.items()}
+    return value
+
+
+class _Record(MutableMapping):
+    """Dict-compatible view over a slotted dataclass
+
+    Fields left at UNSET behave like missing keys, so `'forms' in result`,
+    `result.get(...)` and iteration match the dicts the analyzers used to build.
+    Keys without a field are kept in `extra`.
+    """
+
+    __slots__ = ()
+    _fields: tuple = ()
+    extra: Optional[Dict[str, Any]]
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._fields:
+            value = getattr(self, key)
+            if value is not UNSET:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._fields:
+            value = getattr(self, key)
+            return default if value is UNSET else value
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self._fields:
+            setattr(self, key, _normalize(key, value))
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self._fields and getattr(self, key) is not UNSET:
+            setattr(self, key, UNSET)
+        elif self.extra and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        if isinstance(key, str) and key in self._fields:
+            return getattr(self, key) is not UNSET
+        return self.extra is not None and key in self.extra
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self._fields:
+            if getattr(self, name) is not UNSET:
+                yield name
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to plain nested dicts"""
+        data = {}
+        for name in self._fields:
+            value = getattr(self, name)
+            if value is not UNSET:
+                data[name] = value.to_dict() if isinstance(value, _Record) else value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_dict(cls: Type[R], data: Mapping) -> R:
+        """Build from a (possibly nested) dict"""
+        record = cls()
+        for key, value in data.items():
+            record[key] = value
+        return record
+
+
+def _record(cls):
+    """Turn a _Record subclass into a slotted dataclass with its field list cached"""
+    # eq=False keeps Mapping.__eq__, so records compare equal to the dicts they replace
+    cls = dataclass(slots=True, repr=False, eq=False)(cls)
+    cls._fields = tuple(f.name for f in fields(cls) if f.name != 'extra')
+    return cls
+
+
+@_record
+class HttpSection(_Record):
+    """Response metadata from the initial request"""
+
+    response_code: OrUnset[int] = UNSET
+    load_time: OrUnset[float] = UNSET
+    final_url: OrUnset[str] = UNSET
+    redirects: OrUnset[int] = UNSET
+    content_length: OrUnset[int] = UNSET
+    content_type: OrUnset[str] = UNSET
+    server_info: OrUnset[str] = UNSET
+    headers: OrUnset[Dict[str, str]] = UNSET
+    content: OrUnset[Optional[str]] = UNSET
+    security_headers: OrUnset[Dict[str, Any]] = UNSET
+    technologies: OrUnset[List[str]] = UNSET
+    extra: Optional[Dict[str, Any]] = None
+
+
+@_record
+class ContentSection(_Record):
+    """Fields extracted from the page body"""
+
+    title: OrUnset[Optional[str]] = UNSET
+    meta_description: OrUnset[Optional[str]] = UNSET
+    meta_keywords: OrUnset[Optional[str]] = UNSET
+    text_content_length: OrUnset[int] = UNSET
+    links: OrUnset[Dict[str, Any]] = UNSET
+    forms: OrUnset[List[Dict[str, Any]]] = UNSET
+    emails: OrUnset[List[str]] = UNSET
+    crypto_addresses: OrUnset[Dict[str, List[str]]] = UNSET
+    language: OrUnset[Optional[str]] = UNSET
+    social_media: OrUnset[List[str]] = UNSET
+    onion_links: OrUnset[List[str]] = UNSET
+    content_hash: OrUnset[str] = UNSET
+    content_analysis_error: OrUnset[str] = UNSET
+    extra: Optional[Dict[str, Any]] = None
+
+
+@_record
+class TechnicalSection(_Record):
+    """TLS, timing and exposed-path checks"""
+
+    ssl_info: OrUnset[Dict[str, Any]] = UNSET
+    timing_analysis: OrUnset[Dict[str, Any]] = UNSET
+    admin_pages: OrUnset[Dict[str, bool]] = UNSET
+    technical_analysis_error: OrUnset[str] = UNSET
+    extra: Optional[Dict[str, Any]] = None
+
+
+@_record
+class GeolocationSection(_Record):
+    """IP resolution and location estimate"""
+
+    geolocation_analysis: OrUnset[Dict[str, Any]] = UNSET
+    location_summary: OrUnset[Dict[str, Any]] = UNSET
+    extra: Optional[Dict[str, Any]] = None
+
+
+@_record
+class OsintSection(_Record):
+    """Output of TorDeanonymizer.perform_osint_analysis"""
+
+    osint_timestamp: OrUnset[str] = UNSET
+    analyzed_url: OrUnset[str] = UNSET
+    osint_sources: OrUnset[List[Dict[str, Any]]] = UNSET
+    entities: OrUnset[List[Dict[str, Any]]] = UNSET
+    correlations: OrUnset[List[Dict[str, Any]]] = UNSET
+    extracted_identifiers: OrUnset[Dict[str, List[str]]] = UNSET
+    certificate_transparency: OrUnset[Dict[str, Any]] = UNSET
+    reputation_analysis: OrUnset[Dict[str, Any]] = UNSET
+    hosting_analysis: OrUnset[Dict[str, Any]] = UNSET
+    similarity_analysis: OrUnset[Dict[str, Any]] = UNSET
+    content_fingerprints: OrUnset[Dict[str, Any]] = UNSET
+    shodan_analysis: OrUnset[Dict[str, Any]] = UNSET
+    virustotal_analysis: OrUnset[Dict[str, Any]] = UNSET
+    entity_correlations: OrUnset[List[Dict[str, Any]]] = UNSET
+    osint_error: OrUnset[str] = UNSET
+    extra: Optional[Dict[str, Any]] = None
+
+
+@_record
+class CrossReferenceSection(_Record):
+    """Output of TorDeanonymizer.cross_reference_databases (the `cross_references` key)"""
+
+    cross_reference_timestamp: OrUnset[str] = UNSET
+    databases_checked: OrUnset[List[str]] = UNSET
+    matches_found: OrUnset[List[Dict[str, Any]]] = UNSET
+    risk_indicators: OrUnset[List[Dict[str, Any]]] = UNSET
+    cross_reference_error: OrUnset[str] = UNSET
+    extra: Optional[Dict[str, Any]] = None
+
+
+# Top-level result keys that live in a section, mapped to the section attribute
+_SECTIONS = (
+    ('http_info', HttpSection),
+    ('content_info', ContentSection),
+    ('technical_info', TechnicalSection),
+    ('geo_info', GeolocationSection),
+    ('osint_info', OsintSection)
+)
+_SECTION_FOR_KEY = {key: attr for attr, section in _SECTIONS for key in section._fields}
+_SECTION_TYPES = dict(_SECTIONS)
+
+
+@_record
+class AnalysisResult(_Record):
+    """Result of analyzing one URL
+
+    Behaves like the flat dict the pipeline used to produce (same keys, same
+    nesting), but groups fields into slotted sections that are only allocated
+    once a stage writes to them. Use `to_dict()` / `from_dict()` to convert.
+    """
+
+    url: OrUnset[str] = UNSET
+    timestamp: OrUnset[str] = UNSET
+    analysis_type: OrUnset[str] = UNSET
+    http_info: Optional[HttpSection] = None
+    content_info: Optional[ContentSection] = None
+    technical_info: Optional[TechnicalSection] = None
+    geo_info: Optional[GeolocationSection] = None
+    risk_level: OrUnset[str] = UNSET
+    analysis_score: OrUnset[float] = UNSET
+    error: OrUnset[str] = UNSET
+    osint_info: Optional[OsintSection] = None
+    metadata: OrUnset[Dict[str, Any]] = UNSET
+    cross_references: OrUnset[CrossReferenceSection] = UNSET
+    analysis_id: OrUnset[str] = UNSET
+    # Seconds spent per stage (utils.metrics), e.g. {'fetch': 1.2, 'osint_reputation': 0.4}
+    timings: OrUnset[Dict[str, float]] = UNSET
+    extra: Optional[Dict[str, Any]] = None
+
+    def _section(self, attr: str) -> _Record:
+        """The section stored in `attr`, allocated on first write"""
+        section = getattr(self, attr)
+        if section is None:
+            section = _SECTION_TYPES[attr]()
+            setattr(self, attr, section)
+        return section
+
+    def __getitem__(self, key: str) -> Any:
+        attr = _SECTION_FOR_KEY.get(key)
+        if attr is not None:
+            section = getattr(self, attr)
+            if section is None:
+                raise KeyError(key)
+            return section[key]
+        if key in _SECTION_TYPES:
+            raise KeyError(key)
+        return _Record.__getitem__(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        attr = _SECTION_FOR_KEY.get(key)
+        if attr is not None:
+            section = getattr(self, attr)
+            return default if section is None else section.get(key, default)
+        if key in _SECTION_TYPES:
+            return default
+        return _Record.get(self, key, default)
+
+    def __setitem__(self, key: str, value: Any):
+        attr = _SECTION_FOR_KEY.get(key)
+        if attr is not None:
+            self._section(attr)[key] = value
+        elif key == 'cross_references' and isinstance(value, Mapping) and \
+                not isinstance(value, CrossReferenceSection):
+            self.cross_references = CrossReferenceSection.from_dict(value)
+        elif key in _SECTION_TYPES:
+            # Section attributes are not result keys
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        else:
+            _Record.__setitem__(self, key, value)
+
+    def __delitem__(self, key: str):
+        attr = _SECTION_FOR_KEY.get(key)
+        if attr is not None:
+            section = getattr(self, attr)
+            if section is None:
+                raise KeyError(key)
+            del section[key]
+        elif key in _SECTION_TYPES:
+            if self.extra and key in self.extra:
+                del self.extra[key]
+            else:
+                raise KeyError(key)
+        else:
+            _Record.__delitem__(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        attr = _SECTION_FOR_KEY.get(key)
+        if attr is not None:
+            section = getattr(self, attr)
+            return section is not None and key in section
+        if key in _SECTION_TYPES:
+            return self.extra is not None and key in self.extra
+        return _Record.__contains__(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self._fields:
+            value = getattr(self, name)
+            if name in _SECTION_TYPES:
+                if value is not None:
+                    yield from value
+            elif value is not UNSET:
+                yield name
+        if self.extra:
+            yield from self.extra
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to the flat, JSON-ready dict layout used by exports"""
+        data = {}
+        for name in self._fields:
+            value = getattr(self, name)
+            if name in _SECTION_TYPES:
+                if value is not None:
+                    data.update(value.to_dict())
+            elif value is not UNSET:
+                data[name] = value.to_dict() if isinstance(value, _Record) else value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self) -> str:
+        return f"AnalysisResult(url={self.get('url')!r}, risk_level={self.get('risk_level')!r})"
+
+
+def as_result(data: Mapping) -> AnalysisResult:
+    """Return `data` as an AnalysisResult, converting plain dicts"""
+    if isinstance(data, AnalysisResult):
+        return data
+    return AnalysisResult.from_dict(data)
@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Optional, Tuple, Union
+
+from utils import metrics
+from .analysis_tool import TorAnalyzer
+from .deanonymizer import TorDeanonymizer
+
+# A page body handed to a pool process: the text itself, or (shared memory name, byte length)
+Body = Union[str, Tuple[str, int]]
+
+_stage_local = threading.local()
+
+
+def _stage_analyzers() -> Tuple[TorAnalyzer, TorDeanonymizer]:
+    """Analyzer instances for running the content stages in this process
+
+    The content stages only call stateless parsing helpers, so __init__ (Tor
+    session, geolocation cache, exit index, thread pools) is skipped.
+    """
+    if not hasattr(_stage_local, 'analyzer'):
+        _stage_local.analyzer = TorAnalyzer.__new__(TorAnalyzer)
+        _stage_local.deanonymizer = TorDeanonymizer.__new__(TorDeanonymizer)
+    return _stage_local.analyzer, _stage_local.deanonymizer
+
+
+def _read_body(body: Body) -> str:
+    if isinstance(body, str):
+        return body
+
+    name, size = body
+    shm = SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size]).decode('utf-8', 'surrogatepass')
+    finally:
+        shm.close()
+
+
+def _analyze_content(body: Body) -> Dict[str, Any]:
+    analyzer, _ = _stage_analyzers()
+    return analyzer._analyze_content(_read_body(body))
+
+
+def _content_fingerprints(body: Body) -> Dict[str, Any]:
+    _, deanonymizer = _stage_analyzers()
+    return deanonymizer._analyze_content_fingerprints({'content': _read_body(body)})
+
+
+def _in_worker(stage, body: Body) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Run a stage in a pool process; its metrics.timed() durations travel back with the output"""
+    timings = {}
+    with metrics.collect_timings(timings):
+        output = stage(body)
+    return output, timings
+
+
+class ParsePool:
+    """Process pool for the CPU-bound content stages
+
+    BeautifulSoup parsing, trafilatura extraction, the regex extractors and
+    fingerprint hashing hold the GIL, so with many fetches finishing at once
+    they serialize every analysis thread. Attached to TorAnalyzer and
+    TorDeanonymizer (`parse_pool=`), it runs `_analyze_content` and
+    `_analyze_content_fingerprints` in worker processes while fetching stays
+    on the calling threads. Bodies of `shm_threshold` bytes or more are
+    copied once into shared memory instead of being pickled through the
+    pool's pipe. If the pool breaks, stages run on the calling thread.
+    """
+
+    def __init__(self, processes: Optional[int] = None, shm_threshold: int = 64 * 1024):
+        self.processes = processes or os.cpu_count() or 1
+        self.shm_threshold = shm_threshold
+        # spawn: forking a process full of threads (Tor sessions, geo executors) is unsafe
+        self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                             mp_context=multiprocessing.get_context('spawn'))
+
+    def _run(self, stage, content: str) -> Dict[str, Any]:
+        try:
+            if len(content) < self.shm_threshold:
+                output, timings = self._executor.submit(_in_worker, stage, content).result()
+            else:
+                data = content.encode('utf-8', 'surrogatepass')
+                shm = SharedMemory(create=True, size=max(1, len(data)))
+                try:
+                    shm.buf[:len(data)] = data
+                    output, timings = self._executor.submit(_in_worker, stage, (shm.name, len(data))).result()
+                finally:
+                    shm.close()
+                    shm.unlink()
+            metrics.record_timings(timings)
+            return output
+        except (BrokenProcessPool, RuntimeError, OSError):
+            # Pool shut down or died, or no shared memory available
+            return stage(content)
+
+    def analyze_content(self, content: str) -> Dict[str, Any]:
+        """TorAnalyzer._analyze_content in a pool process"""
+        return self._run(_analyze_content, content)
+
+    def content_fingerprints(self, content: str) -> Dict[str, Any]:
+        """TorDeanonymizer._analyze_content_fingerprints in a pool process"""
+        return self._run(_content_fingerprints, content)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+def parse_pool_from_env(processes: Optional[int] = None) -> Optional[ParsePool]:
+    """ParsePool sized by `processes` or PARSE_PROCESSES; None when that is 0 or unset"""
+    if processes is None:
+        processes = int(os.getenv('PARSE_PROCESSES', '0'))
+    return ParsePool(processes) if processes > 0 else None
@@ -0,0 +1,81 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from utils import metrics
+from .analysis_tool import TorAnalyzer
+from .blob_store import ContentStore
+from .deanonymizer import TorDeanonymizer
+from .models import AnalysisResult
+
+DEFAULT_OPTIONS = {
+    'deep_analysis': True,
+    'metadata_extraction': True,
+    'cross_reference': True
+}
+
+
+def analyze_single_url(url: str, analyzer: TorAnalyzer, deanonymizer: TorDeanonymizer,
+                       options: Optional[Dict[str, Any]] = None, analysis_id: Optional[str] = None,
+                       content_store: Optional[ContentStore] = None) -> AnalysisResult:
+    """Run every enabled analysis stage for one URL
+
+    Exceptions propagate so callers can decide whether to record an error
+    result or retry.
+    """
+    # Basic analysis
+    result = analyzer.analyze_url(url)
+
+    return enrich_result(result, analyzer, deanonymizer, options, analysis_id, content_store)
+
+
+def enrich_result(result: AnalysisResult, analyzer: TorAnalyzer, deanonymizer: TorDeanonymizer,
+                  options: Optional[Dict[str, Any]] = None, analysis_id: Optional[str] = None,
+                  content_store: Optional[ContentStore] = None) -> AnalysisResult:
+    """Run the stages after TorAnalyzer.analyze_url: OSINT, metadata, cross-references"""
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    url = result['url']
+
+    timings = result.get('timings')
+    if timings is None:
+        timings = result['timings'] = {}
+
+    with metrics.collect_timings(timings):
+        # Deep analysis if enabled
+        if options['deep_analysis']:
+            with metrics.timed('osint'):
+                result.update(deanonymizer.perform_osint_analysis(url, result))
+
+        # Metadata extraction
+        if options['metadata_extraction']:
+            with metrics.timed('metadata'):
+                result['metadata'] = analyzer.extract_metadata(url)
+
+        # Cross-reference databases
+        if options['cross_reference']:
+            with metrics.timed('cross_reference'):
+                result['cross_references'] = deanonymizer.cross_reference_databases(result)
+
+        # Move the page body out of the result into the content store
+        if content_store is not None:
+            with metrics.timed('offload'):
+                content_store.offload(result)
+
+    # Add timestamp and URL
+    result['url'] = url
+    result['timestamp'] = datetime.now().isoformat()
+    if analysis_id:
+        result['analysis_id'] = analysis_id
+
+    return result
+
+
+def error_result(url: str, error: str, analysis_id: Optional[str] = None) -> AnalysisResult:
+    """Result recorded for a URL whose analysis raised"""
+    result = AnalysisResult(
+        url=url,
+        error=error,
+        timestamp=datetime.now().isoformat()
+    )
+    if analysis_id:
+        result['analysis_id'] = analysis_id
+    return result
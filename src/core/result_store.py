@@ -0,0 +1,358 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from utils import serialization
+from .models import AnalysisResult
+from .summary_aggregator import SummaryAggregator
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    analysis_id TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    timestamp TEXT,
+    risk_level TEXT,
+    content_hash TEXT,
+    has_error INTEGER NOT NULL DEFAULT 0,
+    analysis_score REAL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_url ON results(url);
+CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results(timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_risk_level ON results(risk_level, timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_content_hash ON results(content_hash);
+
+CREATE TABLE IF NOT EXISTS identifiers (
+    result_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_identifiers_value ON identifiers(value, kind);
+CREATE INDEX IF NOT EXISTS idx_identifiers_result ON identifiers(result_id);
+"""
+
+_UPSERT = """
+INSERT INTO results (analysis_id, url, timestamp, risk_level, content_hash, has_error, analysis_score, data)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(analysis_id) DO UPDATE SET
+    url = excluded.url,
+    timestamp = excluded.timestamp,
+    risk_level = excluded.risk_level,
+    content_hash = excluded.content_hash,
+    has_error = excluded.has_error,
+    analysis_score = excluded.analysis_score,
+    data = excluded.data
+"""
+
+TimeBound = Union[str, datetime, None]
+
+
+def _extract_identifiers(result: Mapping[str, Any]) -> List[Tuple[str, str]]:
+    """Collect (kind, value) pairs worth looking results up by"""
+    found = set()
+
+    for email in result.get('emails') or []:
+        found.add(('email', email))
+    for crypto_type, addresses in (result.get('crypto_addresses') or {}).items():
+        for address in addresses:
+            found.add((crypto_type, address))
+    for onion_link in result.get('onion_links') or []:
+        found.add(('onion', onion_link))
+    for ip in (result.get('geolocation_analysis') or {}).get('resolved_ips') or []:
+        found.add(('ip', ip))
+
+    extracted = result.get('extracted_identifiers') or {}
+    for fingerprint in extracted.get('ssl_fingerprints') or []:
+        found.add(('ssl_fingerprint', fingerprint))
+    for signature in extracted.get('server_signatures') or []:
+        found.add(('server_signature', signature))
+
+    return sorted(found)
+
+
+def _iso(value: TimeBound) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class ResultStore:
+    """Persistent SQLite (WAL) store for analysis results
+
+    Each result is stored as one JSON blob plus indexed columns (URL, risk
+    level, timestamp, content hash) and a side table of extracted identifiers
+    (emails, crypto addresses, onion links, IPs, fingerprints). Writes are
+    buffered and committed in batches; reads flush pending writes first.
+    """
+
+    def __init__(self, path: str = 'data/results.db', batch_size: int = 100, flush_interval: float = 2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+        self._lock = threading.RLock()
+        self._pending = []
+        self._last_flush = time.time()
+        # Bumped on every commit through this connection; see version()
+        self._writes = 0
+
+    # Writes
+
+    def add(self, result: Mapping[str, Any]) -> str:
+        """Queue a result for writing; returns its analysis_id"""
+        if not result.get('analysis_id'):
+            result['analysis_id'] = f"analysis_{uuid.uuid4().hex}"
+
+        with self._lock:
+            self._pending.append(result)
+            if len(self._pending) >= self.batch_size or time.time() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+        return result['analysis_id']
+
+    def add_many(self, analysis_results: Iterable[Mapping[str, Any]]) -> int:
+        """Queue many results and commit them"""
+        count = 0
+        for result in analysis_results:
+            self.add(result)
+            count += 1
+        self.flush()
+        return count
+
+    def flush(self):
+        """Commit all queued results in one transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.time()
+            if not pending:
+                return
+
+            rows = []
+            identifiers = []
+            analysis_ids = []
+            for result in pending:
+                analysis_id = result['analysis_id']
+                analysis_ids.append((analysis_id,))
+                rows.append((
+                    analysis_id,
+                    result.get('url', ''),
+                    result.get('timestamp'),
+                    result.get('risk_level'),
+                    result.get('content_hash'),
+                    1 if 'error' in result else 0,
+                    result.get('analysis_score'),
+                    serialization.dumps(result)
+                ))
+                identifiers.extend((kind, value, analysis_id) for kind, value in _extract_identifiers(result))
+
+            try:
+                self._conn.execute('BEGIN')
+                self._conn.executemany(
+                    'DELETE FROM identifiers WHERE result_id = (SELECT id FROM results WHERE analysis_id = ?)',
+                    analysis_ids)
+                self._conn.executemany(_UPSERT, rows)
+                self._conn.executemany(
+                    'INSERT INTO identifiers (result_id, kind, value) '
+                    'SELECT id, ?, ? FROM results WHERE analysis_id = ?',
+                    identifiers)
+                self._conn.execute('COMMIT')
+                self._writes += 1
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                # Keep the batch so a later flush can retry it
+                self._pending = pending + self._pending
+                raise
+
+    def delete(self, analysis_id: str) -> bool:
+        """Delete one result; returns False if it did not exist"""
+        self.flush()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute(
+                'DELETE FROM identifiers WHERE result_id = (SELECT id FROM results WHERE analysis_id = ?)',
+                (analysis_id,))
+            deleted = self._conn.execute('DELETE FROM results WHERE analysis_id = ?', (analysis_id,)).rowcount
+            self._conn.execute('COMMIT')
+            self._writes += 1
+        return deleted > 0
+
+    def delete_matching(self, **filters) -> int:
+        """Delete every result matching the filters (at least one); returns how many were deleted"""
+        where, params = self._where(**filters)
+        if not where:
+            raise ValueError("delete_matching() needs a filter; use clear() to delete everything")
+
+        self.flush()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute(
+                f'DELETE FROM identifiers WHERE result_id IN (SELECT id FROM results{where})', params)
+            deleted = self._conn.execute(f'DELETE FROM results{where}', params).rowcount
+            self._conn.execute('COMMIT')
+            self._writes += 1
+        return deleted
+
+    def clear(self):
+        """Delete every stored result"""
+        with self._lock:
+            self._pending = []
+            self._conn.execute('BEGIN')
+            self._conn.execute('DELETE FROM identifiers')
+            self._conn.execute('DELETE FROM results')
+            self._conn.execute('COMMIT')
+            self._writes += 1
+
+    # Reads
+
+    def _where(self, url: Optional[str] = None, url_contains: Optional[str] = None,
+               risk_level: Union[str, Sequence[str], None] = None,
+               since: TimeBound = None, until: TimeBound = None,
+               content_hash: Optional[str] = None, identifier: Optional[str] = None,
+               identifier_kind: Optional[str] = None, has_error: Optional[bool] = None,
+               job_id: Optional[str] = None) -> Tuple[str, list]:
+        clauses = []
+        params = []
+
+        if url is not None:
+            clauses.append('url = ?')
+            params.append(url)
+        if url_contains:
+            clauses.append("url LIKE ? ESCAPE '\\'")
+            escaped = url_contains.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f"%{escaped}%")
+        if risk_level:
+            levels = [risk_level] if isinstance(risk_level, str) else list(risk_level)
+            clauses.append(f"risk_level IN ({', '.join('?' * len(levels))})")
+            params.extend(levels)
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(_iso(since))
+        if until is not None:
+            clauses.append('timestamp <= ?')
+            params.append(_iso(until))
+        if content_hash is not None:
+            clauses.append('content_hash = ?')
+            params.append(content_hash)
+        if identifier is not None:
+            if identifier_kind is not None:
+                clauses.append('id IN (SELECT result_id FROM identifiers WHERE value = ? AND kind = ?)')
+                params.extend((identifier, identifier_kind))
+            else:
+                clauses.append('id IN (SELECT result_id FROM identifiers WHERE value = ?)')
+                params.append(identifier)
+        if has_error is not None:
+            clauses.append('has_error = ?')
+            params.append(1 if has_error else 0)
+        if job_id is not None:
+            # JobRunner ids look like analysis_<job_id>_<index>; a range keeps the unique index usable
+            prefix = f"analysis_{job_id}_"
+            clauses.append('analysis_id >= ? AND analysis_id < ?')
+            params.extend((prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    @staticmethod
+    def _decode(data: bytes) -> AnalysisResult:
+        return AnalysisResult.from_dict(serialization.loads(data))
+
+    def count(self, **filters) -> int:
+        """Number of results matching the filters"""
+        self.flush()
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM results{where}', params).fetchone()[0]
+
+    def query(self, limit: Optional[int] = None, offset: int = 0, newest_first: bool = True,
+              **filters) -> List[AnalysisResult]:
+        """Return one page of results matching the filters"""
+        self.flush()
+        where, params = self._where(**filters)
+        order = 'DESC' if newest_first else 'ASC'
+        sql = f'SELECT data FROM results{where} ORDER BY id {order} LIMIT ? OFFSET ?'
+        params.extend((-1 if limit is None else limit, offset))
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._decode(data) for data, in rows]
+
+    def iter_results(self, chunk_size: int = 500, **filters) -> Iterator[AnalysisResult]:
+        """Yield every matching result in insertion order, holding one chunk in memory at a time"""
+        self.flush()
+        where, params = self._where(**filters)
+        where = f'{where} AND id > ?' if where else ' WHERE id > ?'
+        sql = f'SELECT id, data FROM results{where} ORDER BY id LIMIT ?'
+
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, params + [last_id, chunk_size]).fetchall()
+            for row_id, data in rows:
+                yield self._decode(data)
+            if len(rows) < chunk_size:
+                break
+            last_id = rows[-1][0]
+
+    def get(self, analysis_id: str) -> Optional[AnalysisResult]:
+        """Fetch one result by analysis_id"""
+        self.flush()
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM results WHERE analysis_id = ?', (analysis_id,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def risk_levels(self) -> List[str]:
+        """Distinct risk levels present in the store"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT DISTINCT risk_level FROM results WHERE risk_level IS NOT NULL ORDER BY risk_level'
+            ).fetchall()
+        return [risk_level for risk_level, in rows]
+
+    def version(self) -> Tuple[int, int]:
+        """Token that changes whenever the stored results change, for caching aggregates
+
+        Combines this store's own commit count with SQLite's data_version, which
+        moves when another connection (a service or worker process) commits.
+        """
+        self.flush()
+        with self._lock:
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            return self._writes, data_version
+
+    def summarize(self, **filters) -> SummaryAggregator:
+        """Aggregate matching results in one streaming pass"""
+        return SummaryAggregator.from_results(self.iter_results(**filters))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get row counts and database size"""
+        self.flush()
+        with self._lock:
+            results = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            identifiers = self._conn.execute('SELECT COUNT(*) FROM identifiers').fetchone()[0]
+        return {
+            'path': self.path,
+            'results': results,
+            'identifiers': identifiers,
+            'size_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        }
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def close(self):
+        """Flush pending writes and close the database"""
+        self.flush()
+        with self._lock:
+            self._conn.close()
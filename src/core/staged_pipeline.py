@@ -0,0 +1,228 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .analysis_tool import TorAnalyzer
+from .blob_store import ContentStore
+from .deanonymizer import TorDeanonymizer
+from .models import AnalysisResult
+from .parse_pool import ParsePool
+from .pipeline import enrich_result, error_result
+
+# Pipeline stages in order, and the TorAnalyzer stages each one runs
+STAGES = ('fetch', 'parse', 'probe', 'enrich', 'store')
+ANALYZER_STAGES = {
+    'fetch': ('fetch',),
+    'parse': ('content',),
+    'probe': ('technical', 'geolocation', 'scoring')
+}
+
+# Tells a stage worker that no more items are coming
+_DONE = object()
+
+
+def default_stage_workers(parse_pool: Optional[ParsePool] = None) -> Dict[str, int]:
+    """Worker threads per stage: many for the network-bound stages, few for parsing"""
+    parse_workers = parse_pool.processes if parse_pool is not None else 2
+    return {'fetch': 8, 'parse': parse_workers, 'probe': 8, 'enrich': 4, 'store': 1}
+
+
+class _Item:
+    __slots__ = ('url', 'analysis_id', 'result', 'ok')
+
+    def __init__(self, url: str, analysis_id: Optional[str]):
+        self.url = url
+        self.analysis_id = analysis_id
+        self.result = None
+        # False once an analyzer stage raised; the remaining analyzer stages are then skipped
+        self.ok = True
+
+
+class Stage:
+    """One pipeline stage: a pool of worker threads fed by a bounded queue"""
+
+    def __init__(self, name: str, handler: Callable[[_Item], None], workers: int, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.live_workers = workers
+        self.lock = threading.Lock()
+
+    def get_stats(self, elapsed: float) -> Dict[str, Any]:
+        with self.lock:
+            processed, errors, busy_time = self.processed, self.errors, self.busy_time
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'processed': processed,
+            'errors': errors,
+            'items_per_second': round(processed / elapsed, 2) if elapsed > 0 else 0,
+            'avg_seconds': round(busy_time / processed, 3) if processed else 0,
+            # Share of the pool's time spent working; near 1.0 marks the bottleneck
+            'utilization': round(busy_time / (elapsed * self.workers), 2) if elapsed > 0 else 0
+        }
+
+
+class StagedPipeline:
+    """Analyze URLs as a pipeline of stages with their own worker pools
+
+    fetch (HTTP) -> parse (content analysis) -> probe (TLS, timing, admin
+    pages, geolocation, scoring) -> enrich (OSINT, metadata,
+    cross-references) -> store (the `sink` callback). Every stage takes work
+    from a bounded queue, so network-bound and CPU-bound stages overlap
+    across URLs, and a slow stage blocks the stage feeding it instead of
+    letting results pile up in memory. Input URLs are read lazily for the
+    same reason. Each result is the same as analyze_single_url's for the URL.
+
+    `stats()` reports per-stage queue depth, throughput, latency and
+    utilization while the pipeline runs.
+    """
+
+    def __init__(self, sink: Callable[[AnalysisResult], None], options: Optional[Dict[str, Any]] = None,
+                 content_store: Optional[ContentStore] = None, parse_pool: Optional[ParsePool] = None,
+                 workers: Optional[Dict[str, int]] = None, queue_size: Optional[int] = None):
+        self.sink = sink
+        self.options = options or {}
+        self.content_store = content_store
+        self.parse_pool = parse_pool
+        self.started_at = None
+        self.stop_event = threading.Event()
+        self._error = None
+
+        stage_workers = {**default_stage_workers(parse_pool), **(workers or {})}
+        handlers = {
+            'fetch': self._analyze,
+            'parse': self._analyze,
+            'probe': self._analyze,
+            'enrich': self._enrich,
+            'store': self._store
+        }
+        self.stages: List[Stage] = []
+        for name in STAGES:
+            count = max(1, stage_workers[name])
+            # Two items per worker keeps every worker busy without buffering much
+            self.stages.append(Stage(name, handlers[name], count, queue_size or count * 2))
+
+        # Analyzers hold a Tor session, so each worker thread gets its own
+        self._local = threading.local()
+
+    def _analyzers(self):
+        if not hasattr(self._local, 'analyzer'):
+            self._local.analyzer = TorAnalyzer(parse_pool=self.parse_pool)
+            self._local.deanonymizer = TorDeanonymizer(parse_pool=self.parse_pool)
+        return self._local.analyzer, self._local.deanonymizer
+
+    # Stage handlers
+
+    def _analyze(self, item: _Item):
+        analyzer, _ = self._analyzers()
+        if item.result is None:
+            item.result = analyzer.new_result(item.url)
+        if item.ok:
+            item.ok = analyzer.run_stages(item.result, ANALYZER_STAGES[self._local.stage])
+
+    def _enrich(self, item: _Item):
+        analyzer, deanonymizer = self._analyzers()
+        try:
+            item.result = enrich_result(item.result, analyzer, deanonymizer, self.options,
+                                        analysis_id=item.analysis_id, content_store=self.content_store)
+        except Exception as e:
+            item.result = error_result(item.url, str(e), analysis_id=item.analysis_id)
+            raise
+
+    def _store(self, item: _Item):
+        self.sink(item.result)
+
+    # Execution
+
+    def _work(self, index: int):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        self._local.stage = stage.name
+
+        while True:
+            item = stage.queue.get()
+            if item is _DONE:
+                break
+
+            start = time.perf_counter()
+            failed = False
+            try:
+                stage.handler(item)
+            except Exception as e:
+                failed = True
+                if next_stage is None:
+                    # The sink itself failed; stop feeding and report it from run()
+                    self._error = self._error or e
+                    self.stop_event.set()
+            with stage.lock:
+                stage.processed += 1
+                stage.errors += failed
+                stage.busy_time += time.perf_counter() - start
+
+            if next_stage is not None:
+                next_stage.queue.put(item)
+
+        # The last worker out tells every worker of the next stage to finish
+        with stage.lock:
+            stage.live_workers -= 1
+            last = stage.live_workers == 0
+        if last and next_stage is not None:
+            for _ in range(next_stage.workers):
+                next_stage.queue.put(_DONE)
+
+    def run(self, urls: Iterable[str], id_prefix: Optional[str] = None) -> int:
+        """Analyze every URL, passing results to the sink in completion order; returns the count stored
+
+        With `id_prefix`, results get analysis_id f"{id_prefix}_{index}".
+        """
+        self.started_at = time.time()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), daemon=True,
+                                          name=f"stage-{stage.name}-{number}")
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        try:
+            for index, url in enumerate(urls):
+                if self.stop_event.is_set():
+                    break
+                # Blocks while the fetch queue is full
+                first.queue.put(_Item(url, f"{id_prefix}_{index}" if id_prefix else None))
+        finally:
+            for _ in range(first.workers):
+                first.queue.put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+        return self.stages[-1].processed
+
+    def stop(self):
+        """Stop reading input; URLs already in the pipeline still finish"""
+        self.stop_event.set()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-stage workers, queue depth and size, items processed, errors, throughput and latency"""
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        return {stage.name: stage.get_stats(elapsed) for stage in self.stages}
+
+    def format_stats(self) -> str:
+        """One line per stage, for logs"""
+        lines = []
+        for name, stats in self.stats().items():
+            lines.append(f"{name:<7} workers={stats['workers']:<3} queue={stats['queue_depth']}/{stats['queue_size']:<4} "
+                         f"done={stats['processed']:<6} errors={stats['errors']:<4} "
+                         f"rate={stats['items_per_second']}/s avg={stats['avg_seconds']}s "
+                         f"util={stats['utilization']}")
+        return '\n'.join(lines)
@@ -0,0 +1,136 @@
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable
+
+
+class SummaryAggregator:
+    """Single-pass, mergeable aggregation of analysis results
+
+    Every field is a count or a sum, so partial aggregators built by separate
+    workers or batches can be combined in any order with `merge` / `+`.
+    """
+
+    COUNTERS = ('risk_distribution', 'server_types', 'content_types', 'response_codes',
+                'crypto_addresses', 'email_domains')
+    TOTALS = ('total_analyses', 'successful_analyses', 'failed_analyses', 'total_entities',
+              'total_osint_sources', 'social_media_references', 'sites_with_ssl',
+              'sites_with_forms', 'security_score_sum')
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, Counter())
+        for name in self.TOTALS:
+            setattr(self, name, 0)
+
+    @classmethod
+    def from_results(cls, analysis_results: Iterable[Dict[str, Any]]) -> 'SummaryAggregator':
+        """Build an aggregator from an iterable of results in one scan"""
+        aggregator = cls()
+        aggregator.update(analysis_results)
+        return aggregator
+
+    def update(self, analysis_results: Iterable[Dict[str, Any]]) -> 'SummaryAggregator':
+        """Add many results"""
+        for result in analysis_results:
+            self.add(result)
+        return self
+
+    def add(self, result: Dict[str, Any]):
+        """Add a single result"""
+        self.total_analyses += 1
+
+        if 'error' in result:
+            self.failed_analyses += 1
+            return
+
+        self.successful_analyses += 1
+
+        # Risk distribution
+        self.risk_distribution[result.get('risk_level', 'unknown')] += 1
+
+        # Technical summary
+        self.server_types[result.get('server_info', 'unknown')] += 1
+        self.content_types[result.get('content_type', 'unknown')] += 1
+        self.response_codes[str(result.get('response_code', 'unknown'))] += 1
+
+        # OSINT summary
+        self.total_entities += len(result.get('entities', []))
+        self.total_osint_sources += len(result.get('osint_sources', []))
+
+        for crypto_type, addresses in result.get('crypto_addresses', {}).items():
+            self.crypto_addresses[crypto_type] += len(addresses)
+
+        for email in result.get('emails', []):
+            self.email_domains[email.split('@')[-1] if '@' in email else 'unknown'] += 1
+
+        self.social_media_references += len(result.get('social_media', []))
+
+        # Security analysis
+        if result.get('ssl_info'):
+            self.sites_with_ssl += 1
+        if result.get('forms', []):
+            self.sites_with_forms += 1
+
+        self.security_score_sum += result.get('security_headers', {}).get('score', 0)
+
+    def merge(self, other: 'SummaryAggregator') -> 'SummaryAggregator':
+        """Fold another aggregator into this one"""
+        for name in self.COUNTERS:
+            getattr(self, name).update(getattr(other, name))
+        for name in self.TOTALS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def __add__(self, other: 'SummaryAggregator') -> 'SummaryAggregator':
+        return SummaryAggregator().merge(self).merge(other)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the raw aggregation state (for sending between processes)"""
+        state = {name: dict(getattr(self, name)) for name in self.COUNTERS}
+        state.update({name: getattr(self, name) for name in self.TOTALS})
+        return state
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'SummaryAggregator':
+        """Rebuild an aggregator from to_dict() output"""
+        aggregator = cls()
+        for name in cls.COUNTERS:
+            getattr(aggregator, name).update(state.get(name, {}))
+        for name in cls.TOTALS:
+            setattr(aggregator, name, state.get(name, 0))
+        return aggregator
+
+    @property
+    def avg_security_score(self) -> float:
+        if not self.successful_analyses:
+            return 0
+        return round(self.security_score_sum / self.successful_analyses, 2)
+
+    def to_report(self) -> Dict[str, Any]:
+        """Render the summary report structure used by the exports and dashboard"""
+        return {
+            'report_metadata': {
+                'generated_at': datetime.now().isoformat(),
+                'total_analyses': self.total_analyses,
+                'successful_analyses': self.successful_analyses,
+                'failed_analyses': self.failed_analyses
+            },
+            'risk_distribution': dict(self.risk_distribution),
+            'technical_summary': {
+                'server_types': dict(self.server_types),
+                'content_types': dict(self.content_types),
+                'response_codes': dict(self.response_codes)
+            },
+            'osint_summary': {
+                'total_entities': self.total_entities,
+                'total_osint_sources': self.total_osint_sources,
+                'crypto_addresses': dict(self.crypto_addresses),
+                'email_domains': dict(self.email_domains),
+                'social_media_references': self.social_media_references
+            },
+            'security_analysis': {
+                'avg_security_score': self.avg_security_score,
+                'sites_with_ssl': self.sites_with_ssl,
+                'sites_with_forms': self.sites_with_forms
+            }
+        }
@@ -0,0 +1,247 @@
+import ipaddress
+import mmap
+import os
+import struct
+import threading
+import time
+from email.utils import formatdate
+from typing import Any, Dict, Iterable, Optional
+
+import requests
+
+from utils import serialization
+
+# File layout: 16-byte header followed by sorted 16-byte big-endian addresses.
+# IPv4 addresses are stored IPv4-mapped (::ffff:a.b.c.d) so both families share one array.
+INDEX_MAGIC = b'TOREXIT1'
+HEADER_FORMAT = '>8sQ'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_SIZE = 16
+
+
+def pack_ip(ip: str) -> Optional[bytes]:
+    """Pack an IPv4/IPv6 address into 16 sortable bytes"""
+    try:
+        address = ipaddress.ip_address(ip.strip())
+    except ValueError:
+        return None
+
+    if address.version == 4:
+        address = ipaddress.IPv6Address(b'\x00' * 10 + b'\xff\xff' + address.packed)
+    return address.packed
+
+
+class TorExitIndex:
+    """Sorted, memory-mapped on-disk index of Tor exit node addresses"""
+
+    def __init__(self, path: str, max_age: float = 3600, stat_interval: float = 5):
+        self.path = path
+        self.meta_path = f"{path}.meta"
+        self.max_age = max_age
+        self.stat_interval = stat_interval
+
+        self._lock = threading.Lock()
+        # Held while downloading, building or writing metadata, so one thread updates the files at a time
+        self._update_lock = threading.RLock()
+        self._file = None
+        self._map = None
+        self._count = 0
+        self._mtime_ns = None
+        self._last_stat = 0.0
+
+        self._open()
+
+    def __contains__(self, ip: str) -> bool:
+        return self.contains(ip)
+
+    def __len__(self) -> int:
+        self._check_for_update()
+        return self._count
+
+    def contains(self, ip: str) -> bool:
+        """Check whether an IP is a known exit node (binary search, O(log n))"""
+        packed = pack_ip(ip)
+        if packed is None:
+            return False
+
+        self._check_for_update()
+
+        with self._lock:
+            if not self._map:
+                return False
+
+            low, high = 0, self._count
+            while low < high:
+                mid = (low + high) // 2
+                offset = HEADER_SIZE + mid * RECORD_SIZE
+                record = self._map[offset:offset + RECORD_SIZE]
+                if record < packed:
+                    low = mid + 1
+                elif record > packed:
+                    high = mid
+                else:
+                    return True
+
+            return False
+
+    def needs_refresh(self) -> bool:
+        """Check whether the on-disk list is older than max_age"""
+        meta = self._read_meta()
+        return time.time() - meta.get('fetched_at', 0) > self.max_age
+
+    def refresh_if_needed(self, session: requests.Session, url: str, timeout: int = 30) -> bool:
+        """Refresh a stale list unless another thread is already at it; returns True if rebuilt
+
+        Threads that find a refresh running carry on with the current index
+        instead of downloading the list again.
+        """
+        if not self._update_lock.acquire(blocking=False):
+            return False
+        try:
+            return self.needs_refresh() and self.refresh(session, url, timeout)
+        finally:
+            self._update_lock.release()
+
+    def refresh(self, session: requests.Session, url: str, timeout: int = 30) -> bool:
+        """Download the exit list if it changed since the last fetch"""
+        with self._update_lock:
+            return self._refresh(session, url, timeout)
+
+    def _refresh(self, session: requests.Session, url: str, timeout: int) -> bool:
+        meta = self._read_meta()
+        headers = {}
+        if meta.get('last_modified') and os.path.exists(self.path):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        response = session.get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 304:
+            meta['fetched_at'] = time.time()
+            self._write_meta(meta)
+            return False
+
+        if response.status_code != 200:
+            return False
+
+        self.build(response.text.splitlines())
+        self._write_meta({
+            'fetched_at': time.time(),
+            'last_modified': response.headers.get('Last-Modified') or formatdate(usegmt=True),
+            'count': self._count,
+            'source': url
+        })
+        return True
+
+    def build(self, addresses: Iterable[str]):
+        """Write a new index file atomically and map it"""
+        records = sorted({packed for packed in map(pack_ip, addresses) if packed})
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._update_lock:
+            tmp_path = _tmp_path(self.path)
+            with open(tmp_path, 'wb') as f:
+                f.write(struct.pack(HEADER_FORMAT, INDEX_MAGIC, len(records)))
+                f.write(b''.join(records))
+            os.replace(tmp_path, self.path)
+
+            self._open()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index size and freshness information"""
+        meta = self._read_meta()
+        return {
+            'path': self.path,
+            'entries': len(self),
+            'fetched_at': meta.get('fetched_at'),
+            'last_modified': meta.get('last_modified')
+        }
+
+    def _open(self):
+        """(Re)map the index file; other processes share the same pages"""
+        with self._lock:
+            self._close_locked()
+
+            try:
+                stat = os.stat(self.path)
+                if stat.st_size < HEADER_SIZE:
+                    return
+
+                self._file = open(self.path, 'rb')
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, count = struct.unpack(HEADER_FORMAT, self._map[:HEADER_SIZE])
+                if magic != INDEX_MAGIC or HEADER_SIZE + count * RECORD_SIZE > stat.st_size:
+                    self._close_locked()
+                    return
+
+                self._count = count
+                self._mtime_ns = stat.st_mtime_ns
+            except OSError:
+                self._close_locked()
+            finally:
+                self._last_stat = time.time()
+
+    def _close_locked(self):
+        if self._map:
+            self._map.close()
+        if self._file:
+            self._file.close()
+        self._map = None
+        self._file = None
+        self._count = 0
+        self._mtime_ns = None
+
+    def _check_for_update(self):
+        """Pick up an index rebuilt by another process"""
+        if time.time() - self._last_stat < self.stat_interval:
+            return
+
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+
+        if mtime_ns != self._mtime_ns:
+            self._open()
+        else:
+            self._last_stat = time.time()
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self.meta_path, 'rb') as f:
+                return serialization.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        with self._update_lock:
+            tmp_path = _tmp_path(self.meta_path)
+            with open(tmp_path, 'wb') as f:
+                serialization.dump(meta, f)
+            os.replace(tmp_path, self.meta_path)
+
+
+def _tmp_path(path: str) -> str:
+    # Unique per process and thread, so writers never share a temporary file
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+_shared_indexes: Dict[str, TorExitIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_index(path: str, max_age: float = 3600) -> TorExitIndex:
+    """The process-wide index for `path`, created on first use
+
+    Analyzers are built per worker thread; sharing their index maps the file
+    once and lets a single thread refresh it. Settings only apply when the
+    index is created.
+    """
+    key = os.path.abspath(path)
+    with _shared_lock:
+        index = _shared_indexes.get(key)
+        if index is None:
+            index = _shared_indexes[key] = TorExitIndex(path, max_age=max_age)
+        return index
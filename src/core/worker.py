@@ -0,0 +1,170 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .analysis_tool import TorAnalyzer
+from .blob_store import ContentStore
+from .broker import Task, TaskBroker, default_worker_id
+from .deanonymizer import TorDeanonymizer
+from .job_runner import TRANSIENT_ERRORS, TRANSIENT_EXCEPTIONS
+from .parse_pool import ParsePool
+from .pipeline import analyze_single_url, error_result
+from .result_store import ResultStore
+
+
+class DistributedWorker:
+    """Pull analysis tasks from a shared broker and store their results
+
+    Run one per host (each with its own Tor instance) against the same broker
+    to scale out. Tasks are acknowledged only after their results are flushed
+    to the ResultStore, so a crash loses no work: unacknowledged leases expire
+    and the tasks are delivered again. Redelivered results reuse the task's
+    analysis_id and overwrite rather than duplicate. Leases of in-flight
+    tasks are renewed by a heartbeat thread while analysis runs.
+    """
+
+    def __init__(self, broker: TaskBroker, result_store: ResultStore,
+                 content_store: Optional[ContentStore] = None, threads: int = 4,
+                 worker_id: Optional[str] = None, lease_seconds: float = 300.0, poll_interval: float = 2.0,
+                 max_attempts: int = 3, retry_delay: float = 30.0, max_retry_delay: float = 600.0,
+                 checkpoint_every: int = 10, checkpoint_interval: float = 5.0,
+                 parse_pool: Optional[ParsePool] = None):
+        self.broker = broker
+        self.result_store = result_store
+        self.content_store = content_store
+        self.threads = threads
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.parse_pool = parse_pool
+
+        self.stop_event = threading.Event()
+        self.stats = {'done': 0, 'failed': 0, 'retried': 0}
+
+        self._lock = threading.Lock()
+        # Leased tasks not yet acknowledged, by task id; the heartbeat keeps their leases alive
+        self._in_flight: Dict[str, Task] = {}
+        # Finished tasks whose results await the next flush
+        self._finished: List[Task] = []
+        self._last_checkpoint = time.time()
+
+        # Analyzers hold a Tor session, so each worker thread gets its own
+        self._local = threading.local()
+
+    def _analyzers(self):
+        if not hasattr(self._local, 'analyzer'):
+            self._local.analyzer = TorAnalyzer(parse_pool=self.parse_pool)
+            self._local.deanonymizer = TorDeanonymizer(parse_pool=self.parse_pool)
+        return self._local.analyzer, self._local.deanonymizer
+
+    def run(self, drain: bool = False):
+        """Work until stop() is called, or with `drain` until the broker has nothing left"""
+        heartbeat = threading.Thread(target=self._heartbeat, name='worker-heartbeat', daemon=True)
+        heartbeat.start()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='worker') as executor:
+                for _ in range(self.threads):
+                    executor.submit(self._loop, drain)
+        finally:
+            self.stop_event.set()
+            self._checkpoint()
+
+    def stop(self):
+        """Finish the tasks in hand and stop leasing new ones"""
+        self.stop_event.set()
+
+    def _loop(self, drain: bool):
+        while not self.stop_event.is_set():
+            tasks = self.broker.lease(self.worker_id, 1, self.lease_seconds)
+            if not tasks:
+                if drain and self._drained():
+                    return
+                self.stop_event.wait(self.poll_interval)
+                continue
+
+            task = tasks[0]
+            with self._lock:
+                self._in_flight[task.task_id] = task
+            self._process(task)
+
+    def _drained(self) -> bool:
+        counts = self.broker.stats()
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return counts['queued'] == 0 and counts['leased'] <= in_flight
+
+    def _process(self, task: Task):
+        if task.attempts > self.max_attempts:
+            # Leases of this task kept expiring, e.g. it crashes or hangs every worker that takes it
+            self._finish(task, error_result(task.url, f"Gave up after {task.attempts - 1} attempts",
+                                            analysis_id=task.analysis_id), failed=True)
+            return
+
+        try:
+            analyzer, deanonymizer = self._analyzers()
+            result = analyze_single_url(task.url, analyzer, deanonymizer, task.options,
+                                        analysis_id=task.analysis_id, content_store=self.content_store)
+            error = result.get('error')
+            transient = error in TRANSIENT_ERRORS
+        except Exception as e:
+            result = None
+            error = str(e)
+            transient = isinstance(e, TRANSIENT_EXCEPTIONS)
+
+        if transient and task.attempts < self.max_attempts:
+            delay = min(self.retry_delay * 2 ** (task.attempts - 1), self.max_retry_delay)
+            with self._lock:
+                self._in_flight.pop(task.task_id, None)
+                self.stats['retried'] += 1
+            self.broker.nack(task, error, delay=delay)
+            return
+
+        if result is None:
+            result = error_result(task.url, error, analysis_id=task.analysis_id)
+        self._finish(task, result, failed=bool(error))
+
+    def _finish(self, task: Task, result: Dict[str, Any], failed: bool):
+        self.result_store.add(result)
+        with self._lock:
+            self._finished.append(task)
+            self.stats['failed' if failed else 'done'] += 1
+            due = len(self._finished) >= self.checkpoint_every or \
+                time.time() - self._last_checkpoint >= self.checkpoint_interval
+        if due:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        """Make finished results durable, then acknowledge their tasks"""
+        with self._lock:
+            finished, self._finished = self._finished, []
+            self._last_checkpoint = time.time()
+        if not finished:
+            return
+
+        self.result_store.flush()
+        for task in finished:
+            self.broker.ack(task)
+        with self._lock:
+            for task in finished:
+                self._in_flight.pop(task.task_id, None)
+
+    def _heartbeat(self):
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self.stop_event.wait(interval):
+            with self._lock:
+                tasks = list(self._in_flight.values())
+            if tasks:
+                try:
+                    self.broker.extend(tasks, self.lease_seconds)
+                except Exception:
+                    # A missed renewal only risks a duplicate delivery
+                    pass
+            # Results finished while the pool is idle still get flushed and acked
+            self._checkpoint()
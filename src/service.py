@@ -0,0 +1,358 @@
+"""HTTP API for submitting analysis jobs and reading their results
+
+Endpoints (JSON unless noted):
+    GET    /health                      liveness and queue depth
+    GET    /metrics                     per-stage latency, error and byte counters (Prometheus text)
+    POST   /jobs                        {"url": ...} or {"urls": [...], "options": {...}} -> 202 + job id
+    GET    /jobs                        recent jobs
+    GET    /jobs/<job_id>               job status and per-status URL counts
+    DELETE /jobs/<job_id>               cancel a job (it can be resumed later)
+    POST   /jobs/<job_id>/resume        resume a cancelled or failed job
+    GET    /jobs/<job_id>/results       paginated results (?limit=&offset=)
+    GET    /jobs/<job_id>/results.ndjson   every result, streamed as NDJSON
+    GET    /results                     paginated query over all results
+    GET    /results.ndjson              streamed query over all results
+
+Result queries accept url, url_contains, risk_level (repeatable), since, until,
+content_hash, identifier, identifier_kind and has_error. When the queue holds
+more than SERVICE_MAX_QUEUED_URLS unfinished URLs, POST /jobs answers 429 with
+a Retry-After header. Set SERVICE_API_TOKEN to require
+`Authorization: Bearer <token>` on every request except /health.
+
+    python service.py --host 0.0.0.0 --port 8080 --workers 8
+"""
+import argparse
+import hmac
+import os
+import sys
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from core.blob_store import ContentStore
+from core.job_runner import JobRunner, QueueFullError
+from core.job_store import JobStore
+from core.parse_pool import parse_pool_from_env
+from core.result_store import ResultStore
+from utils import metrics, serialization
+from utils.validators import URLValidator
+
+MAX_PAGE_SIZE = 1000
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+_STRING_FILTERS = ('url', 'url_contains', 'since', 'until', 'content_hash', 'identifier', 'identifier_kind')
+
+
+class ApiError(Exception):
+    """Error returned to the client as {"error": message} with an HTTP status"""
+
+    def __init__(self, status: HTTPStatus, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class AnalysisService:
+    """Request handling independent of the HTTP server plumbing"""
+
+    def __init__(self, job_runner: JobRunner, result_store: ResultStore, api_token: Optional[str] = None,
+                 max_batch_size: int = 10000):
+        self.job_runner = job_runner
+        self.result_store = result_store
+        self.api_token = api_token
+        self.max_batch_size = max_batch_size
+        self.validator = URLValidator()
+
+    def check_auth(self, authorization: Optional[str]):
+        if not self.api_token:
+            return
+        expected = f"Bearer {self.api_token}"
+        if not authorization or not hmac.compare_digest(authorization, expected):
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Missing or invalid API token")
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            'status': 'ok',
+            'queued_urls': self.job_runner.queued_url_count(),
+            'max_queued_urls': self.job_runner.max_queued_urls
+        }
+
+    def submit(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        urls = body.get('urls')
+        if urls is None and body.get('url'):
+            urls = [body['url']]
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Provide 'url' or a non-empty 'urls' list of strings")
+        if len(urls) > self.max_batch_size:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                           f"Batches are limited to {self.max_batch_size} URLs")
+
+        urls = [url.strip() for url in urls]
+        invalid = [url for url in urls if not self.validator.is_valid_onion_url(url)]
+        if invalid and not body.get('skip_invalid'):
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"Invalid onion URLs: {invalid[:10]}")
+        urls = [url for url in urls if url not in invalid]
+        if not urls:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "No valid onion URLs to analyze")
+
+        options = body.get('options') or {}
+        if not isinstance(options, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "'options' must be an object")
+
+        try:
+            job_id = self.job_runner.submit(urls, options, owner=body.get('owner'))
+        except QueueFullError as e:
+            raise ApiError(HTTPStatus.TOO_MANY_REQUESTS, str(e), headers={'Retry-After': '60'})
+
+        return {
+            'job_id': job_id,
+            'url_count': len(urls),
+            'skipped': invalid,
+            'status_url': f"/jobs/{job_id}",
+            'results_url': f"/jobs/{job_id}/results"
+        }
+
+    def job_status(self, job_id: str) -> Dict[str, Any]:
+        status = self.job_runner.get_status(job_id)
+        if status is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"Unknown job: {job_id}")
+        status['url_counts'] = self.job_runner.get_url_counts(job_id)
+        return status
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        self.job_status(job_id)
+        return {'job_id': job_id, 'cancelled': self.job_runner.cancel(job_id)}
+
+    def resume(self, job_id: str) -> Dict[str, Any]:
+        self.job_status(job_id)
+        return {'job_id': job_id, 'resumed': self.job_runner.resume(job_id)}
+
+    def filters(self, query: Dict[str, list], job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Translate query-string parameters into ResultStore filters"""
+        filters = {name: query[name][0] for name in _STRING_FILTERS if query.get(name)}
+        if query.get('risk_level'):
+            filters['risk_level'] = query['risk_level']
+        if query.get('has_error'):
+            filters['has_error'] = query['has_error'][0].lower() in ('1', 'true', 'yes')
+        if job_id is not None:
+            self.job_status(job_id)
+            filters['job_id'] = job_id
+        return filters
+
+    def page(self, query: Dict[str, list], job_id: Optional[str] = None) -> Dict[str, Any]:
+        filters = self.filters(query, job_id)
+        try:
+            limit = int(query.get('limit', ['100'])[0])
+            offset = int(query.get('offset', ['0'])[0])
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "'limit' and 'offset' must be integers")
+        if limit < 1 or offset < 0:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "'limit' must be at least 1 and 'offset' at least 0")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        total = self.result_store.count(**filters)
+        results = self.result_store.query(limit=limit, offset=offset, newest_first=False, **filters)
+        next_offset = offset + len(results)
+        return {
+            'total': total,
+            'limit': limit,
+            'offset': offset,
+            'next_offset': next_offset if next_offset < total else None,
+            'results': results
+        }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Routes requests to the AnalysisService attached to the server"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'TorAnalysisService/1.0'
+
+    @property
+    def service(self) -> AnalysisService:
+        return self.server.service
+
+    def log_message(self, format: str, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: HTTPStatus, payload: Any, headers: Optional[Dict[str, str]] = None):
+        body = serialization.dumps(payload)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: HTTPStatus, text: str, content_type: str):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_ndjson(self, results):
+        """Send results with chunked transfer encoding, a batch of lines per chunk
+        
+        The status line is already sent when the results are read, so a failure
+        part-way closes the connection without the final chunk; clients see a
+        truncated body instead of a complete one.
+        """
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        try:
+            buffer = bytearray()
+            for result in results:
+                buffer += serialization.ndjson_line(result)
+                if len(buffer) >= 64 * 1024:
+                    self._write_chunk(buffer)
+                    buffer = bytearray()
+            if buffer:
+                self._write_chunk(buffer)
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            self.log_error("NDJSON stream failed: %s", e)
+            self.close_connection = True
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + bytes(data) + b'\r\n')
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        try:
+            body = serialization.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Request body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object")
+        return body
+
+    def _dispatch(self, method: str):
+        parsed = urlparse(self.path)
+        parts = [part for part in parsed.path.split('/') if part]
+        query = parse_qs(parsed.query)
+
+        try:
+            if method == 'GET' and parts == ['health']:
+                return self._send_json(HTTPStatus.OK, self.service.health())
+
+            self.service.check_auth(self.headers.get('Authorization'))
+
+            if method == 'GET' and parts == ['metrics']:
+                return self._send_text(HTTPStatus.OK, metrics.REGISTRY.prometheus_text(),
+                                       'text/plain; version=0.0.4; charset=utf-8')
+            if parts[:1] == ['jobs']:
+                if method == 'POST' and len(parts) == 1:
+                    return self._send_json(HTTPStatus.ACCEPTED, self.service.submit(self._read_json()))
+                if method == 'GET' and len(parts) == 1:
+                    return self._send_json(HTTPStatus.OK, {'jobs': self.service.job_runner.list_jobs()})
+                if len(parts) == 2:
+                    if method == 'GET':
+                        return self._send_json(HTTPStatus.OK, self.service.job_status(parts[1]))
+                    if method == 'DELETE':
+                        return self._send_json(HTTPStatus.OK, self.service.cancel(parts[1]))
+                if len(parts) == 3 and method == 'POST' and parts[2] == 'resume':
+                    return self._send_json(HTTPStatus.OK, self.service.resume(parts[1]))
+                if len(parts) == 3 and method == 'GET' and parts[2] == 'results':
+                    return self._send_json(HTTPStatus.OK, self.service.page(query, job_id=parts[1]))
+                if len(parts) == 3 and method == 'GET' and parts[2] == 'results.ndjson':
+                    filters = self.service.filters(query, job_id=parts[1])
+                    return self._stream_ndjson(self.service.result_store.iter_results(**filters))
+
+            if method == 'GET' and parts == ['results']:
+                return self._send_json(HTTPStatus.OK, self.service.page(query))
+            if method == 'GET' and parts == ['results.ndjson']:
+                filters = self.service.filters(query)
+                return self._stream_ndjson(self.service.result_store.iter_results(**filters))
+
+            raise ApiError(HTTPStatus.NOT_FOUND, f"No route for {method} {parsed.path}")
+
+        except ApiError as e:
+            self._send_json(e.status, {'error': e.message}, headers=e.headers)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"Internal error: {e}"})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class AnalysisHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service: AnalysisService, quiet: bool = False):
+        super().__init__(address, RequestHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Serve the onion analyzer over HTTP")
+    parser.add_argument('--host', default=os.getenv('SERVICE_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('SERVICE_PORT', '8080')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('ANALYSIS_WORKERS', '4')),
+                        help="Concurrent jobs")
+    parser.add_argument('--url-workers', type=int, default=int(os.getenv('ANALYSIS_URL_WORKERS', '8')),
+                        help="Concurrent URLs across all jobs")
+    parser.add_argument('--max-queued-urls', type=int,
+                        default=int(os.getenv('SERVICE_MAX_QUEUED_URLS', '10000')),
+                        help="Unfinished URLs accepted before POST /jobs returns 429")
+    parser.add_argument('--parse-processes', type=int, metavar='N',
+                        help="Parse pages in N worker processes (default: PARSE_PROCESSES, 0 = in-thread)")
+    parser.add_argument('--quiet', action='store_true', help="Do not log every request")
+    return parser
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    result_store = ResultStore(os.getenv('RESULT_STORE_PATH', 'data/results.db'))
+    parse_pool = parse_pool_from_env(args.parse_processes)
+    job_runner = JobRunner(result_store,
+                           job_store=JobStore(os.getenv('JOB_STORE_PATH', 'data/jobs.db')),
+                           content_store=ContentStore(os.getenv('CONTENT_STORE_PATH', 'data/blobs')),
+                           max_workers=max(1, args.workers),
+                           url_workers=max(1, args.url_workers),
+                           max_queued_urls=args.max_queued_urls,
+                           parse_pool=parse_pool)
+    resumed = job_runner.resume_incomplete()
+
+    service = AnalysisService(job_runner, result_store, api_token=os.getenv('SERVICE_API_TOKEN'))
+    server = AnalysisHTTPServer((args.host, args.port), service, quiet=args.quiet)
+
+    print(f"Serving on http://{args.host}:{args.port} ({len(resumed)} jobs resumed)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        job_runner.shutdown()
+        result_store.close()
+        if parse_pool is not None:
+            parse_pool.shutdown()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""Process-wide latency, error and traffic metrics for the analysis stages
+
+    with timed('fetch'):
+        ...
+
+records the block's duration in the `onion_analysis_stage_seconds` histogram
+(and counts it in `onion_analysis_stage_errors_total` if it raises). Inside
+`collect_timings(result_timings)` the durations are also added to that dict,
+which is how each AnalysisResult gets its `timings` breakdown. Export
+everything with `REGISTRY.prometheus_text()`.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds: fast parsing steps through slow Tor round trips
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, as Prometheus expects"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def summary(self, **labels) -> Dict[str, float]:
+        """Count, sum and bucket-estimated p50/p90/p99 for one label set"""
+        with self._lock:
+            entry = self._values.get(tuple(labels[name] for name in self.labels))
+            counts, total = (list(entry[0]), entry[1]) if entry else ([0] * (len(self.buckets) + 1), 0.0)
+
+        count = sum(counts)
+        result = {'count': count, 'sum': round(total, 6), 'avg': round(total / count, 6) if count else 0.0}
+        for name, quantile in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            result[name] = self._quantile(counts, quantile) if count else 0.0
+        return result
+
+    def _quantile(self, counts: List[int], quantile: float) -> float:
+        rank = quantile * sum(counts)
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def label_sets(self) -> List[Dict[str, str]]:
+        with self._lock:
+            keys = sorted(self._values)
+        return [dict(zip(self.labels, key)) for key in keys]
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(entry[0]), entry[1]) for key, entry in self._values.items())
+
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                labels = _format_labels(self.labels, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsRegistry:
+    """Named metrics of one process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram('onion_analysis_stage_seconds',
+                                   'Time spent in each analysis stage', ['stage'])
+STAGE_ERRORS = REGISTRY.counter('onion_analysis_stage_errors_total',
+                                'Analysis stages that raised or reported an error', ['stage'])
+BYTES_RECEIVED = REGISTRY.counter('onion_analysis_bytes_received_total',
+                                  'Response body bytes received, by stage', ['stage'])
+
+_local = threading.local()
+
+# The running utils.profiling.Profiler, if any; `timed` tells it where each thread is
+_profiler = None
+
+
+def set_profiler(profiler):
+    global _profiler
+    if profiler is not None and _profiler is not None:
+        raise RuntimeError("Another profiler is already running")
+    _profiler = profiler
+
+
+@contextmanager
+def collect_timings(timings: Dict[str, float]) -> Iterator[Dict[str, float]]:
+    """Also add durations of `timed` blocks run by this thread to `timings`"""
+    previous = getattr(_local, 'timings', None)
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record how long the block takes under `stage`, and count it as an error if it raises"""
+    profiler = _profiler
+    token = profiler.enter(stage) if profiler is not None else None
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler is not None:
+            profiler.exit(stage, token)
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed, 4)
+
+
+def record_timings(timings: Dict[str, float]):
+    """Record durations measured elsewhere (e.g. in a ParsePool process) as if timed here"""
+    collector = getattr(_local, 'timings', None)
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        if collector is not None:
+            collector[stage] = round(collector.get(stage, 0.0) + seconds, 4)
+
+
+def record_error(stage: str):
+    """Count an error a stage reported in its output instead of raising"""
+    STAGE_ERRORS.inc(stage=stage)
+
+
+def record_bytes(stage: str, count: Optional[int]):
+    """Count response body bytes received by a stage"""
+    if count:
+        BYTES_RECEIVED.inc(count, stage=stage)
+
+
+def write_prometheus_file(path: str):
+    """Write REGISTRY atomically, e.g. for node_exporter's textfile collector"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(REGISTRY.prometheus_text())
+    os.replace(temp_path, path)
+
+
+def stage_summary() -> Dict[str, Dict[str, float]]:
+    """Latency summary and error count per stage seen so far"""
+    summary = {}
+    for labels in STAGE_SECONDS.label_sets():
+        stage = labels['stage']
+        summary[stage] = STAGE_SECONDS.summary(stage=stage)
+        summary[stage]['errors'] = STAGE_ERRORS.get(stage=stage)
+        summary[stage]['bytes'] = BYTES_RECEIVED.get(stage=stage)
+    return summary
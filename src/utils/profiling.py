@@ -0,0 +1,257 @@
+"""Sampling profiler for analysis runs, attributed to the metrics stages
+
+While a Profiler runs, every `metrics.timed(stage)` block reports its thread
+and stage to it. A sampler thread takes the stacks of threads that are inside
+a stage (sys._current_frames) every `interval` seconds, and tracemalloc,
+switched on for some stage runs, records what each stage allocated. Output
+goes to `output_dir` in the folded-stack format read by flamegraph.pl,
+speedscope and inferno, with the stage path as the root frames:
+
+    cpu.folded      samples weighted by the thread's CPU microseconds since its last sample
+    wall.folded     one count per sample, including time blocked on the network
+    alloc.folded    bytes allocated and still alive at the end of sampled stage runs, by stack
+    summary.json    samples, CPU seconds and allocated bytes per stage
+
+When no Profiler runs, `timed` only checks a module global, so the stages
+cost nothing extra. Stages run by a ParsePool happen in other processes and
+show up as waiting in ParsePool._run; profile with PARSE_PROCESSES=0 to see
+inside them.
+
+    with Profiler('results.ndjson.profile'):
+        runner.run(urls, output)
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import metrics, serialization
+
+# Frames added by the profiler and tracemalloc themselves are left out of allocation stacks
+_IGNORED_FILES = (tracemalloc.__file__, __file__)
+
+
+def _thread_cpu_time(ident: int) -> Optional[float]:
+    """CPU seconds used by a thread, where the platform can tell (Linux, most Unixes)"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+
+class Profiler:
+    """Collect per-stage CPU, wall-clock and allocation profiles while running
+
+    Only one Profiler can run at a time in a process. `thread_ids` limits
+    profiling to those threads (e.g. the one running a job); by default every
+    thread that enters a stage is profiled.
+
+    tracemalloc slows allocation-heavy code (HTML parsing) down several times
+    over, so it only runs during allocation windows: a stage run during which
+    allocations are traced, with a snapshot of what survived at its end. One
+    window is open at a time, each stage gets one at most every
+    `snapshot_interval` seconds, and windows are spaced to cover about
+    `trace_fraction` of the wall-clock time. Tracing is process-wide, so
+    allocations of other threads during a window count towards it; allocation
+    profiles are cleanest with one worker. `memory=False` leaves them out.
+    """
+
+    def __init__(self, output_dir: str, interval: float = 0.01, memory: bool = True,
+                 snapshot_interval: float = 5.0, trace_fraction: float = 0.1, memory_frames: int = 16,
+                 thread_ids: Optional[Iterable[int]] = None):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.memory = memory
+        self.snapshot_interval = snapshot_interval
+        self.trace_fraction = trace_fraction
+        self.memory_frames = memory_frames
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+
+        self.started_at = None
+        self.stopped_at = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler = None
+
+        # Stage paths of the threads currently inside a stage, by thread ident
+        self._stages: Dict[int, List[str]] = {}
+        self._cpu_seen: Dict[int, float] = {}
+        self._labels: Dict[Any, str] = {}
+
+        self.wall = Counter()
+        self.cpu = Counter()
+        self.alloc = Counter()
+        self.stage_samples = Counter()
+        self.stage_cpu = Counter()
+        self.stage_alloc = Counter()
+        self.stage_windows = Counter()
+
+        self._window_open = False
+        self._next_window_at = 0.0
+        self._last_window: Dict[str, float] = defaultdict(float)
+
+    # Lifecycle
+
+    def start(self) -> 'Profiler':
+        metrics.set_profiler(self)
+        self.started_at = time.time()
+        self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self) -> str:
+        """Stop profiling and write the profile files; returns the output directory"""
+        if self._sampler is None:
+            return self.output_dir
+        self._stop_event.set()
+        self._sampler.join()
+        self._sampler = None
+        metrics.set_profiler(None)
+        self.stopped_at = time.time()
+        self.write()
+        return self.output_dir
+
+    def __enter__(self) -> 'Profiler':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Hooks called by metrics.timed
+
+    def enter(self, stage: str) -> Optional[float]:
+        """Track the thread's stage; returns the window start if this run gets an allocation window"""
+        ident = threading.get_ident()
+        if self.thread_ids is not None and ident not in self.thread_ids:
+            return None
+
+        with self._lock:
+            self._stages.setdefault(ident, []).append(stage)
+            now = time.monotonic()
+            # tracemalloc may already be in use by someone else, whose traces are not ours to stop
+            due = self.memory and not self._window_open and now >= self._next_window_at and \
+                now - self._last_window[stage] >= self.snapshot_interval and not tracemalloc.is_tracing()
+            if due:
+                self._window_open = True
+                self._last_window[stage] = now
+                tracemalloc.start(self.memory_frames)
+        return now if due else None
+
+    def exit(self, stage: str, window_start: Optional[float]):
+        ident = threading.get_ident()
+        if self.thread_ids is not None and ident not in self.thread_ids:
+            return
+
+        if window_start is not None:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            with self._lock:
+                path = ';'.join(f"stage:{name}" for name in self._stages.get(ident, ()))
+            self._record_allocations(stage, path, snapshot)
+
+        with self._lock:
+            stack = self._stages.get(ident)
+            if stack:
+                stack.pop()
+                if not stack:
+                    del self._stages[ident]
+                    # CPU used between stages must not count towards the next one
+                    self._cpu_seen.pop(ident, None)
+            if window_start is not None:
+                self._window_open = False
+                # The window (tracing plus snapshot) takes trace_fraction of the time until the next one
+                now = time.monotonic()
+                self._next_window_at = now + (now - window_start) * (1 / self.trace_fraction - 1)
+
+    # Sampling
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = \
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _folded(self, frame) -> str:
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                active = [(ident, tuple(stages)) for ident, stages in self._stages.items()]
+
+            for ident, stages in active:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                key = ';'.join(f"stage:{name}" for name in stages) + ';' + self._folded(frame)
+                self.wall[key] += 1
+                self.stage_samples[stages[-1]] += 1
+
+                cpu_time = _thread_cpu_time(ident)
+                if cpu_time is not None:
+                    # The first sample after a thread enters a stage only sets its baseline
+                    with self._lock:
+                        used = cpu_time - self._cpu_seen.get(ident, cpu_time)
+                        if ident in self._stages:
+                            self._cpu_seen[ident] = cpu_time
+                    if used > 0:
+                        self.cpu[key] += int(used * 1_000_000)
+                        self.stage_cpu[stages[-1]] += used
+            del frames
+
+    # Allocations
+
+    def _record_allocations(self, stage: str, path: str, snapshot: tracemalloc.Snapshot):
+        """Allocations traced during the window and still alive at its end, by allocating stack"""
+        allocations = []
+        for statistic in snapshot.statistics('traceback'):
+            if statistic.traceback[-1].filename in _IGNORED_FILES:
+                continue
+            frames = ';'.join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in statistic.traceback)
+            allocations.append((f"{path};{frames}", statistic.size))
+
+        with self._lock:
+            self.stage_windows[stage] += 1
+            for key, size in allocations:
+                self.alloc[key] += size
+                self.stage_alloc[stage] += size
+
+    # Output
+
+    def summary(self) -> Dict[str, Any]:
+        stages = set(self.stage_samples) | set(self.stage_windows)
+        return {
+            'started_at': self.started_at,
+            'duration_seconds': round((self.stopped_at or time.time()) - (self.started_at or time.time()), 3),
+            'interval_seconds': self.interval,
+            'memory': self.memory,
+            'stages': {
+                stage: {
+                    'samples': self.stage_samples[stage],
+                    'cpu_seconds': round(self.stage_cpu[stage], 4),
+                    'allocation_windows': self.stage_windows[stage],
+                    'allocated_bytes': self.stage_alloc[stage]
+                } for stage in sorted(stages)
+            }
+        }
+
+    def write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        files: List[Tuple[str, Counter]] = [('cpu.folded', self.cpu), ('wall.folded', self.wall)]
+        if self.memory:
+            files.append(('alloc.folded', self.alloc))
+        for name, counts in files:
+            with open(os.path.join(self.output_dir, name), 'w', encoding='utf-8') as f:
+                for key, count in counts.most_common():
+                    f.write(f"{key} {count}\n")
+        with open(os.path.join(self.output_dir, 'summary.json'), 'wb') as f:
+            serialization.dump(self.summary(), f, pretty=True)
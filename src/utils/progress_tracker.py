@@ -39,6 +39,15 @@ class ProgressTracker:
             self.results = []
             self._callback = callback
     
+    def resume_tracking(self, total_items: int, completed_items: int, success_count: int = 0,
+                        error_count: int = 0, callback: Optional[Callable] = None):
+        """Start tracking a session that already completed some items (e.g. a resumed job)"""
+        self.start_tracking(total_items, callback)
+        with self._lock:
+            self.success_count = success_count
+            self.error_count = error_count
+        self.update_progress(completed_items, status_message=f"Resuming at {completed_items}/{total_items}")
+
     def update_progress(self, completed_items: int, current_item: str = "", status_message: str = ""):
         """Update progress with current status"""
         with self._lock:
@@ -0,0 +1,81 @@
+import dataclasses
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, BinaryIO, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Name of the active backend, useful for diagnostics
+BACKEND = 'orjson' if orjson else 'json'
+
+if orjson:
+    # Dataclasses go through _default so models can control their JSON layout via to_dict()
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def _default(obj: Any) -> Any:
+    """Convert types the JSON backends don't handle natively"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        try:
+            return sorted(obj)
+        except TypeError:
+            return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8', errors='replace')
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    return str(obj)
+
+
+def dumps(obj: Any, pretty: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes; compact by default, indented when pretty"""
+    if orjson:
+        try:
+            options = _ORJSON_OPTIONS | orjson.OPT_INDENT_2 if pretty else _ORJSON_OPTIONS
+            return orjson.dumps(obj, default=_default, option=options)
+        except TypeError:
+            # e.g. integers wider than 64 bits; the stdlib encoder copes with those
+            pass
+
+    if pretty:
+        text = json.dumps(obj, default=_default, indent=2, ensure_ascii=False)
+    else:
+        text = json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False)
+    return text.encode('utf-8')
+
+
+def dumps_str(obj: Any, pretty: bool = False) -> str:
+    """Serialize to a JSON string"""
+    return dumps(obj, pretty=pretty).decode('utf-8')
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Parse JSON from bytes or str"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump(obj: Any, fp: BinaryIO, pretty: bool = False):
+    """Serialize to a binary file-like object"""
+    fp.write(dumps(obj, pretty=pretty))
+
+
+def load(fp: BinaryIO) -> Any:
+    """Parse JSON from a binary file-like object"""
+    return loads(fp.read())
+
+
+def ndjson_line(obj: Any) -> bytes:
+    """Serialize one record as a newline-terminated NDJSON line"""
+    return dumps(obj) + b'\n'
@@ -0,0 +1,182 @@
+"""Distributed analysis workers sharing one task broker
+
+Submit URLs once, then start workers on as many hosts as you have Tor
+instances; each worker leases tasks, analyzes them and writes results to the
+result store. Tasks are delivered at least once and results are keyed by
+task, so a crashed worker's tasks are simply picked up again elsewhere.
+
+The broker is chosen by URL (--broker or BROKER_URL):
+    sqlite:///data/broker.db     SQLite file, relative path (default)
+    file:///srv/broker           one JSON file per task, handy for tests
+                                 (file:data/broker for a relative directory)
+    redis://host:6379/0          Redis server, for workers on several hosts
+
+Every worker of a job must write to the same result store. With a SQLite or
+file broker it defaults to results.db next to the broker, which is shared
+whenever the broker is; with Redis, --result-store (or RESULT_STORE_PATH)
+must name a database on storage all workers mount.
+
+Examples:
+    python worker.py submit urls.txt --no-deep
+    python worker.py work --threads 8 --result-store /mnt/shared/results.db
+    python worker.py status <job_id>
+"""
+import argparse
+import os
+import signal
+import sys
+import time
+import uuid
+from typing import List, Optional
+
+from cli import iter_urls
+from core.blob_store import ContentStore
+from core.broker import broker_path, open_broker
+from core.parse_pool import parse_pool_from_env
+from core.result_store import ResultStore
+from core.worker import DistributedWorker
+from utils import metrics, serialization
+from utils.validators import URLValidator
+
+
+def submit(args) -> int:
+    urls = list(iter_urls(args.inputs))
+    if not args.no_validate:
+        validator = URLValidator()
+        invalid = [url for url in urls if not validator.is_valid_onion_url(url)]
+        for url in invalid:
+            print(f"Skipping invalid onion URL: {url}", file=sys.stderr)
+        urls = [url for url in urls if url not in invalid]
+
+    if not urls:
+        print("No URLs to submit", file=sys.stderr)
+        return 1
+
+    job_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    options = {
+        'deep_analysis': not args.no_deep,
+        'metadata_extraction': not args.no_metadata,
+        'cross_reference': not args.no_cross_reference
+    }
+
+    broker = open_broker(args.broker)
+    try:
+        count = broker.publish(job_id, urls, options)
+    finally:
+        broker.close()
+
+    print(job_id)
+    print(f"Queued {count} URLs", file=sys.stderr)
+    return 0
+
+
+def result_store_path(args) -> Optional[str]:
+    """The --result-store path, or results.db beside a SQLite or file broker"""
+    if args.result_store:
+        return args.result_store
+    path = broker_path(args.broker)
+    if path is None:
+        return None
+    directory = os.path.dirname(path) if args.broker.startswith('sqlite:') else path
+    return os.path.join(directory, 'results.db')
+
+
+def work(args) -> int:
+    store_path = result_store_path(args)
+    if store_path is None:
+        print("--result-store (or RESULT_STORE_PATH) is required with a Redis broker; "
+              "point every worker at the same database on shared storage", file=sys.stderr)
+        return 2
+
+    broker = open_broker(args.broker)
+    result_store = ResultStore(store_path)
+    parse_pool = parse_pool_from_env(args.parse_processes)
+    worker = DistributedWorker(
+        broker, result_store,
+        content_store=ContentStore(args.content_store) if args.content_store else None,
+        threads=max(1, args.threads),
+        worker_id=args.worker_id,
+        lease_seconds=args.lease_seconds,
+        max_attempts=args.max_attempts,
+        parse_pool=parse_pool
+    )
+
+    # Finish the URLs in hand on SIGTERM/Ctrl-C; their tasks are acknowledged on the way out
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    print(f"Worker {worker.worker_id} polling {args.broker}, writing to {store_path}", file=sys.stderr)
+    try:
+        worker.run(drain=args.drain)
+    except KeyboardInterrupt:
+        worker.stop()
+    finally:
+        result_store.close()
+        broker.close()
+        if parse_pool is not None:
+            parse_pool.shutdown()
+        if args.metrics_file:
+            metrics.write_prometheus_file(args.metrics_file)
+
+    print(f"Analyzed {worker.stats['done'] + worker.stats['failed']} URLs "
+          f"({worker.stats['failed']} errors, {worker.stats['retried']} retries queued)", file=sys.stderr)
+    return 0
+
+
+def status(args) -> int:
+    broker = open_broker(args.broker)
+    try:
+        print(serialization.dumps_str(broker.stats(args.job_id)))
+    finally:
+        broker.close()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run onion analysis as distributed workers")
+    parser.add_argument('--broker', default=os.getenv('BROKER_URL', 'sqlite:///data/broker.db'),
+                        help="Broker URL (default: BROKER_URL or sqlite:///data/broker.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit_parser = commands.add_parser('submit', help="Queue URLs as a new job and print its id")
+    submit_parser.add_argument('inputs', nargs='*', default=['-'],
+                               help="Files with one URL per line ('-' or nothing for stdin)")
+    submit_parser.add_argument('--no-deep', action='store_true', help="Skip deep OSINT analysis")
+    submit_parser.add_argument('--no-metadata', action='store_true', help="Skip metadata extraction")
+    submit_parser.add_argument('--no-cross-reference', action='store_true', help="Skip database cross-referencing")
+    submit_parser.add_argument('--no-validate', action='store_true',
+                               help="Queue URLs even if they are not onion URLs")
+    submit_parser.set_defaults(handler=submit)
+
+    work_parser = commands.add_parser('work', help="Lease and analyze tasks until stopped")
+    work_parser.add_argument('-t', '--threads', type=int, default=int(os.getenv('ANALYSIS_WORKERS', '4')),
+                             help="Concurrent URLs on this worker (default: ANALYSIS_WORKERS or 4)")
+    work_parser.add_argument('--result-store', default=os.getenv('RESULT_STORE_PATH'), metavar='DB',
+                             help="SQLite result store shared by all workers (default: RESULT_STORE_PATH, "
+                                  "else results.db beside a SQLite or file broker; required with Redis)")
+    work_parser.add_argument('--content-store', default=os.getenv('CONTENT_STORE_PATH'), metavar='DIR',
+                             help="Move page bodies into a content store")
+    work_parser.add_argument('--worker-id', help="Name used for leases (default: host:pid)")
+    work_parser.add_argument('--lease-seconds', type=float, default=300.0,
+                             help="How long a silent worker keeps a task before it is redelivered")
+    work_parser.add_argument('--max-attempts', type=int, default=3,
+                             help="Deliveries of a URL before it is recorded as an error")
+    work_parser.add_argument('--parse-processes', type=int, metavar='N',
+                             help="Parse pages in N worker processes (default: PARSE_PROCESSES, 0 = in-thread)")
+    work_parser.add_argument('--metrics-file', metavar='PATH',
+                             help="Write per-stage latency, error and byte metrics here (Prometheus text) at exit")
+    work_parser.add_argument('--drain', action='store_true', help="Exit once the queue is empty")
+    work_parser.set_defaults(handler=work)
+
+    status_parser = commands.add_parser('status', help="Print task counts per state")
+    status_parser.add_argument('job_id', nargs='?', help="Only count this job's tasks")
+    status_parser.set_defaults(handler=status)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())